@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Bookkeeping benchmark - per-reminder commits vs batched bulk writes for one dispatch tick
+Usage: python benchmarks/bench_bookkeeping.py [--due N] [--chunks 1,100,1000]
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from seed import use_temp_database, seed_database
+
+use_temp_database("bookkeeping")
+
+from sqlalchemy import text  # noqa: E402
+from models import init_db, engine, SessionLocal, ReminderLog  # noqa: E402
+from reminder_service import ReminderService  # noqa: E402
+
+
+def legacy_mark_reminder_sent(db, reminder):
+    """The original per-reminder write path: ORM update, log insert, commit"""
+    now = datetime.now()
+    reminder.last_sent_at = now
+    if reminder.is_recurring:
+        reminder.next_send_at = now + timedelta(minutes=reminder.interval_minutes)
+    db.add(ReminderLog(
+        user_id=reminder.user_id,
+        reminder_id=reminder.id,
+        action="sent",
+        reminder_title=reminder.title
+    ))
+    db.commit()
+
+
+def reset_due_set():
+    """Make every active reminder due again and drop the logs from the previous run"""
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE reminders SET next_send_at = :past WHERE is_active"),
+                     {"past": datetime.now() - timedelta(minutes=1)})
+        conn.execute(text("DELETE FROM reminder_logs WHERE action = 'sent'"))
+
+
+def run(label: str, record, commits_for) -> dict:
+    reset_due_set()
+    db = SessionLocal()
+    try:
+        due = ReminderService.get_due_reminders(db)
+        started = time.perf_counter()
+        record(db, due)
+        elapsed = time.perf_counter() - started
+        remaining = len(ReminderService.get_due_reminders(db))
+    finally:
+        db.close()
+
+    commits = commits_for(len(due))
+    result = {
+        "label": label,
+        "due": len(due),
+        "seconds": elapsed,
+        "commits": commits,
+        "commits_per_sec": commits / elapsed if elapsed else 0.0,
+        "reminders_per_sec": len(due) / elapsed if elapsed else 0.0,
+        "left_due": remaining
+    }
+    print(f"  {label:28s} {elapsed:8.3f}s  {commits:6d} commits  "
+          f"{result['commits_per_sec']:9.1f} commits/s  {result['reminders_per_sec']:10.1f} reminders/s  {remaining} still due")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--due", type=int, default=1000, help="active reminders in the tick")
+    parser.add_argument("--chunks", default="1,100,1000,0", help="batch sizes to try (0 = whole tick)")
+    args = parser.parse_args()
+
+    init_db()
+    # One active reminder per user, all due
+    seed_database(engine, users=args.due, reminders_per_user=1, logs_per_user=0, due_fraction=1.0)
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE reminders SET is_active = 1"))
+
+    print(f"\n=== Recording {args.due} successful sends ===")
+    run("legacy (commit per reminder)",
+        lambda db, due: [legacy_mark_reminder_sent(db, r) for r in due],
+        lambda n: n)
+
+    for chunk in (int(c) for c in args.chunks.split(",")):
+        size = chunk or args.due
+        run(f"batched (chunk={chunk or 'tick'})",
+            lambda db, due, size=size: ReminderService.mark_reminders_sent(db, due, chunk_size=size),
+            lambda n, size=size: -(-n // size))
+
+
+if __name__ == "__main__":
+    main()
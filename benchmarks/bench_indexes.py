@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Index benchmark - query plans and latencies for the hot queries, before and after migrations
+Usage: python benchmarks/bench_indexes.py [--users N] [--reminders-per-user N] [--logs-per-user N]
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime
+
+from seed import use_temp_database, seed_database, percentile
+
+use_temp_database("indexes")
+
+from sqlalchemy import text  # noqa: E402
+from models import Base, engine, SessionLocal, User, Reminder, ReminderLog  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+from reminder_service import ReminderService  # noqa: E402
+
+INDEX_NAMES = [
+    "ix_reminders_active_next_send",
+    "ix_reminders_user_active_last_sent",
+    "ix_reminder_logs_user_action_time",
+    "ix_reminder_logs_user_time",
+    "ix_reminder_logs_time",
+    "ix_reminder_logs_reminder",
+]
+
+
+def hot_queries(db, user_id: int) -> dict:
+    """The queries ReminderService and the CLI issue, keyed by access path"""
+    now = datetime.now()
+    return {
+        "due scan": db.query(Reminder).filter(
+            Reminder.is_active,
+            Reminder.next_send_at <= now
+        ),
+        "active by user": db.query(Reminder).filter(
+            Reminder.user_id == user_id,
+            Reminder.is_active
+        ),
+        "done lookup": db.query(Reminder).filter(
+            Reminder.user_id == user_id,
+            Reminder.is_active,
+            Reminder.last_sent_at.is_not(None)
+        ).order_by(Reminder.last_sent_at.desc()).limit(1),
+        "stats completions": db.query(ReminderLog).filter(
+            ReminderLog.user_id == user_id,
+            ReminderLog.action == "completed"
+        ).order_by(ReminderLog.timestamp.desc()).limit(100),
+        "stats recent": db.query(ReminderLog).filter(
+            ReminderLog.user_id == user_id
+        ).order_by(ReminderLog.timestamp.desc()).limit(5),
+        "recent logs (cli)": db.query(ReminderLog).order_by(
+            ReminderLog.timestamp.desc()
+        ).limit(20),
+    }
+
+
+def query_plan(db, query) -> str:
+    compiled = query.statement.compile(dialect=engine.dialect)
+    params = [compiled.params[name] for name in compiled.positiontup]
+    params = [str(p) if not isinstance(p, (int, float, str, type(None))) else p for p in params]
+    rows = db.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled), tuple(params)).fetchall()
+    return "; ".join(row[-1] for row in rows)
+
+
+def measure(label: str, users: int, runs: int) -> dict:
+    print(f"\n=== {label} ===")
+    db = SessionLocal()
+    results = {}
+    try:
+        rng = random.Random(7)
+        names = list(hot_queries(db, 1).keys())
+        for name in names:
+            print(f"  {name:20s} plan: {query_plan(db, hot_queries(db, 1)[name])}")
+
+        for name in names:
+            samples = []
+            for _ in range(runs):
+                query = hot_queries(db, rng.randint(1, users))[name]
+                started = time.perf_counter()
+                query.all()
+                samples.append((time.perf_counter() - started) * 1000)
+                db.expunge_all()
+            results[name] = samples
+
+        samples = []
+        for _ in range(runs):
+            user = db.get(User, rng.randint(1, users))
+            started = time.perf_counter()
+            ReminderService.get_stats(db, user)
+            samples.append((time.perf_counter() - started) * 1000)
+            db.expunge_all()
+        results["get_stats()"] = samples
+    finally:
+        db.close()
+
+    for name, samples in results.items():
+        print(f"  {name:20s} p50 {percentile(samples, 50):8.3f} ms   p99 {percentile(samples, 99):8.3f} ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--reminders-per-user", type=int, default=4)
+    parser.add_argument("--logs-per-user", type=int, default=200)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    # Start from the pre-migration schema: tables only, none of the new indexes
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for name in INDEX_NAMES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+    print(f"🌱 Seeding {args.users} users, {args.users * args.reminders_per_user} reminders, "
+          f"{args.users * args.logs_per_user} logs...")
+    seed_database(engine, args.users, args.reminders_per_user, args.logs_per_user)
+
+    before = measure("Before migrations", args.users, args.runs)
+    run_migrations(engine)
+    after = measure("After migrations", args.users, args.runs)
+
+    print("\n=== p50 speedup ===")
+    for name in before:
+        old, new = percentile(before[name], 50), percentile(after[name], 50)
+        print(f"  {name:20s} {old:8.3f} ms -> {new:8.3f} ms  ({old / new if new else float('inf'):6.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Outbox benchmark - scheduler ticks against a failing messaging API, sending inline vs queueing in the outbox
+Reports how long each tick blocks and how many requests the failing API receives over several ticks
+Usage: python benchmarks/bench_outbox.py [--due N] [--ticks N] [--latency SECONDS] [--error-rate F]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import time
+from datetime import datetime, timedelta
+
+from seed import use_temp_database, seed_database
+from fake_apis import FakeTwilioServer
+
+use_temp_database("outbox")
+os.environ.update({
+    "MESSAGING_PLATFORM": "twilio",
+    "TWILIO_ACCOUNT_SID": "AC00000000000000000000000000000000",
+    "TWILIO_AUTH_TOKEN": "benchmark",
+    "TWILIO_PHONE_NUMBER": "+15550000000",
+    "TWILIO_RATE_LIMIT": "0",
+    "TWILIO_RECIPIENT_RATE_LIMIT": "0",
+})
+
+from sqlalchemy import text  # noqa: E402
+
+
+def reset(engine):
+    """Make every active reminder due again and empty the outbox"""
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE reminders SET next_send_at = :past, claimed_by = NULL WHERE is_active"),
+                     {"past": datetime.now() - timedelta(minutes=1)})
+        conn.execute(text("DELETE FROM outbox"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--due", type=int, default=500, help="due reminders per tick")
+    parser.add_argument("--ticks", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.2, help="fake API latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=1.0, help="fraction of sends that fail")
+    args = parser.parse_args()
+
+    with FakeTwilioServer(latency=args.latency, error_rate=args.error_rate) as fake:
+        os.environ["TWILIO_API_BASE_URL"] = fake.base_url
+
+        import outbox
+        import scheduler
+        from models import init_db, engine, SessionLocal
+
+        init_db()
+        # Every active reminder due (seed_database leaves ~30% inactive)
+        seed_database(engine, users=int(args.due / 0.7), reminders_per_user=1, logs_per_user=0,
+                      due_fraction=1.0, platform="twilio")
+
+        print(f"\n=== {args.ticks} ticks, fake Twilio {args.latency * 1000:.0f} ms latency, "
+              f"{args.error_rate:.0%} errors ===")
+        for mode in ("inline", "outbox"):
+            reset(engine)
+            scheduler.OUTBOX_ENABLED = mode == "outbox"
+            before = fake.stats()["requests"]
+            tick_seconds = []
+            drain_seconds = 0.0
+            for _ in range(args.ticks):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    started = time.perf_counter()
+                    scheduler.send_due_reminders()
+                    tick_seconds.append(time.perf_counter() - started)
+                    if mode == "outbox":
+                        # What the sender thread does in the background
+                        started = time.perf_counter()
+                        db = SessionLocal()
+                        try:
+                            outbox.drain(db, scheduler.dispatch_engine)
+                        finally:
+                            db.close()
+                        drain_seconds += time.perf_counter() - started
+
+            requests = fake.stats()["requests"] - before
+            line = (f"  {mode:7s} tick {sum(tick_seconds) / len(tick_seconds) * 1000:8.1f} ms avg, "
+                    f"{requests:6d} API requests")
+            if mode == "outbox":
+                db = SessionLocal()
+                try:
+                    queued = outbox.outbox_stats(db)
+                finally:
+                    db.close()
+                line += f" (sender busy {drain_seconds:.2f}s; {queued['pending']} pending, {queued['dead']} dead)"
+            print(line)
+        scheduler.dispatch_engine.stop()
+
+
+if __name__ == "__main__":
+    main()
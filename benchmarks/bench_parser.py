@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Parser benchmark - parses/sec over a realistic mixed corpus, plus a conformance check
+Verifies ReminderService.parse_command returns exactly what the original parser did
+Usage: python benchmarks/bench_parser.py [--messages N]
+"""
+
+import argparse
+import random
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from seed import REPO_ROOT  # noqa: F401 - puts the repo on sys.path
+from reminder_service import ReminderService, _classify_command
+
+
+# The original parser, kept verbatim as the reference implementation
+
+def legacy_parse_command(message: str):
+    message = message.strip().lower()
+
+    if message == "done":
+        return ("done", {})
+
+    if message in ["stats", "show stats", "my stats"]:
+        return ("stats", {})
+
+    if "list" in message and "reminder" in message:
+        return ("list", {})
+
+    if "cancel" in message:
+        if "all" in message:
+            return ("cancel_all", {})
+        match = re.search(r"cancel\s+(.+?)\s+reminder", message)
+        if match:
+            keyword = match.group(1).strip()
+            return ("cancel", {"keyword": keyword})
+        return ("cancel_all", {})
+
+    recurring_match = re.search(
+        r"remind\s+me\s+to\s+(.+?)\s+every\s+(\d+)\s+(hour|minute|min|hr)",
+        message
+    )
+    if recurring_match:
+        title = recurring_match.group(1).strip()
+        interval = int(recurring_match.group(2))
+        unit = recurring_match.group(3)
+        if unit in ["hour", "hr"]:
+            interval_minutes = interval * 60
+        else:
+            interval_minutes = interval
+        return ("remind_recurring", {
+            "title": title,
+            "interval_minutes": interval_minutes
+        })
+
+    time_match = re.search(r"remind\s+me\s+to\s+(.+?)\s+at\s+(.+)", message)
+    if time_match:
+        title = time_match.group(1).strip()
+        time_str = time_match.group(2).strip()
+        scheduled_time = legacy_parse_time(time_str)
+        return ("remind_once", {
+            "title": title,
+            "scheduled_time": scheduled_time
+        })
+
+    return ("unknown", {})
+
+
+def legacy_parse_time(time_str: str) -> Optional[datetime]:
+    time_str = time_str.lower().strip()
+    match = re.search(r"(\d+)(?::(\d+))?\s*(am|pm)?", time_str)
+    if match:
+        hour = int(match.group(1))
+        minute = int(match.group(2)) if match.group(2) else 0
+        period = match.group(3)
+        if period == "pm" and hour != 12:
+            hour += 12
+        elif period == "am" and hour == 12:
+            hour = 0
+        now = datetime.now()
+        scheduled = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if scheduled < now:
+            scheduled += timedelta(days=1)
+        return scheduled
+    return None
+
+
+# Corpus
+
+TASKS = ["drink water", "take my pills", "stretch", "call mom", "walk the dog", "look at 5 emails",
+         "check the oven", "cancel gym", "list groceries", "water the plants every day"]
+EDGE_CASES = [
+    "", "   ", "DONE", " done ", "Done!", "stats", "Show Stats", "my stats", "stats please",
+    "list reminders", "LIST my reminders", "list", "reminder list", "please list all reminders",
+    "cancel all reminders", "cancel water reminders", "cancel", "cancel the thing", "cancel   gym  reminders",
+    "Cancel ALL", "cancel small reminders", "remind me to drink water every 2 hours",
+    "remind me to drink water every 90 minutes", "remind me to stretch every 1 hr",
+    "remind me to walk every 15 min", "remind  me  to  walk  every  3  hours",
+    "remind me to call mom at 6pm", "remind me to call mom at 6:30pm", "remind me to call mom at 18:00",
+    "remind me to call mom at 12am", "remind me to call mom at 12pm", "remind me to call mom at noon",
+    "remind me to look at 5 every 2 hours", "remind me to eat at 7 every 3 hours",
+    "remind me to pay rent at 9am tomorrow", "remind me to drink water", "remind me every 2 hours",
+    "hello", "what can you do?", "remind me to cancel at 5pm", "remind me to list at 5pm",
+]
+
+
+def build_corpus(size: int, seed: int = 3) -> list:
+    """Mixed traffic: replies dominate, then reminder creation and management"""
+    rng = random.Random(seed)
+    generators = [
+        (40, lambda: rng.choice(["done", "Done", "done ", "DONE"])),
+        (10, lambda: rng.choice(["stats", "my stats", "show stats"])),
+        (8, lambda: rng.choice(["list reminders", "list my reminders", "List Reminders"])),
+        (7, lambda: rng.choice(["cancel all reminders", f"cancel {rng.choice(['water', 'gym', 'pills'])} reminders"])),
+        (20, lambda: f"remind me to {rng.choice(TASKS)} every {rng.randint(1, 12)} "
+                     f"{rng.choice(['hours', 'hour', 'minutes', 'min', 'hr'])}"),
+        (10, lambda: f"remind me to {rng.choice(TASKS)} at {rng.randint(1, 12)}"
+                     f"{rng.choice(['', ':15', ':30', ':45'])}{rng.choice(['am', 'pm', ''])}"),
+        (5, lambda: rng.choice(["hello", "thanks!", "what can you do?", "help", "ok"])),
+    ]
+    weights = [w for w, _ in generators]
+    return [rng.choices(generators, weights)[0][1]() for _ in range(size)] + EDGE_CASES
+
+
+def check_conformance(corpus: list) -> int:
+    mismatches = 0
+    for message in corpus:
+        expected = legacy_parse_command(message)
+        actual = ReminderService.parse_command(message)
+        if expected != actual:
+            mismatches += 1
+            if mismatches <= 10:
+                print(f"❌ {message!r}: expected {expected}, got {actual}")
+    return mismatches
+
+
+def parses_per_sec(parse, corpus: list, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for message in corpus:
+            parse(message)
+    return rounds * len(corpus) / (time.perf_counter() - started)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.messages)
+    mismatches = check_conformance(corpus)
+    print(f"{'✅' if not mismatches else '❌'} Conformance: {len(corpus) - mismatches}/{len(corpus)} "
+          f"messages parsed identically")
+
+    legacy = parses_per_sec(legacy_parse_command, corpus, args.rounds)
+    _classify_command.cache_clear()
+    cold = parses_per_sec(ReminderService.parse_command, corpus, 1)
+    warm = parses_per_sec(ReminderService.parse_command, corpus, args.rounds)
+
+    print(f"\n=== {len(corpus)} messages x {args.rounds} rounds ===")
+    print(f"  legacy parser        {legacy:12.0f} parses/s")
+    print(f"  compiled (cold)      {cold:12.0f} parses/s  ({cold / legacy:4.1f}x)")
+    print(f"  compiled (warm)      {warm:12.0f} parses/s  ({warm / legacy:4.1f}x)")
+    print(f"  cache: {_classify_command.cache_info()}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
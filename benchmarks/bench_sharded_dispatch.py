@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Sharded dispatch benchmark - tick throughput as dispatch worker processes are added
+Every tick claims, formats, sends (to a fake Twilio API in its own process) and records the due set
+Usage: python benchmarks/bench_sharded_dispatch.py [--reminders N] [--workers 0,1,2,4] [--latency SECONDS]
+"""
+
+import argparse
+import os
+import time
+
+from seed import seed_database, use_temp_database
+from fake_apis import FakeApiProcess, FakeTwilioServer
+
+# Spawned workers and the fake API process re-import this module, so the
+# environment is only set up in main() and inherited from there
+BENCH_ENV = {
+    "MESSAGING_PLATFORM": "twilio",
+    "TWILIO_ACCOUNT_SID": "AC00000000000000000000000000000000",
+    "TWILIO_AUTH_TOKEN": "benchmark",
+    "TWILIO_PHONE_NUMBER": "+15550000000",
+    # Measure dispatch, not the rate limiter
+    "TWILIO_RATE_LIMIT": "0",
+    "TWILIO_RECIPIENT_RATE_LIMIT": "0",
+    "SQLITE_PROFILE": "fast",
+    # Time delivery inside the tick - with the outbox on, an in-process tick only queues
+    "OUTBOX_ENABLED": "false",
+}
+
+
+def reseed(engine, reminders: int):
+    from models import Base
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    # Every active reminder due
+    seed_database(engine, users=reminders // 2, reminders_per_user=2, logs_per_user=0, due_fraction=1.0,
+                  platform="twilio")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--reminders", type=int, default=4000)
+    parser.add_argument("--workers", default="0,1,2,4", help="0 = dispatch in the scheduler process")
+    parser.add_argument("--latency", type=float, default=0.005, help="fake API latency in seconds")
+    parser.add_argument("--sms-threads", type=int, default=32, help="Twilio send threads per process")
+    args = parser.parse_args()
+    use_temp_database("sharded")
+    os.environ.update(BENCH_ENV)
+
+    with FakeApiProcess(FakeTwilioServer, latency=args.latency) as fake:
+        os.environ["TWILIO_API_BASE_URL"] = fake.base_url
+        os.environ["TWILIO_MAX_WORKERS"] = str(args.sms_threads)
+
+        # Worker output (one line per batch) goes to /dev/null; results go to the real stdout
+        stdout = os.dup(1)
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 1)
+
+        def report(line: str):
+            os.write(stdout, (line + "\n").encode())
+
+        import scheduler
+        from dispatch_pool import ShardedDispatcher
+        from models import engine
+
+        report(f"\n=== {args.reminders} due reminders, fake Twilio latency {args.latency * 1000:.0f} ms, "
+               f"{os.cpu_count()} CPUs ===")
+        baseline = None
+        for workers in (int(w) for w in args.workers.split(",")):
+            reseed(engine, 0)
+            if workers:
+                scheduler.sharded_dispatcher = ShardedDispatcher(workers)
+                # Warm-up tick: spawn the workers and import everything before timing
+                scheduler.sharded_dispatcher.dispatch()
+            else:
+                scheduler.sharded_dispatcher = None
+            reseed(engine, args.reminders)
+            scheduler.last_tick_stats = None
+
+            started = time.perf_counter()
+            due = scheduler.send_due_reminders()
+            elapsed = time.perf_counter() - started
+            sent = scheduler.last_tick_stats.sent if scheduler.last_tick_stats else 0
+            rate = sent / elapsed
+            baseline = baseline or rate or 1.0
+
+            label = f"{workers} worker process(es)" if workers else "in-process"
+            report(f"  {label:24s} {elapsed:7.2f}s  {sent:6d}/{len(due)} sent  {rate:8.1f} reminders/s  "
+                   f"({rate / baseline:4.2f}x)")
+            if scheduler.sharded_dispatcher:
+                scheduler.sharded_dispatcher.stop()
+        scheduler.dispatch_engine.stop()
+        os.dup2(stdout, 1)
+
+    print(f"\n  fake API: {fake.final_stats}")
+
+
+if __name__ == "__main__":
+    main()
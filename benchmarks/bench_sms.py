@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+SMS throughput benchmark - Twilio sends against a local fake API, offline
+Compares the old blocking send path with the thread pool at several sizes
+Usage: python benchmarks/bench_sms.py [--messages N] [--latency SECONDS] [--workers 1,4,8,16]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import time
+
+from seed import REPO_ROOT  # noqa: F401 - puts the repo on sys.path
+from fake_apis import FakeTwilioServer
+
+os.environ.update({
+    "MESSAGING_PLATFORM": "twilio",
+    "TWILIO_ACCOUNT_SID": "AC00000000000000000000000000000000",
+    "TWILIO_AUTH_TOKEN": "benchmark",
+    "TWILIO_PHONE_NUMBER": "+15550000000",
+    # Measure the transport, not the rate limiter
+    "TWILIO_RATE_LIMIT": "0",
+    "TWILIO_RECIPIENT_RATE_LIMIT": "0",
+})
+
+
+async def heartbeat(stop: asyncio.Event, gaps: list, interval: float = 0.01):
+    """Measure how long the event loop is stalled between 10ms ticks"""
+    last = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(interval)
+        now = time.perf_counter()
+        gaps.append(now - last - interval)
+        last = now
+
+
+async def run(service, messages: int, concurrency: int, blocking: bool) -> dict:
+    stop = asyncio.Event()
+    gaps = []
+    beat = asyncio.create_task(heartbeat(stop, gaps))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(i):
+        async with semaphore:
+            if blocking:
+                # The previous code path: synchronous Twilio call on the loop
+                return service.backend("twilio")._send_sms(f"+1555{i:07d}", "⏰ Reminder: drink water")
+            return await service.send_message("twilio", f"+1555{i:07d}", "⏰ Reminder: drink water")
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = await asyncio.gather(*(send(i) for i in range(messages)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await beat
+    return {
+        "seconds": elapsed,
+        "sent": sum(1 for r in results if r),
+        "msgs_per_sec": messages / elapsed,
+        "max_loop_stall_ms": max(gaps or [0]) * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake API latency in seconds")
+    parser.add_argument("--workers", default="1,4,8,16,32")
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    with FakeTwilioServer(latency=args.latency) as fake:
+        os.environ["TWILIO_API_BASE_URL"] = fake.base_url
+        import messaging_service
+        messaging_service.TWILIO_API_BASE_URL = fake.base_url
+
+        print(f"\n=== {args.messages} SMS, fake Twilio latency {args.latency * 1000:.0f} ms ===")
+        service = messaging_service.MessagingService()
+        result = asyncio.run(run(service, args.messages, args.concurrency, blocking=True))
+        print(f"  {'blocking (old path)':22s} {result['seconds']:7.2f}s  {result['msgs_per_sec']:8.1f} msg/s  "
+              f"loop stall {result['max_loop_stall_ms']:8.1f} ms")
+
+        for workers in (int(w) for w in args.workers.split(",")):
+            messaging_service.TWILIO_MAX_WORKERS = workers
+            service = messaging_service.MessagingService()
+            result = asyncio.run(run(service, args.messages, args.concurrency, blocking=False))
+            service.close()
+            print(f"  {f'thread pool ({workers})':22s} {result['seconds']:7.2f}s  {result['msgs_per_sec']:8.1f} msg/s  "
+                  f"loop stall {result['max_loop_stall_ms']:8.1f} ms")
+
+        print(f"\n  fake API: {fake.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+SQLite contention benchmark - concurrent webhook writes against dispatch ticks, per storage profile
+Reports webhook throughput/latency, tick throughput and "database is locked" errors for each profile
+Usage: python benchmarks/bench_sqlite_contention.py [--profiles legacy,balanced,durable,fast] [--seconds N]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from seed import REPO_ROOT, percentile, seed_database, use_temp_database  # noqa: F401 - puts the repo on sys.path
+
+use_temp_database("contention")
+
+from sqlalchemy import update  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from models import Base, Reminder  # noqa: E402
+from reminder_service import ReminderService, user_cache  # noqa: E402
+from storage import SQLITE_PROFILES, create_db_engine, describe_sqlite  # noqa: E402
+
+MESSAGES = [
+    (50, "remind me to drink water every 2 hours"),
+    (30, "done"),
+    (20, "stats"),
+]
+
+
+class Counters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ops = 0
+        self.lock_errors = 0
+        self.other_errors = 0
+        self.latencies = []
+
+    def record(self, seconds: float):
+        with self.lock:
+            self.ops += 1
+            self.latencies.append(seconds)
+
+    def error(self, exc: Exception):
+        with self.lock:
+            if isinstance(exc, OperationalError) and "locked" in str(exc):
+                self.lock_errors += 1
+            else:
+                self.other_errors += 1
+
+
+def webhook_writer(Session, users: int, deadline: float, counters: Counters, seed: int):
+    """One concurrent webhook request after another: resolve the user, then act on the command"""
+    rng = random.Random(seed)
+    weights = [w for w, _ in MESSAGES]
+    while time.perf_counter() < deadline:
+        message = rng.choices(MESSAGES, weights)[0][1]
+        platform_id = str(100000 + rng.randint(1, users))
+        started = time.perf_counter()
+        db = Session()
+        try:
+            user = ReminderService.get_or_create_user(db, "telegram", platform_id)
+            command_type, params = ReminderService.parse_command(message)
+            if command_type == "remind_recurring":
+                ReminderService.create_recurring_reminder(db, user, params["title"], params["interval_minutes"])
+            elif command_type == "done":
+                ReminderService.mark_reminder_done(db, user)
+            else:
+                ReminderService.get_stats(db, user)
+            counters.record(time.perf_counter() - started)
+        except Exception as e:
+            db.rollback()
+            counters.error(e)
+        finally:
+            db.close()
+
+
+def dispatch_ticker(Session, deadline: float, stats: dict, rearm: int):
+    """Back-to-back scheduler ticks: scan due reminders, record them as sent, re-arm a batch"""
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        db = Session()
+        try:
+            due = ReminderService.get_due_reminders(db)
+            with contextlib.redirect_stdout(io.StringIO()) as errors:
+                recorded = ReminderService.mark_reminders_sent(db, due, chunk_size=1000)
+            stats["sent"] += recorded
+            stats["failed"] += len(due) - recorded
+            stats["lock_errors"] += errors.getvalue().count("locked")
+
+            # Make the next tick's batch due again, like a busy production minute
+            subquery = db.query(Reminder.id).filter(Reminder.is_active).order_by(
+                Reminder.next_send_at
+            ).limit(rearm).scalar_subquery()
+            db.execute(
+                update(Reminder).where(Reminder.id.in_(subquery)).values(
+                    next_send_at=datetime.now() - timedelta(seconds=1)
+                )
+            )
+            db.commit()
+            stats["ticks"] += 1
+            stats["tick_seconds"].append(time.perf_counter() - started)
+        except OperationalError as e:
+            db.rollback()
+            stats["lock_errors" if "locked" in str(e) else "other_errors"] += 1
+        finally:
+            db.close()
+
+
+def run_profile(profile: str, args) -> dict:
+    path = os.path.join(tempfile.mkdtemp(prefix="hydrabot-bench-"), f"{profile}.db")
+    engine = create_db_engine(f"sqlite:///{path}", profile, pool_size=args.writers + 2)
+    Base.metadata.create_all(bind=engine)
+    seed_database(engine, users=args.users, reminders_per_user=4, logs_per_user=20, due_fraction=0.2)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    # User ids are per database file
+    user_cache.clear()
+
+    counters = Counters()
+    tick_stats = {"ticks": 0, "sent": 0, "failed": 0, "lock_errors": 0, "other_errors": 0, "tick_seconds": []}
+    deadline = time.perf_counter() + args.seconds
+    threads = [threading.Thread(target=dispatch_ticker, args=(Session, deadline, tick_stats, args.rearm))]
+    threads += [
+        threading.Thread(target=webhook_writer, args=(Session, args.users, deadline, counters, i))
+        for i in range(args.writers)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    pragmas = describe_sqlite(engine)
+    engine.dispose()
+    return {
+        "profile": profile,
+        "pragmas": pragmas,
+        "webhook_ops_per_sec": counters.ops / elapsed,
+        "webhook_p50_ms": percentile(counters.latencies, 50) * 1000,
+        "webhook_p99_ms": percentile(counters.latencies, 99) * 1000,
+        "webhook_lock_errors": counters.lock_errors,
+        "webhook_other_errors": counters.other_errors,
+        "ticks": tick_stats["ticks"],
+        "tick_sent_per_sec": tick_stats["sent"] / elapsed,
+        "tick_p50_ms": percentile(tick_stats["tick_seconds"], 50) * 1000,
+        "tick_lock_errors": tick_stats["lock_errors"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--profiles", default=",".join(SQLITE_PROFILES))
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--writers", type=int, default=8, help="concurrent webhook threads")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--rearm", type=int, default=500, help="reminders made due again after each tick")
+    args = parser.parse_args()
+
+    print(f"\n=== {args.writers} webhook writers + 1 dispatch ticker, {args.seconds:.0f}s per profile ===")
+    print(f"  {'profile':10s} {'webhook/s':>10s} {'p50 ms':>8s} {'p99 ms':>8s} {'locked':>7s} "
+          f"{'ticks':>6s} {'sent/s':>8s} {'tick ms':>8s} {'locked':>7s}")
+    for profile in args.profiles.split(","):
+        result = run_profile(profile, args)
+        print(f"  {profile:10s} {result['webhook_ops_per_sec']:10.1f} {result['webhook_p50_ms']:8.1f} "
+              f"{result['webhook_p99_ms']:8.1f} {result['webhook_lock_errors']:7d} "
+              f"{result['ticks']:6d} {result['tick_sent_per_sec']:8.1f} {result['tick_p50_ms']:8.1f} "
+              f"{result['tick_lock_errors']:7d}")
+        if result["webhook_other_errors"]:
+            print(f"    ({result['webhook_other_errors']} other webhook errors)")
+    print("\n  'locked' = operations that failed with 'database is locked' after the busy timeout")
+
+
+if __name__ == "__main__":
+    main()
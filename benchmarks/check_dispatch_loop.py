@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Dispatch loop guard - fails if a tick re-claims reminders it already handled
+Overdue one-time reminders filling whole claim batches must each be sent once per tick,
+with and without the outbox; a slow batch keeps its claim, a lost claim is never recorded,
+a reminder whose message is still undelivered isn't queued again, and an inactive one isn't sent
+Usage: python benchmarks/check_dispatch_loop.py
+"""
+
+import contextlib
+import io
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from seed import use_temp_database
+
+use_temp_database("dispatchloop")
+os.environ.update({
+    "REMINDER_CLAIM_BATCH": "5",
+    "MESSAGING_BACKENDS": "recording",
+    "TELEGRAM_RATE_LIMIT": "0",
+    "TELEGRAM_CHAT_RATE_LIMIT": "0",
+})
+
+from models import Base, OutboxMessage, Reminder, User, engine, SessionLocal  # noqa: E402
+from leases import LeaseKeeper  # noqa: E402
+import outbox  # noqa: E402
+from reminder_service import ReminderService  # noqa: E402
+import scheduler  # noqa: E402
+
+# Whole claim batches, so the loop only ends by noticing it has nothing new
+ONE_TIME_REMINDERS = 10
+TIMEOUT_SECONDS = 10
+
+
+def reseed():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    overdue = datetime.now() - timedelta(minutes=5)
+    db = SessionLocal()
+    try:
+        user = User(platform="telegram", platform_id="1001")
+        db.add(user)
+        db.flush()
+        db.add_all(
+            Reminder(user_id=user.id, title=f"one-time {i}", is_recurring=False,
+                     scheduled_time=overdue, next_send_at=overdue)
+            for i in range(ONE_TIME_REMINDERS)
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def run_tick():
+    """dispatch_due on a thread, so a runaway loop fails the check instead of hanging it"""
+    result = {}
+
+    def target():
+        db = SessionLocal()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                result["stats"] = scheduler.dispatch_due(db)
+        finally:
+            db.close()
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(TIMEOUT_SECONDS)
+    if thread.is_alive():
+        raise AssertionError(f"dispatch_due still running after {TIMEOUT_SECONDS}s")
+    return result["stats"]
+
+
+def delivered(outbox: bool) -> int:
+    """Messages produced so far: outbox rows, or sends the recording backend saw"""
+    if outbox:
+        db = SessionLocal()
+        try:
+            return db.query(OutboxMessage).count()
+        finally:
+            db.close()
+    return scheduler.messaging_service.backend("telegram").sent
+
+
+def check(outbox: bool):
+    scheduler.OUTBOX_ENABLED = outbox
+    reseed()
+    before = delivered(outbox)
+
+    stats = run_tick()
+    first = delivered(outbox) - before
+    assert stats.due == ONE_TIME_REMINDERS, f"tick handled {stats.due} reminders, expected {ONE_TIME_REMINDERS}"
+    assert first == ONE_TIME_REMINDERS, f"tick produced {first} messages, expected {ONE_TIME_REMINDERS}"
+
+    # Another dispatcher right behind this one must find nothing to resend
+    stats = run_tick()
+    again = delivered(outbox) - before - first
+    assert stats.due == 0 and again == 0, f"second tick re-sent {again} just-sent reminders"
+
+
+def check_outage():
+    """Re-firing a reminder while its last message is still backing off adds no second message"""
+    scheduler.OUTBOX_ENABLED = True
+    reseed()
+    run_tick()
+    db = SessionLocal()
+    try:
+        # The platform is down: every message is waiting out a retry, and the reminders come due again
+        db.query(OutboxMessage).update({"attempts": 1, "next_attempt_at": datetime.now() + timedelta(hours=1)})
+        db.query(Reminder).update({"next_send_at": datetime.now() - timedelta(seconds=1)})
+        db.commit()
+    finally:
+        db.close()
+
+    stats = run_tick()
+    db = SessionLocal()
+    try:
+        rows = db.query(OutboxMessage).count()
+        claimed = db.query(Reminder).filter(Reminder.claimed_by.is_not(None)).count()
+    finally:
+        db.close()
+    assert rows == ONE_TIME_REMINDERS, f"{rows} outbox rows for {ONE_TIME_REMINDERS} reminders"
+    assert stats.sent == 0 and claimed == 0, f"tick queued {stats.sent}, left {claimed} claimed"
+
+
+def check_inactive():
+    """Cancelling a reminder drops its queued message; the sender drops messages of reminders deactivated otherwise"""
+    scheduler.OUTBOX_ENABLED = True
+    reseed()
+    run_tick()
+    db = SessionLocal()
+    try:
+        user = db.query(User).one()
+        with contextlib.redirect_stdout(io.StringIO()):
+            ReminderService.cancel_reminders(db, user, "one-time 1")
+        left = db.query(OutboxMessage).count()
+        assert left == ONE_TIME_REMINDERS - 1, f"{left} outbox rows left after cancelling 1 of {ONE_TIME_REMINDERS}"
+
+        db.query(Reminder).update({"is_active": False})
+        db.commit()
+        with contextlib.redirect_stdout(io.StringIO()):
+            _, messages = outbox.claim_batch(db)
+        left = db.query(OutboxMessage).count()
+        assert not messages and left == 0, f"sender claimed {len(messages)} message(s) of inactive reminders"
+    finally:
+        db.close()
+
+
+def check_lease_renewed():
+    """A batch still sending after its lease would have run out can't be claimed by anyone else"""
+    reseed()
+    db = SessionLocal()
+    try:
+        token, claimed = ReminderService.claim_due_reminders(db, lease_seconds=1)
+        with LeaseKeeper(engine, Reminder, token, 1, interval=0.2):
+            time.sleep(2)
+            _, other = ReminderService.claim_due_reminders(db, worker_id="other")
+        stolen = {reminder.id for reminder in claimed} & {reminder.id for reminder in other}
+        assert not stolen, f"another worker claimed {len(stolen)} reminder(s) mid-send"
+    finally:
+        db.close()
+
+
+def check_lost_claim():
+    """Reminders reclaimed by another worker after the lease ran out aren't recorded by the old claimant"""
+    reseed()
+    db = SessionLocal()
+    try:
+        token, claimed = ReminderService.claim_due_reminders(db, lease_seconds=1)
+        time.sleep(1.1)
+        ReminderService.claim_due_reminders(db, worker_id="other")
+        with contextlib.redirect_stdout(io.StringIO()):
+            recorded = ReminderService.mark_reminders_sent(db, claimed, token=token)
+        assert recorded == 0, f"old claimant recorded {recorded} reminder(s) it no longer held"
+    finally:
+        db.close()
+
+
+def check_outbox_lost_claim():
+    """Outbox rows reclaimed by another sender aren't deleted or rescheduled by the old claimant"""
+    reseed()
+    db = SessionLocal()
+    try:
+        db.execute(OutboxMessage.__table__.insert(),
+                   [outbox.outbox_row("reply", "telegram", "1001", f"reply {i}") for i in range(3)])
+        db.commit()
+        token, messages = outbox.claim_batch(db)
+        db.query(OutboxMessage).update({"claim_expires_at": datetime.now() - timedelta(seconds=1)})
+        db.commit()
+        outbox.claim_batch(db)
+        with contextlib.redirect_stdout(io.StringIO()):
+            recorded = outbox.record_results(db, token, messages, {m.id: True for m in messages})
+        left = db.query(OutboxMessage).count()
+        assert recorded == (0, 0, 0) and left == 3, f"old claimant recorded {recorded}, {left}/3 rows left"
+    finally:
+        db.close()
+
+
+def main() -> int:
+    checks = {
+        "outbox": lambda: check(outbox=True),
+        "direct send": lambda: check(outbox=False),
+        "outage": check_outage,
+        "inactive": check_inactive,
+        "lease renewed": check_lease_renewed,
+        "lost claim": check_lost_claim,
+        "outbox lost claim": check_outbox_lost_claim,
+    }
+    failures = 0
+    for label, run in checks.items():
+        try:
+            run()
+            print(f"✅ {label}")
+        except AssertionError as e:
+            print(f"❌ {label}: {e}")
+            failures += 1
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
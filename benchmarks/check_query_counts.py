@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+N+1 guard - fails if the scheduler or CLI listings issue more queries as rows are added
+Usage: python benchmarks/check_query_counts.py
+"""
+
+import contextlib
+import io
+import sys
+
+from seed import use_temp_database, seed_database
+
+use_temp_database("querycount")
+
+from models import Base, engine, SessionLocal  # noqa: E402
+from querycount import assert_constant_query_count  # noqa: E402
+from reminder_service import ReminderService  # noqa: E402
+from scheduler import build_outbound  # noqa: E402
+import cli  # noqa: E402
+
+SIZES = (5, 50, 200)
+
+
+def reseed(users: int):
+    """Recreate the schema and fill it with `users` users and their rows"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    seed_database(engine, users=users, reminders_per_user=2, logs_per_user=3, due_fraction=1.0)
+
+
+def scheduler_tick():
+    db = SessionLocal()
+    try:
+        build_outbound(ReminderService.get_due_reminders(db))
+    finally:
+        db.close()
+
+
+def scheduler_claim():
+    db = SessionLocal()
+    try:
+        token, claimed = ReminderService.claim_due_reminders(db)
+        build_outbound(claimed)
+    finally:
+        db.close()
+
+
+def quiet(func, *args):
+    """Call a CLI command with its output suppressed"""
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            func(*args)
+    return run
+
+
+CODE_PATHS = {
+    "scheduler due tick": scheduler_tick,
+    "scheduler claim": scheduler_claim,
+    "cli users": quiet(cli.list_users, []),
+    "cli reminders": quiet(cli.list_reminders, []),
+    "cli logs": quiet(cli.show_logs, ["--limit", "10000"]),
+}
+
+
+def main() -> int:
+    failures = 0
+    for label, run in CODE_PATHS.items():
+        try:
+            counts = assert_constant_query_count(run, reseed, SIZES, engine, label)
+            print(f"✅ {label:20s} {counts}")
+        except AssertionError as e:
+            print(f"❌ {e}")
+            failures += 1
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
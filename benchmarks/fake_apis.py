@@ -0,0 +1,227 @@
+"""
+Local stand-ins for the messaging APIs used by the benchmarks
+Threaded HTTP servers with configurable latency and error rates
+"""
+
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    # The default listen backlog of 5 refuses connections when a dispatch
+    # tick opens dozens at once
+    request_queue_size = 256
+    daemon_threads = True
+
+
+class FakeApiServer:
+    """
+    Base class: runs a ThreadingHTTPServer on a free local port in a daemon thread
+
+    latency:     seconds added to every response
+    error_rate:  fraction of requests answered with a 500
+    throttle_rate: fraction of requests answered with a 429 + Retry-After
+    """
+
+    def __init__(self, latency: float = 0.05, error_rate: float = 0.0, throttle_rate: float = 0.0,
+                 retry_after: int = 1, seed: int = 1):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.delivered = 0
+        self.errors = 0
+        self.throttled = 0
+        self.messages = []
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeApiServer":
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                status, payload, headers = server.handle(self.path, self.headers, body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = _HTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def outcome(self) -> str:
+        """Decide this request's fate: 'ok', 'error' or 'throttle'"""
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.requests += 1
+            roll = self.rng.random()
+            if roll < self.throttle_rate:
+                self.throttled += 1
+                return "throttle"
+            if roll < self.throttle_rate + self.error_rate:
+                self.errors += 1
+                return "error"
+            self.delivered += 1
+            return "ok"
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "delivered": self.delivered,
+                "errors": self.errors,
+                "throttled": self.throttled
+            }
+
+    def handle(self, path: str, headers, body: bytes):
+        raise NotImplementedError
+
+
+class FakeTwilioServer(FakeApiServer):
+    """Accepts POST /2010-04-01/Accounts/{sid}/Messages.json like Twilio's REST API"""
+
+    def handle(self, path, headers, body):
+        if not path.endswith("/Messages.json"):
+            return 404, {"code": 20404, "message": "Not Found", "status": 404}, {}
+
+        outcome = self.outcome()
+        if outcome == "throttle":
+            return 429, {"code": 20429, "message": "Too Many Requests", "status": 429}, \
+                {"Retry-After": str(self.retry_after)}
+        if outcome == "error":
+            return 500, {"code": 20500, "message": "Internal Server Error", "status": 500}, {}
+
+        form = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+        with self.lock:
+            self.messages.append((form.get("To"), form.get("Body")))
+        account_sid = path.split("/")[3] if path.count("/") >= 4 else "AC0"
+        return 201, {
+            "sid": "SM" + uuid.uuid4().hex,
+            "account_sid": account_sid,
+            "to": form.get("To"),
+            "from": form.get("From"),
+            "body": form.get("Body"),
+            "status": "queued",
+            "num_segments": "1",
+            "direction": "outbound-api",
+            "api_version": "2010-04-01"
+        }, {}
+
+
+class FakeTelegramServer(FakeApiServer):
+    """Accepts POST /bot{token}/sendMessage (and getMe) like the Telegram Bot API"""
+
+    def handle(self, path, headers, body):
+        method = path.rsplit("/", 1)[-1].split("?")[0]
+        if method == "getMe":
+            return 200, {"ok": True, "result": self._bot_user()}, {}
+        if method != "sendMessage":
+            return 404, {"ok": False, "error_code": 404, "description": "Not Found"}, {}
+
+        outcome = self.outcome()
+        if outcome == "throttle":
+            return 429, {
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after}
+            }, {"Retry-After": str(self.retry_after)}
+        if outcome == "error":
+            return 500, {"ok": False, "error_code": 500, "description": "Internal Server Error"}, {}
+
+        if "json" in (headers.get("Content-Type") or ""):
+            params = json.loads(body or b"{}")
+        else:
+            params = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+        with self.lock:
+            self.messages.append((str(params.get("chat_id")), params.get("text")))
+            message_id = len(self.messages)
+        chat_id = int(params.get("chat_id") or 0)
+        return 200, {"ok": True, "result": {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": self._bot_user(),
+            "text": params.get("text")
+        }}, {}
+
+    @staticmethod
+    def _bot_user() -> dict:
+        return {"id": 1, "is_bot": True, "first_name": "HydraBot", "username": "hydrabot_fake_bot"}
+
+
+def _serve(server_cls, kwargs, urls, stop, results):
+    with server_cls(**kwargs) as server:
+        urls.put(server.base_url)
+        stop.wait()
+        results.put(server.stats())
+
+
+class FakeApiProcess:
+    """
+    Runs a fake API server in its own process, so its request handling
+    doesn't compete for the GIL with the code being measured
+    """
+
+    def __init__(self, server_cls, **kwargs):
+        import multiprocessing
+        context = multiprocessing.get_context("spawn")
+        self._urls = context.Queue()
+        self._results = context.Queue()
+        self._stop = context.Event()
+        self._process = context.Process(
+            target=_serve, args=(server_cls, kwargs, self._urls, self._stop, self._results), daemon=True
+        )
+        self.base_url = None
+        self.final_stats = None
+
+    def __enter__(self) -> "FakeApiProcess":
+        self._process.start()
+        self.base_url = self._urls.get(timeout=30)
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self.final_stats = self._results.get(timeout=30)
+        self._process.join(timeout=10)
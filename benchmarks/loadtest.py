@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test - the real app under uvicorn against local fake Telegram and Twilio APIs
+Seeds users and reminders, drives both webhooks at a fixed arrival rate, then times a dispatch tick
+Reports webhook p50/p99, dispatch messages/sec and database time; --json keeps the report for comparing commits
+Usage: python benchmarks/loadtest.py [--users N] [--reminders M] [--rate R] [--seconds S] [--due K] [--json PATH]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from seed import REPO_ROOT, percentile, seed_database, use_temp_database
+from fake_apis import FakeApiProcess, FakeTelegramServer, FakeTwilioServer
+
+# (weight, message) for the webhook mix
+MESSAGES = [
+    (40, "remind me to drink water every 2 hours"),
+    (25, "list reminders"),
+    (20, "done"),
+    (10, "stats"),
+    (5, "cancel water reminders"),
+]
+
+RATE_LIMIT_VARS = ("TELEGRAM_RATE_LIMIT", "TELEGRAM_CHAT_RATE_LIMIT", "TWILIO_RATE_LIMIT", "TWILIO_RECIPIENT_RATE_LIMIT")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                               text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def summarize(latencies: list, errors: int, seconds: float) -> dict:
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "throughput_per_sec": round(len(latencies) / seconds, 1) if seconds else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2) if latencies else 0.0
+    }
+
+
+def start_app(port: int, log_path: str) -> subprocess.Popen:
+    """Run main:app under uvicorn with the scheduler off - dispatch is timed separately"""
+    env = dict(os.environ, RUN_SCHEDULER="false")
+    log = open(log_path, "w")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    log.close()
+    return process
+
+
+async def wait_until_up(base_url: str, timeout: float = 30.0):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(base_url + "/")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"App did not start within {timeout:.0f}s")
+
+
+async def drive_webhooks(base_url: str, args) -> dict:
+    """Open-loop load: requests start on schedule whether or not earlier ones have finished"""
+    import httpx
+
+    rng = random.Random(args.seed)
+    weights = [w for w, _ in MESSAGES]
+    results = {"telegram": ([], [0]), "twilio": ([], [0])}
+    total = int(args.rate * args.seconds)
+
+    async def fire(client, i: int):
+        message = rng.choices(MESSAGES, weights)[0][1]
+        user = rng.randint(1, args.users)
+        if rng.random() < args.telegram_share:
+            endpoint = "telegram"
+            request = client.post("/webhook/telegram", json={
+                "update_id": 10_000_000 + i,
+                "message": {"chat": {"id": 100000 + user}, "text": message}
+            })
+        else:
+            endpoint = "twilio"
+            request = client.post("/webhook/twilio", data={"From": f"+1555{user:07d}", "Body": message})
+
+        latencies, errors = results[endpoint]
+        started = time.perf_counter()
+        try:
+            response = await request
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors[0] += 1
+        except httpx.HTTPError:
+            errors[0] += 1
+
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30.0) as client:
+        started = time.perf_counter()
+        tasks = []
+        for i in range(total):
+            delay = started + i / args.rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(fire(client, i)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+        # Telegram commands run after the webhook acknowledges them; wait for the backlog
+        drain_started = time.perf_counter()
+        inbound = {}
+        while time.perf_counter() - drain_started < 120:
+            inbound = (await client.get("/")).json().get("inbound", {})
+            if not inbound.get("pending"):
+                break
+            await asyncio.sleep(0.1)
+        drain_seconds = time.perf_counter() - drain_started
+
+    report = {name: summarize(lat, err[0], elapsed) for name, (lat, err) in results.items()}
+    report["offered_rate_per_sec"] = args.rate
+    report["elapsed_seconds"] = round(elapsed, 2)
+    report["inbound_drain_seconds"] = round(drain_seconds, 2)
+    report["inbound"] = inbound
+    return report
+
+
+def run_dispatch(args) -> dict:
+    """Make --due reminders due and time one tick plus the outbox delivering it"""
+    from sqlalchemy import event, text
+    import outbox
+    import scheduler
+    from models import SessionLocal, engine
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            "UPDATE reminders SET next_send_at = :past, claimed_by = NULL WHERE id IN "
+            "(SELECT id FROM reminders WHERE is_active ORDER BY id LIMIT :due)"
+        ), {"past": datetime.now() - timedelta(seconds=30), "due": args.due})
+
+    db_time = [0.0]
+    statements = [0]
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        context._loadtest_started = time.perf_counter()
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        db_time[0] += time.perf_counter() - context._loadtest_started
+        statements[0] += 1
+
+    event.listen(engine, "before_cursor_execute", before)
+    event.listen(engine, "after_cursor_execute", after)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            due = scheduler.send_due_reminders()
+            tick_seconds = time.perf_counter() - started
+            tick = scheduler.last_tick_stats
+            delivered = tick.sent if tick and not outbox.OUTBOX_ENABLED else 0
+            if outbox.OUTBOX_ENABLED:
+                db = SessionLocal()
+                try:
+                    delivered = outbox.drain(db, scheduler.dispatch_engine).sent
+                finally:
+                    db.close()
+            total_seconds = time.perf_counter() - started
+    finally:
+        event.remove(engine, "before_cursor_execute", before)
+        event.remove(engine, "after_cursor_execute", after)
+        scheduler.dispatch_engine.stop()
+
+    return {
+        "due": len(due),
+        "delivered": delivered,
+        "outbox": outbox.OUTBOX_ENABLED,
+        "tick_seconds": round(tick_seconds, 3),
+        "total_seconds": round(total_seconds, 3),
+        "messages_per_sec": round(delivered / total_seconds, 1) if total_seconds else 0.0,
+        "db_seconds": round(db_time[0], 3),
+        "db_statements": statements[0]
+    }
+
+
+def print_report(report: dict):
+    web = report["webhooks"]
+    args = report["args"]
+    transport = (f"{args['backend']} backend" if args["backend"] else
+                 f"fake API {args['latency'] * 1000:.0f} ms / {args['error_rate']:.0%} errors")
+    print(f"\n=== HydraBot load test @ {report['commit']} ({args['users']} users, "
+          f"{args['platform']} outbound, {transport}) ===")
+    print(f"\n  Webhooks: {web['offered_rate_per_sec']} req/s offered for {web['elapsed_seconds']}s")
+    print(f"  {'endpoint':10s} {'requests':>9s} {'errors':>7s} {'req/s':>8s} {'p50 ms':>8s} {'p99 ms':>8s} {'max ms':>8s}")
+    for name in ("telegram", "twilio"):
+        r = web[name]
+        print(f"  {name:10s} {r['requests']:9d} {r['errors']:7d} {r['throughput_per_sec']:8.1f} "
+              f"{r['p50_ms']:8.1f} {r['p99_ms']:8.1f} {r['max_ms']:8.1f}")
+    inbound = web["inbound"]
+    print(f"  Telegram backlog drained {web['inbound_drain_seconds']}s after the last request "
+          f"(max queue wait {inbound.get('max_wait_seconds', 0):.2f}s, {inbound.get('failed', 0)} failed)")
+
+    d = report["dispatch"]
+    print(f"\n  Dispatch: {d['due']} due -> {d['delivered']} delivered in {d['total_seconds']}s "
+          f"({d['messages_per_sec']} msg/s; tick {d['tick_seconds']}s"
+          f"{', then outbox' if d['outbox'] else ''})")
+    print(f"  Database: {d['db_seconds']}s in {d['db_statements']} statements "
+          f"({d['db_seconds'] / d['total_seconds'] * 100 if d['total_seconds'] else 0:.0f}% of dispatch)")
+    print(f"\n  Fake APIs: telegram {report['fake_apis']['telegram']}")
+    print(f"             twilio   {report['fake_apis']['twilio']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--reminders", type=int, default=6000, help="seeded reminders (~70%% active)")
+    parser.add_argument("--logs-per-user", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=50, help="webhook requests per second")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--telegram-share", type=float, default=0.5, help="fraction of webhooks that are Telegram")
+    parser.add_argument("--connections", type=int, default=100, help="client connection limit")
+    parser.add_argument("--due", type=int, default=2000, help="reminders made due for the dispatch tick")
+    parser.add_argument("--platform", choices=("telegram", "twilio"), default="telegram",
+                        help="MESSAGING_PLATFORM: where replies and reminders go")
+    parser.add_argument("--backend", default="",
+                        help="MESSAGING_BACKENDS, e.g. null to take the network out (default: the fake APIs)")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake API latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fake API 500 rate")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fake API 429 rate")
+    parser.add_argument("--keep-rate-limits", action="store_true", help="don't lift the outbound rate limits")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    use_temp_database("loadtest")
+    os.environ.update({
+        "MESSAGING_PLATFORM": args.platform,
+        "TELEGRAM_BOT_TOKEN": "123456:loadtest",
+        "TWILIO_ACCOUNT_SID": "AC00000000000000000000000000000000",
+        "TWILIO_AUTH_TOKEN": "loadtest",
+        "TWILIO_PHONE_NUMBER": "+15550000000",
+        "MESSAGING_BACKENDS": args.backend,
+    })
+    if not args.keep_rate_limits:
+        os.environ.update({name: "0" for name in RATE_LIMIT_VARS})
+
+    fake_kwargs = {"latency": args.latency, "error_rate": args.error_rate, "throttle_rate": args.throttle_rate}
+    with FakeApiProcess(FakeTelegramServer, **fake_kwargs) as telegram, \
+            FakeApiProcess(FakeTwilioServer, **fake_kwargs) as twilio:
+        os.environ["TELEGRAM_API_BASE_URL"] = telegram.base_url
+        os.environ["TWILIO_API_BASE_URL"] = twilio.base_url
+
+        from models import engine, init_db
+        with contextlib.redirect_stdout(io.StringIO()):
+            init_db()
+        seed_database(engine, users=args.users, reminders_per_user=max(args.reminders // args.users, 1),
+                      logs_per_user=args.logs_per_user, due_fraction=0.0, platform=args.platform)
+
+        port = free_port()
+        log_path = os.path.join(tempfile.mkdtemp(prefix="hydrabot-loadtest-"), "app.log")
+        app = start_app(port, log_path)
+        print(f"🚀 App on port {port} (log: {log_path}); driving webhooks for {args.seconds:.0f}s...")
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            asyncio.run(wait_until_up(base_url))
+            webhooks = asyncio.run(drive_webhooks(base_url, args))
+        finally:
+            app.terminate()
+            app.wait(timeout=30)
+
+        print(f"📬 Dispatching {args.due} due reminders...")
+        dispatch = run_dispatch(args)
+
+    report = {
+        "commit": git_commit(),
+        "at": datetime.now().isoformat(timespec="seconds"),
+        "args": vars(args),
+        "webhooks": webhooks,
+        "dispatch": dispatch,
+        "fake_apis": {"telegram": telegram.final_stats, "twilio": twilio.final_stats}
+    }
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n  Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
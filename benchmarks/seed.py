@@ -0,0 +1,107 @@
+"""
+Shared helpers for the benchmark scripts
+Creates throwaway databases and seeds them with users, reminders and logs using bulk inserts
+"""
+
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+LOG_ACTIONS = ["sent"] * 14 + ["completed"] * 4 + ["created", "cancelled"]
+
+
+def use_temp_database(name: str = "bench") -> str:
+    """
+    Point DATABASE_URL at a fresh SQLite file in a temp directory
+    Must be called before models is imported
+    """
+    path = os.path.join(tempfile.mkdtemp(prefix="hydrabot-bench-"), f"{name}.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:benchmark-token")
+    return path
+
+
+def seed_database(engine, users: int = 1000, reminders_per_user: int = 3, logs_per_user: int = 50,
+                  due_fraction: float = 0.1, platform: str = "telegram", seed: int = 42,
+                  chunk_size: int = 10000):
+    """
+    Bulk-insert a realistic dataset
+
+    Roughly due_fraction of the active reminders are already due; logs are
+    spread over the last 90 days with 'sent' dominating like production.
+    """
+    from models import User, Reminder, ReminderLog
+
+    rng = random.Random(seed)
+    now = datetime.now()
+
+    def flush(conn, table, rows):
+        if rows:
+            conn.execute(table.insert(), rows)
+            rows.clear()
+
+    with engine.begin() as conn:
+        rows = []
+        for user_id in range(1, users + 1):
+            rows.append({
+                "id": user_id,
+                "platform": platform,
+                "platform_id": str(100000 + user_id),
+                "created_at": now - timedelta(days=rng.randint(0, 365))
+            })
+            if len(rows) >= chunk_size:
+                flush(conn, User.__table__, rows)
+        flush(conn, User.__table__, rows)
+
+        reminder_id = 0
+        for user_id in range(1, users + 1):
+            for _ in range(reminders_per_user):
+                reminder_id += 1
+                is_active = rng.random() < 0.7
+                is_due = is_active and rng.random() < due_fraction
+                interval = rng.choice([15, 30, 60, 120, 240])
+                next_send = now - timedelta(seconds=rng.randint(1, 600)) if is_due \
+                    else now + timedelta(minutes=rng.randint(1, interval))
+                rows.append({
+                    "id": reminder_id,
+                    "user_id": user_id,
+                    "title": rng.choice(["drink water", "take pills", "stretch", "walk", "call mom"]),
+                    "interval_minutes": interval,
+                    "is_recurring": True,
+                    "is_active": is_active,
+                    "last_sent_at": now - timedelta(minutes=rng.randint(1, 10000)),
+                    "next_send_at": next_send,
+                    "created_at": now - timedelta(days=rng.randint(0, 180))
+                })
+                if len(rows) >= chunk_size:
+                    flush(conn, Reminder.__table__, rows)
+        flush(conn, Reminder.__table__, rows)
+
+        for user_id in range(1, users + 1):
+            first_reminder = (user_id - 1) * reminders_per_user + 1
+            for _ in range(logs_per_user):
+                rows.append({
+                    "user_id": user_id,
+                    "reminder_id": first_reminder + rng.randrange(reminders_per_user) if reminders_per_user else None,
+                    "action": rng.choice(LOG_ACTIONS),
+                    "reminder_title": "drink water",
+                    "timestamp": now - timedelta(minutes=rng.randint(0, 90 * 24 * 60))
+                })
+                if len(rows) >= chunk_size:
+                    flush(conn, ReminderLog.__table__, rows)
+        flush(conn, ReminderLog.__table__, rows)
+
+
+def percentile(samples, pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
@@ -14,7 +14,8 @@ load_dotenv()
 # Add current directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from models import init_db, SessionLocal, User, Reminder, ReminderLog  # noqa: E402
+from sqlalchemy import func  # noqa: E402
+from models import init_db, SessionLocal, User, Reminder, ReminderLog, ReminderLogRollup  # noqa: E402
 
 
 def show_help():
@@ -23,21 +24,34 @@ def show_help():
 HydraBot CLI - Management Tool
 
 Usage:
-  python cli.py [command]
+  python cli.py [command] [options]
 
 Commands:
-  init          Initialize database
-  stats         Show overall stats
-  users         List all users
-  reminders     List all active reminders
-  logs          Show recent logs
-  clean         Clean up inactive reminders
-  help          Show this help message
+  init            Initialize database
+  migrate         Apply pending schema migrations
+  backfill-stats  Rebuild per-user stats from reminders and logs
+  stats           Show overall stats
+  users           List users
+  reminders       List reminders (active by default)
+  logs            Show recent logs
+  clean           Clean up inactive reminders
+  dispatch        Run the reminder dispatcher without the web app
+  retention       Roll up and archive old logs (see: retention --help)
+  outbox          Show the outbound message queue (--requeue-dead to retry dead letters)
+  help            Show this help message
 
 Examples:
   python cli.py init
   python cli.py stats
   python cli.py users
+  python cli.py reminders --status all --platform telegram --format csv > reminders.csv
+  python cli.py logs --action sent --since 2025-01-01 --limit 0 --format jsonl | gzip > logs.jsonl.gz
+  python cli.py retention --days 30 --archive table --dry-run
+  python cli.py clean --older-than 30 --batch-size 500 --archive --yes
+
+Listing options (users, reminders, logs):
+  --format table|csv|jsonl  --limit N  --platform telegram|twilio
+  --since DATE  --until DATE  (plus --status/--user for reminders, --action/--user for logs)
 """)
 
 
@@ -48,6 +62,34 @@ def initialize_database():
     print("✅ Database initialized successfully!")
 
 
+def migrate_database():
+    """Apply pending schema migrations to an existing database"""
+    from migrations import get_schema_version, run_migrations
+    from models import Base, engine
+    
+    before = get_schema_version(engine)
+    Base.metadata.create_all(bind=engine)
+    applied = run_migrations(engine)
+    after = get_schema_version(engine)
+    if applied:
+        print(f"✅ Schema upgraded from version {before} to {after}")
+    else:
+        print(f"✅ Schema already up to date (version {after})")
+
+
+def backfill_user_stats():
+    """Rebuild the per-user stats table from reminders and reminder logs"""
+    from reminder_service import ReminderService
+    
+    print("📊 Rebuilding user stats...")
+    db = SessionLocal()
+    try:
+        rows = ReminderService.rebuild_user_stats(db)
+        print(f"✅ Rebuilt stats for {rows} user(s)")
+    finally:
+        db.close()
+
+
 def show_stats():
     """Show overall statistics"""
     db = SessionLocal()
@@ -59,6 +101,7 @@ def show_stats():
         completed_count = db.query(ReminderLog).filter(
             ReminderLog.action == "completed"
         ).count()
+        rolled_up_count = db.query(func.coalesce(func.sum(ReminderLogRollup.count), 0)).scalar()
         
         print("\n📊 HydraBot Statistics")
         print("=" * 50)
@@ -67,120 +110,335 @@ def show_stats():
         print(f"📝 Total Reminders Ever:  {total_reminders}")
         print(f"✅ Completed Actions:     {completed_count}")
         print(f"📜 Total Log Entries:     {log_count}")
+        print(f"🗜️  Rolled-up Log Entries: {rolled_up_count}")
         print("=" * 50)
         
     finally:
         db.close()
 
 
-def list_users():
-    """List all users"""
+# Rows fetched per round trip by the streaming listings
+LISTING_CHUNK_SIZE = int(os.getenv("CLI_LISTING_CHUNK_SIZE", "1000"))
+
+
+def _listing_parser(prog, description, limit=None):
+    """Argument parser with the options shared by the listing commands"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(prog=f"cli.py {prog}", description=description)
+    parser.add_argument("--format", choices=("table", "csv", "jsonl"), default="table",
+                        help="output format (default: table)")
+    parser.add_argument("--limit", type=int, default=limit,
+                        help=f"maximum rows to print, 0 for no limit (default: {limit or 'no limit'})")
+    parser.add_argument("--platform", choices=("telegram", "twilio"), help="only this platform")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="on or after this date (YYYY-MM-DD[ HH:MM])")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="before this date (YYYY-MM-DD[ HH:MM])")
+    return parser
+
+
+def _stream(query, args, time_column):
+    """Apply the shared filters and stream rows in chunks instead of loading them all"""
+    if args.platform:
+        query = query.filter(User.platform == args.platform)
+    if args.since:
+        query = query.filter(time_column >= args.since)
+    if args.until:
+        query = query.filter(time_column < args.until)
+    if args.limit:
+        query = query.limit(args.limit)
+    # yield_per also turns on server-side cursors where the driver has them
+    return (row._asdict() for row in query.yield_per(LISTING_CHUNK_SIZE))
+
+
+def _json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def _write_rows(rows, fmt, columns, title, width, format_line):
+    """
+    Write rows (dicts) to stdout as they arrive, one at a time
+    
+    Returns:
+        number of rows written
+    """
+    import csv
+    import json
+    
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(sys.stdout, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    elif fmt == "jsonl":
+        for row in rows:
+            sys.stdout.write(json.dumps({column: row[column] for column in columns}, default=_json_default) + "\n")
+            count += 1
+    else:
+        print(f"\n{title}")
+        print("=" * width)
+        for row in rows:
+            print(format_line(row))
+            count += 1
+        print("=" * width)
+        print(f"{count} shown")
+    return count
+
+
+def list_users(argv=None):
+    """List users"""
+    parser = _listing_parser("users", "List users")
+    args = parser.parse_args(sys.argv[2:] if argv is None else argv)
+    
     db = SessionLocal()
     try:
-        users = db.query(User).all()
+        # Count active reminders per user in the same query instead of
+        # loading every user's reminders collection
+        active_counts = db.query(
+            Reminder.user_id,
+            func.count(Reminder.id).label("active")
+        ).filter(Reminder.is_active).group_by(Reminder.user_id).subquery()
         
-        print(f"\n👥 Users ({len(users)} total)")
-        print("=" * 80)
+        query = db.query(
+            User.id,
+            User.platform,
+            User.platform_id,
+            func.coalesce(active_counts.c.active, 0).label("active_reminders"),
+            User.created_at
+        ).outerjoin(active_counts, active_counts.c.user_id == User.id).order_by(User.id)
         
-        for user in users:
-            active_reminders = len([r for r in user.reminders if r.is_active])
-            print(f"ID: {user.id:3d} | Platform: {user.platform:8s} | "
-                  f"Platform ID: {user.platform_id:20s} | "
-                  f"Active: {active_reminders:2d} | "
-                  f"Created: {user.created_at.strftime('%Y-%m-%d')}")
-        
-        print("=" * 80)
+        _write_rows(
+            _stream(query, args, User.created_at),
+            args.format,
+            ["id", "platform", "platform_id", "active_reminders", "created_at"],
+            "👥 Users",
+            80,
+            lambda user: (f"ID: {user['id']:3d} | Platform: {user['platform']:8s} | "
+                          f"Platform ID: {user['platform_id']:20s} | "
+                          f"Active: {user['active_reminders']:2d} | "
+                          f"Created: {user['created_at'].strftime('%Y-%m-%d')}")
+        )
         
     finally:
         db.close()
 
 
-def list_reminders():
-    """List all active reminders"""
+def _format_reminder_line(reminder):
+    interval_str = ""
+    if reminder["is_recurring"]:
+        hours = reminder["interval_minutes"] // 60
+        minutes = reminder["interval_minutes"] % 60
+        interval_str = f"{hours}h {minutes}m" if hours > 0 else f"{minutes}m"
+    else:
+        interval_str = reminder["scheduled_time"].strftime("%I:%M %p") if reminder["scheduled_time"] else "N/A"
+    
+    next_send = reminder["next_send_at"].strftime("%m/%d %I:%M%p") if reminder["next_send_at"] else "N/A"
+    
+    return (f"ID: {reminder['id']:3d} | User: {reminder['platform_id']:15s} | "
+            f"Title: {reminder['title']:30s} | "
+            f"Interval: {interval_str:10s} | "
+            f"Next: {next_send}")
+
+
+def list_reminders(argv=None):
+    """List reminders (active ones by default)"""
+    parser = _listing_parser("reminders", "List reminders")
+    parser.add_argument("--status", choices=("active", "inactive", "all"), default="active",
+                        help="which reminders to list (default: active)")
+    parser.add_argument("--user", help="only this platform ID")
+    args = parser.parse_args(sys.argv[2:] if argv is None else argv)
+    
     db = SessionLocal()
     try:
-        reminders = db.query(Reminder).filter(Reminder.is_active).all()
-        
-        print(f"\n📋 Active Reminders ({len(reminders)} total)")
-        print("=" * 100)
+        query = db.query(
+            Reminder.id,
+            User.platform,
+            User.platform_id,
+            Reminder.title,
+            Reminder.is_recurring,
+            Reminder.interval_minutes,
+            Reminder.scheduled_time,
+            Reminder.is_active,
+            Reminder.last_sent_at,
+            Reminder.next_send_at,
+            Reminder.created_at
+        ).join(User, Reminder.user_id == User.id).order_by(Reminder.id)
         
-        for reminder in reminders:
-            user = reminder.user
-            interval_str = ""
-            if reminder.is_recurring:
-                hours = reminder.interval_minutes // 60
-                minutes = reminder.interval_minutes % 60
-                interval_str = f"{hours}h {minutes}m" if hours > 0 else f"{minutes}m"
-            else:
-                interval_str = reminder.scheduled_time.strftime("%I:%M %p") if reminder.scheduled_time else "N/A"
-            
-            next_send = reminder.next_send_at.strftime("%m/%d %I:%M%p") if reminder.next_send_at else "N/A"
-            
-            print(f"ID: {reminder.id:3d} | User: {user.platform_id:15s} | "
-                  f"Title: {reminder.title:30s} | "
-                  f"Interval: {interval_str:10s} | "
-                  f"Next: {next_send}")
+        if args.status != "all":
+            query = query.filter(Reminder.is_active.is_(args.status == "active"))
+        if args.user:
+            query = query.filter(User.platform_id == args.user)
         
-        print("=" * 100)
+        title = {"active": "Active Reminders", "inactive": "Inactive Reminders", "all": "Reminders"}[args.status]
+        _write_rows(
+            _stream(query, args, Reminder.created_at),
+            args.format,
+            ["id", "platform", "platform_id", "title", "is_recurring", "interval_minutes",
+             "scheduled_time", "is_active", "last_sent_at", "next_send_at", "created_at"],
+            f"📋 {title}",
+            100,
+            _format_reminder_line
+        )
         
     finally:
         db.close()
 
 
-def show_logs(limit=20):
+def show_logs(argv=None):
     """Show recent logs"""
+    parser = _listing_parser("logs", "Show recent logs, newest first", limit=20)
+    parser.add_argument("--action", help="only this action (sent, completed, created, cancelled)")
+    parser.add_argument("--user", help="only this platform ID")
+    args = parser.parse_args(sys.argv[2:] if argv is None else argv)
+    
     db = SessionLocal()
     try:
-        logs = db.query(ReminderLog).order_by(
+        query = db.query(
+            ReminderLog.id,
+            ReminderLog.timestamp,
+            User.platform,
+            User.platform_id,
+            ReminderLog.action,
+            ReminderLog.reminder_id,
+            ReminderLog.reminder_title,
+            ReminderLog.notes
+        ).join(User, ReminderLog.user_id == User.id).order_by(
             ReminderLog.timestamp.desc()
-        ).limit(limit).all()
-        
-        print(f"\n📜 Recent Logs (last {limit})")
-        print("=" * 100)
+        )
         
-        for log in logs:
-            user = log.user
-            time_str = log.timestamp.strftime("%m/%d %I:%M%p")
-            print(f"{time_str} | User: {user.platform_id:15s} | "
-                  f"Action: {log.action:10s} | "
-                  f"Reminder: {log.reminder_title or 'N/A':30s}")
+        if args.action:
+            query = query.filter(ReminderLog.action == args.action)
+        if args.user:
+            query = query.filter(User.platform_id == args.user)
         
-        print("=" * 100)
+        _write_rows(
+            _stream(query, args, ReminderLog.timestamp),
+            args.format,
+            ["id", "timestamp", "platform", "platform_id", "action", "reminder_id", "reminder_title", "notes"],
+            f"📜 Recent Logs (last {args.limit})" if args.limit else "📜 Logs",
+            100,
+            lambda log: (f"{log['timestamp'].strftime('%m/%d %I:%M%p')} | User: {log['platform_id']:15s} | "
+                         f"Action: {log['action']:10s} | "
+                         f"Reminder: {log['reminder_title'] or 'N/A':30s}")
+        )
         
     finally:
         db.close()
 
 
-def clean_inactive():
-    """Clean up old inactive reminders"""
-    db = SessionLocal()
-    try:
-        # Find inactive reminders older than 7 days
-        from datetime import timedelta
-        cutoff = datetime.now() - timedelta(days=7)
-        
-        old_reminders = db.query(Reminder).filter(
-            Reminder.is_active.is_(False),
-            Reminder.created_at < cutoff
-        ).all()
-        
-        count = len(old_reminders)
-        
-        if count == 0:
-            print("✅ No old inactive reminders to clean up")
+def clean_inactive(argv=None):
+    """Clean up old inactive reminders in short, chunked transactions"""
+    import argparse
+    from retention import CLEANUP_INACTIVE_DAYS, RETENTION_BATCH_SIZE, RETENTION_PAUSE_SECONDS, purge_inactive_reminders
+    
+    parser = argparse.ArgumentParser(prog="cli.py clean", description=clean_inactive.__doc__)
+    parser.add_argument("--older-than", type=int, default=CLEANUP_INACTIVE_DAYS, metavar="DAYS",
+                        help=f"only reminders created more than DAYS ago (default {CLEANUP_INACTIVE_DAYS})")
+    parser.add_argument("--batch-size", type=int, default=RETENTION_BATCH_SIZE,
+                        help=f"reminders per transaction (default {RETENTION_BATCH_SIZE})")
+    parser.add_argument("--archive", action="store_true",
+                        help="copy rows to reminders_archive/reminder_logs_archive before deleting")
+    parser.add_argument("--pause", type=float, default=RETENTION_PAUSE_SECONDS,
+                        help="seconds to wait between batches")
+    parser.add_argument("--dry-run", action="store_true", help="only count what would be removed")
+    parser.add_argument("--yes", "-y", action="store_true", help="don't ask for confirmation")
+    args = parser.parse_args(sys.argv[2:] if argv is None else argv)
+    
+    preview = purge_inactive_reminders(older_than_days=args.older_than, dry_run=True)
+    if preview.eligible == 0:
+        print("✅ No old inactive reminders to clean up")
+        return
+    
+    print(f"🧹 Found {preview}")
+    if args.dry_run:
+        return
+    
+    if not args.yes:
+        if not sys.stdin.isatty():
+            print("❌ Not a terminal - pass --yes to clean up without confirmation")
             return
-        
-        print(f"🧹 Found {count} old inactive reminders")
-        confirm = input("Delete them? (yes/no): ")
-        
-        if confirm.lower() == "yes":
-            for reminder in old_reminders:
-                db.delete(reminder)
-            db.commit()
-            print(f"✅ Deleted {count} old reminders")
-        else:
+        confirm = input(f"{'Archive' if args.archive else 'Delete'} them? (yes/no): ")
+        if confirm.lower() != "yes":
             print("❌ Cancelled")
-        
+            return
+    
+    def report(result):
+        print(f"   … {result.reminders}/{result.eligible} reminders, "
+              f"{result.rows_per_second:.0f} rows/s", flush=True)
+    
+    result = purge_inactive_reminders(
+        older_than_days=args.older_than,
+        batch_size=args.batch_size,
+        archive=args.archive,
+        pause=args.pause,
+        progress=report
+    )
+    print(f"✅ {result}")
+
+
+def run_dispatcher():
+    """Run the reminder dispatcher in the foreground until interrupted"""
+    from scheduler import run_dispatcher as run
+    run()
+
+
+def run_retention(argv=None):
+    """Roll up and archive old sent/created/cancelled logs"""
+    import argparse
+    from retention import (ARCHIVE_MODES, RETENTION_BATCH_SIZE, RETENTION_DAYS,
+                           RETENTION_PAUSE_SECONDS, apply_retention)
+    
+    parser = argparse.ArgumentParser(prog="cli.py retention", description=run_retention.__doc__)
+    parser.add_argument("--days", type=int, default=RETENTION_DAYS,
+                        help=f"keep logs newer than this raw (default {RETENTION_DAYS})")
+    parser.add_argument("--batch-size", type=int, default=RETENTION_BATCH_SIZE,
+                        help=f"rows per transaction (default {RETENTION_BATCH_SIZE})")
+    parser.add_argument("--archive", choices=ARCHIVE_MODES, default="table",
+                        help="where raw rows go (default: reminder_logs_archive table)")
+    parser.add_argument("--archive-file", help="JSON lines file for --archive file")
+    parser.add_argument("--pause", type=float, default=RETENTION_PAUSE_SECONDS,
+                        help="seconds to wait between batches")
+    parser.add_argument("--max-batches", type=int, help="stop after this many batches")
+    parser.add_argument("--dry-run", action="store_true", help="only count what would be rolled up")
+    args = parser.parse_args(sys.argv[2:] if argv is None else argv)
+    
+    if args.archive == "file" and not args.archive_file:
+        parser.error("--archive file needs --archive-file PATH")
+    
+    print(f"🗜️  Rolling up logs older than {args.days} days...")
+    result = apply_retention(
+        older_than_days=args.days,
+        batch_size=args.batch_size,
+        archive=args.archive,
+        archive_path=args.archive_file,
+        pause=args.pause,
+        max_batches=args.max_batches,
+        dry_run=args.dry_run
+    )
+    print(f"✅ {result}")
+
+
+def show_outbox(argv=None):
+    """Show outbox queue depth, optionally requeueing dead-lettered messages"""
+    import argparse
+    from outbox import outbox_stats, requeue_dead
+    
+    parser = argparse.ArgumentParser(prog="cli.py outbox", description=show_outbox.__doc__)
+    parser.add_argument("--requeue-dead", action="store_true", help="give dead letters a fresh set of attempts")
+    args = parser.parse_args(sys.argv[2:] if argv is None else argv)
+    
+    db = SessionLocal()
+    try:
+        if args.requeue_dead:
+            print(f"🔁 Requeued {requeue_dead(db)} dead-lettered message(s)")
+        stats = outbox_stats(db)
+        print("\n📤 Outbox")
+        print("=" * 50)
+        print(f"⏳ Pending:               {stats['pending']}")
+        print(f"☠️  Dead-lettered:         {stats['dead']}")
+        print(f"🕰️  Oldest due for:        {stats['oldest_due_seconds']:.0f}s")
+        print("=" * 50)
     finally:
         db.close()
 
@@ -195,17 +453,25 @@ def main():
     
     commands = {
         "init": initialize_database,
+        "migrate": migrate_database,
+        "backfill-stats": backfill_user_stats,
         "stats": show_stats,
         "users": list_users,
         "reminders": list_reminders,
         "logs": show_logs,
         "clean": clean_inactive,
+        "dispatch": run_dispatcher,
+        "retention": run_retention,
+        "outbox": show_outbox,
         "help": show_help,
     }
     
     if command in commands:
         try:
             commands[command]()
+        except BrokenPipeError:
+            # Output was piped into something like head that stopped reading
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
         except Exception as e:
             print(f"❌ Error: {e}")
             import traceback
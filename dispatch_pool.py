@@ -0,0 +1,134 @@
+"""
+Dispatch Pool - Hash-partitioned dispatch across worker processes
+Each worker owns the reminders of users with user_id % shards == its shard, with its own session and MessagingService
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+from dotenv import load_dotenv
+
+from dispatcher import TickStats
+from metrics import absorb
+
+load_dotenv()
+
+# Worker processes for a sharded tick (0 keeps dispatch in the scheduler process)
+DISPATCH_SHARDS = int(os.getenv("DISPATCH_SHARDS", "0"))
+
+
+def _init_worker(shards: int):
+    """Runs once in each worker before anything creates a MessagingService"""
+    import rate_limiter
+
+    # Platform-wide limits are shared by every worker; per-recipient limits
+    # need no change because each user belongs to exactly one shard
+    for config in rate_limiter.PLATFORM_LIMITS.values():
+        config["global"] = config["global"] / shards
+
+
+def _with_metrics(stats: TickStats) -> TickStats:
+    """Attach what this worker recorded since its last task - only the parent serves /metrics"""
+    from metrics import DISPATCH_LAG, SEND_LATENCY, SENDS, export
+
+    stats.metrics = export(DISPATCH_LAG, SEND_LATENCY, SENDS)
+    return stats
+
+
+def _dispatch_shard(shard: int, shards: int) -> TickStats:
+    """Claim and send this shard's due reminders (runs in a worker process)"""
+    from models import SessionLocal
+    from outbox import OUTBOX_ENABLED, drain
+    from scheduler import dispatch_due, dispatch_engine
+
+    db = SessionLocal()
+    try:
+        stats = dispatch_due(db, shard=(shard, shards))
+        if OUTBOX_ENABLED:
+            # Deliver what the tick just queued for this shard's users
+            drain(db, dispatch_engine, shard=(shard, shards))
+        return _with_metrics(stats)
+    finally:
+        db.close()
+
+
+def _drain_shard(shard: int, shards: int) -> TickStats:
+    """Deliver this shard's due outbox messages, e.g. retries (runs in a worker process)"""
+    from models import SessionLocal
+    from outbox import drain
+    from scheduler import dispatch_engine
+
+    db = SessionLocal()
+    try:
+        return _with_metrics(drain(db, dispatch_engine, shard=(shard, shards)))
+    finally:
+        db.close()
+
+
+class ShardedDispatcher:
+    """
+    Fans a tick out to a pool of worker processes, one task per shard
+
+    Workers are started with 'spawn', so none inherit the scheduler's threads,
+    event loop or pooled database connections, and they stay alive between
+    ticks so each keeps its warm connections and HTTP pools. A shard runs one
+    task at a time - a tick and an outbox drain for the same users never send
+    side by side, which keeps their order and the per-worker rate limits.
+    """
+
+    def __init__(self, shards: Optional[int] = None):
+        self.shards = shards or DISPATCH_SHARDS
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._shard_locks = [threading.Lock() for _ in range(self.shards)]
+
+    @property
+    def running(self) -> bool:
+        return self._executor is not None
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.shards,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.shards,)
+            )
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def dispatch(self) -> TickStats:
+        """Run one tick on every shard in parallel and combine their stats"""
+        return self._run(_dispatch_shard)
+
+    def drain_outbox(self) -> TickStats:
+        """Deliver due outbox messages, each shard's from its own worker"""
+        return self._run(_drain_shard)
+
+    def _run(self, task) -> TickStats:
+        self.start()
+        futures = []
+        for shard in range(self.shards):
+            lock = self._shard_locks[shard]
+            lock.acquire()
+            try:
+                future = self._executor.submit(task, shard, self.shards)
+            except Exception:
+                lock.release()
+                raise
+            future.add_done_callback(lambda _, lock=lock: lock.release())
+            futures.append(future)
+
+        results: List[TickStats] = []
+        for shard, future in enumerate(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"❌ Dispatch shard {shard}/{self.shards} failed: {e}")
+                continue
+            absorb(results[-1].metrics)
+        return TickStats.combine(results)
@@ -0,0 +1,185 @@
+"""
+Dispatch Engine - Sends a tick's worth of messages concurrently
+Runs one long-lived event loop in a background thread with bounded concurrency and per-send timeouts
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Tunables (override via environment)
+DISPATCH_CONCURRENCY = int(os.getenv("DISPATCH_CONCURRENCY", "50"))
+DISPATCH_SEND_TIMEOUT = float(os.getenv("DISPATCH_SEND_TIMEOUT", "10"))
+
+
+class OutboundMessage:
+    """A single message to deliver, tagged with the caller's key (e.g. reminder id)"""
+
+    __slots__ = ("key", "platform", "recipient", "text")
+
+    def __init__(self, key, platform: str, recipient: str, text: str):
+        self.key = key
+        self.platform = platform
+        self.recipient = recipient
+        self.text = text
+
+
+class TickStats:
+    """Timing and outcome counters for one dispatch tick"""
+
+    def __init__(self, due: int = 0):
+        self.due = due
+        self.sent = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.duration_seconds = 0.0
+        # How late each reminder was claimed, relative to its next_send_at
+        self.lag_seconds: List[float] = []
+        # Metrics a worker process recorded (metrics.export), for the parent to absorb
+        self.metrics: dict = {}
+
+    @classmethod
+    def combine(cls, parts: List["TickStats"], parallel: bool = True) -> "TickStats":
+        """Merge stats from shards that ran side by side, or batches that ran one after another"""
+        total = cls()
+        for part in parts:
+            total.due += part.due
+            total.sent += part.sent
+            total.failed += part.failed
+            total.timed_out += part.timed_out
+            total.lag_seconds.extend(part.lag_seconds)
+            if parallel:
+                total.duration_seconds = max(total.duration_seconds, part.duration_seconds)
+            else:
+                total.duration_seconds += part.duration_seconds
+        return total
+    
+    @property
+    def messages_per_second(self) -> float:
+        if self.duration_seconds <= 0:
+            return 0.0
+        return self.sent / self.duration_seconds
+
+    def as_dict(self) -> dict:
+        return {
+            "due": self.due,
+            "sent": self.sent,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "duration_seconds": round(self.duration_seconds, 4),
+            "messages_per_second": round(self.messages_per_second, 2),
+            "max_lag_seconds": round(max(self.lag_seconds), 3) if self.lag_seconds else None
+        }
+
+    def __str__(self) -> str:
+        return (f"{self.sent}/{self.due} sent, {self.failed} failed "
+                f"({self.timed_out} timed out) in {self.duration_seconds:.2f}s "
+                f"- {self.messages_per_second:.1f} msg/s")
+
+
+class DispatchEngine:
+    """
+    Concurrent sender backed by a single persistent event loop
+
+    The loop lives in its own daemon thread so synchronous callers (the
+    APScheduler job thread) can submit a whole batch and block until it
+    finishes, without paying for a new event loop per message.
+    """
+
+    def __init__(self, messaging_service, concurrency: Optional[int] = None,
+                 send_timeout: Optional[float] = None):
+        self.messaging_service = messaging_service
+        self.concurrency = concurrency or DISPATCH_CONCURRENCY
+        self.send_timeout = send_timeout or DISPATCH_SEND_TIMEOUT
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None and self._loop.is_running()
+
+    def start(self):
+        """Start the background event loop (no-op if already running)"""
+        with self._lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+                loop.close()
+
+            self._thread = threading.Thread(target=run, name="dispatch-loop", daemon=True)
+            self._thread.start()
+            ready.wait()
+            self._loop = loop
+
+    def stop(self):
+        """Stop the background event loop and wait for its thread to exit"""
+        with self._lock:
+            if self._loop is None:
+                return
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._loop = None
+            self._thread = None
+
+    def dispatch(self, messages: List[OutboundMessage]) -> Tuple[Dict[object, bool], TickStats]:
+        """
+        Send all messages concurrently and block until every send finishes
+
+        Returns:
+            ({key: success}, TickStats)
+        """
+        if not self.running:
+            self.start()
+        future = asyncio.run_coroutine_threadsafe(self.dispatch_async(messages), self._loop)
+        return future.result()
+
+    async def dispatch_async(self, messages: List[OutboundMessage]) -> Tuple[Dict[object, bool], TickStats]:
+        """Coroutine form of dispatch() for callers already on an event loop"""
+        stats = TickStats(due=len(messages))
+        semaphore = asyncio.Semaphore(self.concurrency)
+        started = time.perf_counter()
+
+        outcomes = await asyncio.gather(
+            *(self._send_one(semaphore, message, stats) for message in messages)
+        )
+
+        stats.duration_seconds = time.perf_counter() - started
+        results = {message.key: ok for message, ok in zip(messages, outcomes)}
+        return results, stats
+
+    async def _send_one(self, semaphore: asyncio.Semaphore, message: OutboundMessage, stats: TickStats) -> bool:
+        """Send one message under the concurrency limit and timeout"""
+        async with semaphore:
+            try:
+                # The timeout covers delivery only, not rate-limiter waits
+                ok = await self.messaging_service.send_message(
+                    message.platform,
+                    message.recipient,
+                    message.text,
+                    timeout=self.send_timeout
+                )
+            except asyncio.TimeoutError:
+                print(f"⌛ Timed out sending to {message.recipient} after {self.send_timeout:.0f}s")
+                stats.timed_out += 1
+                ok = False
+            except Exception as e:
+                print(f"❌ Error sending to {message.recipient}: {e}")
+                ok = False
+
+        if ok:
+            stats.sent += 1
+        else:
+            stats.failed += 1
+        return ok
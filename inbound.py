@@ -0,0 +1,142 @@
+"""
+Inbound Queue - Per-user ordered processing of incoming messages
+Each chat's messages run one at a time in arrival order, while different chats run in parallel on a bounded worker pool
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Set, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Tunables (override via environment)
+# Chats processed at the same time (each holds one database session while it runs)
+INBOUND_WORKERS = int(os.getenv("INBOUND_WORKERS", "32"))
+# Messages waiting across all chats before new ones are refused (and retried by the platform)
+INBOUND_MAX_PENDING = int(os.getenv("INBOUND_MAX_PENDING", "10000"))
+# Messages a worker takes from one chat before letting other chats go first
+INBOUND_FAIRNESS_BATCH = int(os.getenv("INBOUND_FAIRNESS_BATCH", "8"))
+# How long shutdown waits for queued messages to finish
+INBOUND_DRAIN_SECONDS = float(os.getenv("INBOUND_DRAIN_SECONDS", "10"))
+
+Handler = Callable[..., Awaitable[None]]
+
+
+class InboundQueue:
+    """
+    Keyed work queue: one FIFO per user, at most one worker per user at a time
+
+    A user with pending work sits in the ready queue exactly once; a worker
+    takes the user, runs up to INBOUND_FAIRNESS_BATCH of their messages in
+    order and puts them back at the end if more arrived meanwhile. Ordering
+    is per process - deployments with several web workers keep a chat's
+    messages in order only as far as the load balancer sends them to one
+    worker.
+    """
+
+    def __init__(self, handler: Handler, workers: Optional[int] = None,
+                 max_pending: Optional[int] = None, fairness_batch: Optional[int] = None):
+        self.handler = handler
+        self.workers = workers or INBOUND_WORKERS
+        self.max_pending = max_pending or INBOUND_MAX_PENDING
+        self.fairness_batch = fairness_batch or INBOUND_FAIRNESS_BATCH
+        self._queues: Dict[Hashable, Deque[Tuple[tuple, float]]] = {}
+        self._scheduled: Set[Hashable] = set()
+        self._ready: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._idle: Optional[asyncio.Event] = None
+        self.pending = 0
+        self.submitted = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_wait_seconds = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        """Start the worker tasks on the running event loop (no-op if started)"""
+        if self._tasks:
+            return
+        self._ready = asyncio.Queue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = [asyncio.create_task(self._worker(), name=f"inbound-{i}") for i in range(self.workers)]
+
+    async def stop(self, timeout: Optional[float] = None):
+        """Let queued messages finish (up to timeout seconds), then stop the workers"""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout or INBOUND_DRAIN_SECONDS)
+        except asyncio.TimeoutError:
+            print(f"⚠️  Stopping with {self.pending} inbound message(s) unprocessed")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, key: Hashable, *args) -> bool:
+        """
+        Queue handler(*args) behind the key's earlier messages
+        Returns False (nothing queued) when the backlog is full
+        """
+        self.start()
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            return False
+
+        self._queues.setdefault(key, deque()).append((args, time.monotonic()))
+        self.pending += 1
+        self.submitted += 1
+        self._idle.clear()
+        if key not in self._scheduled:
+            self._scheduled.add(key)
+            self._ready.put_nowait(key)
+        return True
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            queue = self._queues[key]
+            for _ in range(self.fairness_batch):
+                if not queue:
+                    break
+                args, queued_at = queue.popleft()
+                self.max_wait_seconds = max(self.max_wait_seconds, time.monotonic() - queued_at)
+                try:
+                    await self.handler(*args)
+                    self.processed += 1
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.failed += 1
+                    print(f"❌ Error processing inbound message for {key}: {e}")
+                finally:
+                    self.pending -= 1
+
+            if queue:
+                # More arrived while this worker was busy - go to the back of the line
+                self._ready.put_nowait(key)
+            else:
+                del self._queues[key]
+                self._scheduled.discard(key)
+                if not self.pending:
+                    self._idle.set()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "active_users": len(self._queues),
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "max_wait_seconds": round(self.max_wait_seconds, 4)
+        }
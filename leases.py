@@ -0,0 +1,79 @@
+"""
+Leases - Keep and verify the claims dispatchers hold on reminders and outbox rows
+A batch being sent renews its lease in the background, and bookkeeping only touches rows the claim still owns
+"""
+
+import threading
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+
+def owned_ids(db: Session, model, token: str, ids: Iterable[int], lease_seconds: float) -> List[int]:
+    """
+    Of these ids, the ones still claimed by token
+
+    The lease is renewed first, which takes the write lock on SQLite and row
+    locks on Postgres, so no other worker can reclaim the rows before the
+    caller's transaction commits. Call at the start of that transaction.
+    """
+    ids = list(ids)
+    if not ids:
+        return []
+    held = (model.id.in_(ids), model.claimed_by == token)
+    db.execute(
+        update(model).where(*held).values(
+            claim_expires_at=datetime.now() + timedelta(seconds=lease_seconds)
+        ).execution_options(synchronize_session=False)
+    )
+    return list(db.execute(select(model.id).where(*held)).scalars())
+
+
+class LeaseKeeper:
+    """
+    Renews a claim's lease every lease_seconds / 3 until the block exits
+
+    Usage:
+        with LeaseKeeper(engine, Reminder, token, REMINDER_CLAIM_SECONDS):
+            send the claimed batch
+    """
+
+    def __init__(self, bind, model, token: str, lease_seconds: float, interval: Optional[float] = None):
+        self.bind = bind
+        self.model = model
+        self.token = token
+        self.lease_seconds = lease_seconds
+        self.interval = interval or lease_seconds / 3
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.renewals = 0
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, name="lease-keeper", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join(timeout=10)
+        return False
+
+    def renew(self) -> int:
+        """Push the lease out by lease_seconds; returns the rows still held"""
+        with Session(self.bind) as db:
+            renewed = db.execute(
+                update(self.model).where(self.model.claimed_by == self.token).values(
+                    claim_expires_at=datetime.now() + timedelta(seconds=self.lease_seconds)
+                ).execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+        self.renewals += 1
+        return renewed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.renew()
+            except Exception as e:
+                print(f"❌ Error renewing claim {self.token}: {e}")
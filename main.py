@@ -3,14 +3,17 @@ Main FastAPI application for HydraBot
 Handles webhooks, message processing, and scheduler setup
 """
 
-from fastapi import FastAPI, Request, Depends, BackgroundTasks
-from fastapi.responses import PlainTextResponse
+from fastapi import FastAPI, Request, Depends
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from contextlib import asynccontextmanager
 import os
 from dotenv import load_dotenv
 
-from models import init_db, get_db
+from models import init_db, get_async_db, async_engine, engine, AsyncSessionLocal
+from inbound import InboundQueue
+from metrics import CONTENT_TYPE, INBOUND_PENDING, render as render_metrics
 from reminder_service import ReminderService
 from messaging_service import (
     MessagingService,
@@ -21,10 +24,16 @@ from messaging_service import (
     format_stats_response,
     format_unknown_command_response
 )
-from scheduler import start_scheduler, stop_scheduler
+from outbox import OUTBOX_ENABLED, enqueue_claimed, record_attempt
+from tracing import annotate, instrument_engine, span, trace
+from update_dedup import UpdateDeduplicator
+from scheduler import notify_outbox, start_scheduler, stop_scheduler
 
 load_dotenv()
 
+# Set to false when dispatch runs in its own process (python cli.py dispatch)
+RUN_SCHEDULER = os.getenv("RUN_SCHEDULER", "true").lower() in ("1", "true", "yes")
+
 
 # Lifespan context manager for startup/shutdown events
 @asynccontextmanager
@@ -33,13 +42,18 @@ async def lifespan(app: FastAPI):
     # Startup
     print("🚀 Starting HydraBot...")
     init_db()
-    start_scheduler()
+    if RUN_SCHEDULER:
+        start_scheduler()
+    else:
+        print("⏭️  In-process scheduler disabled (RUN_SCHEDULER=false) - run the dispatcher separately")
+    inbound_queue.start()
     print("✅ HydraBot is running!")
     
     yield
     
     # Shutdown
     print("⏹️  Stopping HydraBot...")
+    await inbound_queue.stop()
     stop_scheduler()
     print("👋 HydraBot stopped")
 
@@ -52,9 +66,17 @@ app = FastAPI(
     lifespan=lifespan
 )
 
-# Initialize messaging service
+# Initialize messaging service - replies go out on this event loop, so it
+# has its own Telegram client, but it shares the scheduler's rate limits
 messaging_service = MessagingService()
 
+# Per-trace SQL statement counts (only while TRACE_MODE is on)
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+
+# Recently seen Telegram update_ids, so webhook retries aren't processed twice
+update_dedup = UpdateDeduplicator()
+
 
 @app.get("/")
 async def root():
@@ -62,12 +84,22 @@ async def root():
     return {
         "status": "running",
         "service": "HydraBot",
-        "platform": os.getenv("MESSAGING_PLATFORM", "telegram")
+        "platform": os.getenv("MESSAGING_PLATFORM", "telegram"),
+        "messaging": messaging_service.stats(),
+        "telegram_dedup": update_dedup.stats(),
+        "inbound": inbound_queue.stats()
     }
 
 
+@app.get("/metrics")
+def metrics():
+    """Prometheus scrape endpoint"""
+    # Plain def: FastAPI runs it on the threadpool, since the outbox gauge queries the database
+    return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
+
+
 @app.post("/webhook/twilio")
-async def twilio_webhook(request: Request, db: Session = Depends(get_db)):
+async def twilio_webhook(request: Request, db: AsyncSession = Depends(get_async_db)):
     """Handle incoming SMS from Twilio"""
     try:
         form_data = await request.form()
@@ -75,12 +107,13 @@ async def twilio_webhook(request: Request, db: Session = Depends(get_db)):
         message_body = form_data.get("Body", "").strip()
         
         # Process the message
-        response_text = await process_message(
-            db=db,
-            platform="twilio",
-            platform_id=from_number,
-            message=message_body
-        )
+        with trace("webhook.twilio", platform="twilio"):
+            response_text = await process_message(
+                db=db,
+                platform="twilio",
+                platform_id=from_number,
+                message=message_body
+            )
         
         # Send response via Twilio's TwiML
         return PlainTextResponse(
@@ -97,24 +130,30 @@ async def twilio_webhook(request: Request, db: Session = Depends(get_db)):
 
 
 @app.post("/webhook/telegram")
-async def telegram_webhook(request: Request, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+async def telegram_webhook(request: Request):
     """Handle incoming messages from Telegram"""
     try:
         data = await request.json()
         
+        # Telegram re-delivers an update it thinks we missed (e.g. a slow
+        # response); acknowledge the retry without running the command again
+        update_id = data.get("update_id")
+        if update_id is not None and await update_dedup.is_duplicate(update_id):
+            return {"ok": True}
+        
         # Extract message info
         if "message" in data:
             message = data["message"]
             chat_id = str(message["chat"]["id"])
             text = message.get("text", "").strip()
             
-            # Process the message in background
-            background_tasks.add_task(
-                process_and_respond_telegram,
-                db=db,
-                chat_id=chat_id,
-                message=text
-            )
+            # Process after replying to Telegram, in order with this chat's
+            # earlier messages
+            if not inbound_queue.submit(chat_id, chat_id, text):
+                # Backlog full - have Telegram retry later rather than drop it
+                if update_id is not None:
+                    await update_dedup.forget(update_id)
+                return JSONResponse({"ok": False, "error": "busy"}, status_code=503)
         
         return {"ok": True}
     
@@ -123,41 +162,85 @@ async def telegram_webhook(request: Request, background_tasks: BackgroundTasks,
         return {"ok": False, "error": str(e)}
 
 
-async def process_and_respond_telegram(db: Session, chat_id: str, message: str):
+async def process_and_respond_telegram(chat_id: str, message: str):
     """Process message and send response via Telegram"""
-    response_text = await process_message(
-        db=db,
-        platform="telegram",
-        platform_id=chat_id,
-        message=message
-    )
-    
-    # Send response
-    await messaging_service.send_message("telegram", chat_id, response_text)
+    # Runs on the inbound queue after the request has finished, so each
+    # message opens its own session
+    with trace("webhook.telegram", platform="telegram"):
+        async with AsyncSessionLocal() as db:
+            response_text = await process_message(
+                db=db,
+                platform="telegram",
+                platform_id=chat_id,
+                message=message
+            )
+            
+            if OUTBOX_ENABLED:
+                # Queue the reply first, so a failed send is retried by the outbox
+                # sender instead of lost; the first attempt still happens right here
+                with span("reply.enqueue"):
+                    token, queued = await db.run_sync(enqueue_claimed, "reply", "telegram", chat_id, response_text)
+                with span("reply.send"):
+                    sent = await messaging_service.send_message("telegram", chat_id, response_text)
+                with span("reply.record"):
+                    await db.run_sync(record_attempt, token, queued, sent)
+                if not sent:
+                    # Wake the sender so it schedules the retry
+                    notify_outbox()
+                return
+        
+        # Send response
+        with span("reply.send"):
+            await messaging_service.send_message("telegram", chat_id, response_text)
+
+
+# Incoming Telegram messages, serialized per chat
+inbound_queue = InboundQueue(process_and_respond_telegram)
+INBOUND_PENDING.set_function(lambda: inbound_queue.pending)
 
 
-async def process_message(db: Session, platform: str, platform_id: str, message: str) -> str:
+async def process_message(db: AsyncSession, platform: str, platform_id: str, message: str) -> str:
     """
     Core message processing logic
+    Runs the synchronous ReminderService code on the async driver, so the
+    event loop is free while the database does I/O
+    """
+    return await db.run_sync(process_message_sync, platform, platform_id, message)
+
+
+def process_message_sync(db: Session, platform: str, platform_id: str, message: str) -> str:
+    """
     Parses command, executes action, returns response text
+    Response formatting happens here too, while ORM attributes can still lazy-load
     """
     # Get or create user
-    user = ReminderService.get_or_create_user(db, platform, platform_id)
+    with span("user.get_or_create"):
+        user = ReminderService.get_or_create_user(db, platform, platform_id)
     
     # Parse command
-    command_type, params = ReminderService.parse_command(message)
+    with span("command.parse"):
+        command_type, params = ReminderService.parse_command(message)
+    annotate(command=command_type)
     
     # Execute command and generate response
+    with span("command.execute", command=command_type):
+        return execute_command(db, user, command_type, params)
+
+
+def execute_command(db: Session, user, command_type: str, params: dict) -> str:
+    """Run a parsed command and format its response"""
     if command_type == "done":
         return handle_done_command(db, user)
     
     elif command_type == "stats":
         stats = ReminderService.get_stats(db, user)
-        return format_stats_response(stats)
+        with span("response.format"):
+            return format_stats_response(stats)
     
     elif command_type == "list":
         reminders = ReminderService.list_active_reminders(db, user)
-        return format_reminders_list_response(reminders)
+        with span("response.format"):
+            return format_reminders_list_response(reminders)
     
     elif command_type in ("cancel", "cancel_all"):
         return handle_cancel_command(db, user, command_type, params)
@@ -176,11 +259,12 @@ def handle_done_command(db: Session, user) -> str:
     """Handle 'done' command"""
     reminder = ReminderService.mark_reminder_done(db, user)
     if reminder:
-        return format_done_response(
-            reminder.title,
-            reminder.is_recurring,
-            reminder.interval_minutes if reminder.is_recurring else None
-        )
+        with span("response.format"):
+            return format_done_response(
+                reminder.title,
+                reminder.is_recurring,
+                reminder.interval_minutes if reminder.is_recurring else None
+            )
     return "No recent reminders to mark as done. Create a reminder first!"
 
 
@@ -188,7 +272,8 @@ def handle_cancel_command(db: Session, user, command_type: str, params: dict) ->
     """Handle cancel commands"""
     keyword = params.get("keyword") if command_type == "cancel" else None
     count = ReminderService.cancel_reminders(db, user, keyword)
-    return format_reminders_cancelled_response(count, keyword)
+    with span("response.format"):
+        return format_reminders_cancelled_response(count, keyword)
 
 
 def handle_remind_recurring(db: Session, user, params: dict) -> str:
@@ -198,10 +283,11 @@ def handle_remind_recurring(db: Session, user, params: dict) -> str:
         params["title"],
         params["interval_minutes"]
     )
-    return format_reminder_created_response(
-        reminder.title,
-        interval_minutes=reminder.interval_minutes
-    )
+    with span("response.format"):
+        return format_reminder_created_response(
+            reminder.title,
+            interval_minutes=reminder.interval_minutes
+        )
 
 
 def handle_remind_once(db: Session, user, params: dict) -> str:
@@ -212,25 +298,24 @@ def handle_remind_once(db: Session, user, params: dict) -> str:
             params["title"],
             params["scheduled_time"]
         )
-        time_str = reminder.scheduled_time.strftime("%I:%M %p")
-        return format_reminder_created_response(
-            reminder.title,
-            scheduled_time=time_str
-        )
+        with span("response.format"):
+            time_str = reminder.scheduled_time.strftime("%I:%M %p")
+            return format_reminder_created_response(
+                reminder.title,
+                scheduled_time=time_str
+            )
     return "❌ Could not parse the time. Try formats like '6pm', '6:30pm', or '18:00'."
 
 
 # Manual API endpoints for testing (optional)
 
 @app.get("/api/reminders/{platform}/{platform_id}")
-async def get_user_reminders(platform: str, platform_id: str, db: Session = Depends(get_db)):
+async def get_user_reminders(platform: str, platform_id: str, db: AsyncSession = Depends(get_async_db)):
     """Get all reminders for a user (for testing)"""
-    user = ReminderService.get_or_create_user(db, platform, platform_id)
-    reminders = ReminderService.list_active_reminders(db, user)
-    
-    return {
-        "user": {"platform": platform, "platform_id": platform_id},
-        "reminders": [
+    def load(sync_db: Session) -> list:
+        user = ReminderService.get_or_create_user(sync_db, platform, platform_id)
+        reminders = ReminderService.list_active_reminders(sync_db, user)
+        return [
             {
                 "id": r.id,
                 "title": r.title,
@@ -240,14 +325,21 @@ async def get_user_reminders(platform: str, platform_id: str, db: Session = Depe
             }
             for r in reminders
         ]
+    
+    return {
+        "user": {"platform": platform, "platform_id": platform_id},
+        "reminders": await db.run_sync(load)
     }
 
 
 @app.get("/api/stats/{platform}/{platform_id}")
-async def get_user_stats(platform: str, platform_id: str, db: Session = Depends(get_db)):
+async def get_user_stats(platform: str, platform_id: str, db: AsyncSession = Depends(get_async_db)):
     """Get stats for a user (for testing)"""
-    user = ReminderService.get_or_create_user(db, platform, platform_id)
-    stats = ReminderService.get_stats(db, user)
+    def load(sync_db: Session) -> dict:
+        user = ReminderService.get_or_create_user(sync_db, platform, platform_id)
+        return ReminderService.get_stats(sync_db, user, include_recent_logs=False)
+    
+    stats = await db.run_sync(load)
     
     return {
         "user": {"platform": platform, "platform_id": platform_id},
@@ -3,57 +3,134 @@ Messaging Service - Handles Twilio SMS and Telegram Bot integrations
 Provides unified interface for sending messages
 """
 
+import asyncio
 import os
-from typing import Optional
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Tuple
+from requests.adapters import HTTPAdapter
 from twilio.rest import Client
+from twilio.base.exceptions import TwilioRestException
+from twilio.http.http_client import TwilioHttpClient
 from telegram import Bot
-from telegram.error import TelegramError
+from telegram.error import RetryAfter, TelegramError
+from telegram.request import HTTPXRequest
 from dotenv import load_dotenv
 
+from metrics import SEND_LATENCY, SENDS
+from rate_limiter import RateLimiter, RateLimitedError, RATE_LIMIT_MAX_RETRIES, shared_rate_limiter
+
 load_dotenv()
 
+# Twilio's SDK is synchronous, so SMS sends run on a bounded thread pool
+TWILIO_MAX_WORKERS = int(os.getenv("TWILIO_MAX_WORKERS", "8"))
+TWILIO_HTTP_TIMEOUT = float(os.getenv("TWILIO_HTTP_TIMEOUT", "10"))
+# Point the Twilio client at another host (e.g. the offline fake in benchmarks/)
+TWILIO_API_BASE_URL = os.getenv("TWILIO_API_BASE_URL")
+# Same for the Telegram Bot API (the token is appended as /bot<token>/...)
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL")
 
-class MessagingService:
-    """Unified messaging service for SMS and Telegram"""
+MESSAGING_PLATFORM_NAMES = ("twilio", "telegram")
+# Platforms set up at start (comma-separated; defaults to MESSAGING_PLATFORM)
+MESSAGING_PLATFORMS = os.getenv("MESSAGING_PLATFORMS", "")
+# Backend overrides, e.g. 'telegram=null,twilio=recording' or just 'latency'
+# for every platform (default: each platform's real API)
+MESSAGING_BACKENDS = os.getenv("MESSAGING_BACKENDS", "")
+# Messages kept by the recording backend
+MESSAGING_RECORDING_MAX = int(os.getenv("MESSAGING_RECORDING_MAX", "10000"))
+# Simulated send time and failure rate for the latency backend
+MESSAGING_LATENCY_MS = float(os.getenv("MESSAGING_LATENCY_MS", "50"))
+MESSAGING_LATENCY_JITTER_MS = float(os.getenv("MESSAGING_LATENCY_JITTER_MS", "0"))
+MESSAGING_LATENCY_FAILURE_RATE = float(os.getenv("MESSAGING_LATENCY_FAILURE_RATE", "0"))
+
+
+class PooledTwilioHttpClient(TwilioHttpClient):
+    """
+    Twilio HTTP client with a keep-alive pool sized for the send thread pool
+    Also remembers the Retry-After header of a 429 (the SDK drops it) and can
+    redirect requests to a different base URL
+    """
     
-    def __init__(self):
-        self.platform = os.getenv("MESSAGING_PLATFORM", "telegram").lower()
-        
-        # Initialize Twilio
-        if self.platform == "twilio":
-            self.twilio_client = Client(
-                os.getenv("TWILIO_ACCOUNT_SID"),
-                os.getenv("TWILIO_AUTH_TOKEN")
-            )
-            self.twilio_phone = os.getenv("TWILIO_PHONE_NUMBER")
-        
-        # Initialize Telegram
-        elif self.platform == "telegram":
-            self.telegram_bot = Bot(token=os.getenv("TELEGRAM_BOT_TOKEN"))
+    def __init__(self, pool_size: int, timeout: float, base_url: Optional[str] = None):
+        super().__init__(pool_connections=True, timeout=timeout)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self._local = threading.local()
     
-    async def send_message(self, platform: str, recipient: str, message: str) -> bool:
-        """
-        Send a message via the specified platform
-        
-        Args:
-            platform: 'twilio' or 'telegram'
-            recipient: phone number for SMS, chat_id for Telegram
-            message: text message to send
+    @property
+    def last_retry_after(self) -> Optional[float]:
+        """Retry-After (seconds) of the last 429 seen on this thread"""
+        return getattr(self._local, "retry_after", None)
+    
+    def request(self, method, url, *args, **kwargs):
+        if self.base_url:
+            url = self.base_url + url[url.index("/", len("https://")):]
+        response = super().request(method, url, *args, **kwargs)
         
-        Returns:
-            True if sent successfully, False otherwise
-        """
-        try:
-            if platform == "twilio":
-                return self._send_sms(recipient, message)
-            elif platform == "telegram":
-                return await self._send_telegram(recipient, message)
-            else:
-                print(f"❌ Unknown platform: {platform}")
-                return False
-        except Exception as e:
-            print(f"❌ Error sending message: {e}")
-            return False
+        self._local.retry_after = None
+        if response.status_code == 429:
+            try:
+                self._local.retry_after = float(response.headers.get("Retry-After"))
+            except (TypeError, ValueError):
+                pass
+        return response
+
+
+class MessagingBackend:
+    """
+    Transport for one platform's messages
+
+    send() returns True when delivered and False on a permanent failure,
+    and raises RateLimitedError for a throttled send that should be retried
+    """
+    
+    name = ""
+    # True when send() enforces its own time limit - MessagingService then
+    # doesn't abandon it after the caller's timeout, as the send would go on
+    # in the background and a retry would deliver the message twice
+    times_out_itself = False
+    
+    def __init__(self, platform: str):
+        self.platform = platform
+    
+    async def send(self, recipient: str, message: str) -> bool:
+        raise NotImplementedError
+    
+    def close(self):
+        """Release threads/connections held by the backend"""
+    
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+
+class TwilioBackend(MessagingBackend):
+    """SMS via the Twilio REST API"""
+    
+    name = "twilio"
+    # The blocking request can't be cancelled from the event loop; it is
+    # bounded by the HTTP client's TWILIO_HTTP_TIMEOUT instead
+    times_out_itself = True
+    
+    def __init__(self, platform: str = "twilio"):
+        super().__init__(platform)
+        self.twilio_http = PooledTwilioHttpClient(TWILIO_MAX_WORKERS, TWILIO_HTTP_TIMEOUT, TWILIO_API_BASE_URL)
+        self.twilio_client = Client(
+            os.getenv("TWILIO_ACCOUNT_SID"),
+            os.getenv("TWILIO_AUTH_TOKEN"),
+            http_client=self.twilio_http
+        )
+        self.twilio_phone = os.getenv("TWILIO_PHONE_NUMBER")
+        self.sms_executor = ThreadPoolExecutor(max_workers=TWILIO_MAX_WORKERS, thread_name_prefix="twilio-send")
+    
+    async def send(self, recipient: str, message: str) -> bool:
+        """Run the blocking Twilio send on the SMS thread pool, off the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.sms_executor, self._send_sms, recipient, message)
     
     def _send_sms(self, phone_number: str, message: str) -> bool:
         """Send SMS via Twilio"""
@@ -65,11 +142,37 @@ class MessagingService:
             )
             print(f"✅ SMS sent to {phone_number}")
             return True
+        except TwilioRestException as e:
+            if e.status == 429:
+                # Account/number throughput exceeded
+                raise RateLimitedError(self.twilio_http.last_retry_after, scope="global")
+            print(f"❌ Error sending SMS: {e}")
+            return False
         except Exception as e:
             print(f"❌ Error sending SMS: {e}")
             return False
     
-    async def _send_telegram(self, chat_id: str, message: str) -> bool:
+    def close(self):
+        self.sms_executor.shutdown(wait=False)
+
+
+class TelegramBackend(MessagingBackend):
+    """Messages via the Telegram Bot API"""
+    
+    name = "telegram"
+    
+    def __init__(self, platform: str = "telegram"):
+        super().__init__(platform)
+        # The default request pool holds a single connection, which would
+        # serialize concurrent sends from the dispatch engine
+        pool_size = int(os.getenv("TELEGRAM_CONNECTION_POOL_SIZE", os.getenv("DISPATCH_CONCURRENCY", "50")))
+        self.telegram_bot = Bot(
+            token=os.getenv("TELEGRAM_BOT_TOKEN"),
+            base_url=f"{TELEGRAM_API_BASE_URL.rstrip('/')}/bot" if TELEGRAM_API_BASE_URL else "https://api.telegram.org/bot",
+            request=HTTPXRequest(connection_pool_size=pool_size, pool_timeout=10.0)
+        )
+    
+    async def send(self, chat_id: str, message: str) -> bool:
         """Send message via Telegram"""
         try:
             await self.telegram_bot.send_message(
@@ -78,11 +181,225 @@ class MessagingService:
             )
             print(f"✅ Telegram message sent to {chat_id}")
             return True
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            if hasattr(retry_after, "total_seconds"):
+                retry_after = retry_after.total_seconds()
+            raise RateLimitedError(float(retry_after), scope="recipient")
         except TelegramError as e:
             print(f"❌ Error sending Telegram message: {e}")
             return False
 
 
+class NullBackend(MessagingBackend):
+    """Accepts every message and does nothing - the pipeline with network cost removed"""
+    
+    name = "null"
+    
+    def __init__(self, platform: str):
+        super().__init__(platform)
+        self.sent = 0
+    
+    async def send(self, recipient: str, message: str) -> bool:
+        self.sent += 1
+        return True
+    
+    def stats(self) -> dict:
+        return {"backend": self.name, "sent": self.sent}
+
+
+class RecordingBackend(MessagingBackend):
+    """Keeps the last MESSAGING_RECORDING_MAX messages in memory instead of sending them"""
+    
+    name = "recording"
+    
+    def __init__(self, platform: str):
+        super().__init__(platform)
+        self.messages: Deque[Tuple[str, str, float]] = deque(maxlen=MESSAGING_RECORDING_MAX)
+        self.sent = 0
+    
+    async def send(self, recipient: str, message: str) -> bool:
+        self.messages.append((recipient, message, time.time()))
+        self.sent += 1
+        return True
+    
+    def sent_to(self, recipient: str) -> List[str]:
+        """Texts recorded for one recipient, oldest first"""
+        return [text for to, text, _ in self.messages if to == str(recipient)]
+    
+    def clear(self):
+        self.messages.clear()
+    
+    def stats(self) -> dict:
+        return {"backend": self.name, "sent": self.sent, "recorded": len(self.messages)}
+
+
+class LatencyBackend(MessagingBackend):
+    """
+    Simulated transport: waits MESSAGING_LATENCY_MS (+ up to
+    MESSAGING_LATENCY_JITTER_MS) per send and fails MESSAGING_LATENCY_FAILURE_RATE
+    of them, without any sockets or threads
+    """
+    
+    name = "latency"
+    
+    def __init__(self, platform: str):
+        super().__init__(platform)
+        self.latency = MESSAGING_LATENCY_MS / 1000
+        self.jitter = MESSAGING_LATENCY_JITTER_MS / 1000
+        self.failure_rate = MESSAGING_LATENCY_FAILURE_RATE
+        self.sent = 0
+        self.failed = 0
+    
+    async def send(self, recipient: str, message: str) -> bool:
+        await asyncio.sleep(self.latency + random.random() * self.jitter)
+        if self.failure_rate and random.random() < self.failure_rate:
+            self.failed += 1
+            return False
+        self.sent += 1
+        return True
+    
+    def stats(self) -> dict:
+        return {"backend": self.name, "sent": self.sent, "failed": self.failed}
+
+
+# Backend name -> factory taking the platform it will serve
+BACKENDS: Dict[str, Callable[[str], MessagingBackend]] = {
+    "twilio": TwilioBackend,
+    "telegram": TelegramBackend,
+    "null": NullBackend,
+    "recording": RecordingBackend,
+    "latency": LatencyBackend,
+}
+
+
+def register_backend(name: str, factory: Callable[[str], MessagingBackend]):
+    """Make a custom transport selectable through MESSAGING_BACKENDS"""
+    BACKENDS[name] = factory
+
+
+def parse_backend_overrides(spec: str) -> Dict[str, str]:
+    """
+    Parse MESSAGING_BACKENDS: 'telegram=null,twilio=recording' picks a backend
+    per platform; a bare name ('null') applies to every platform
+    """
+    overrides = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        platform, _, backend = entry.rpartition("=")
+        backend = backend.strip().lower()
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown messaging backend {backend!r} (choose from {', '.join(BACKENDS)})")
+        overrides[platform.strip().lower() or "*"] = backend
+    return overrides
+
+
+class MessagingService:
+    """
+    Unified messaging service for SMS and Telegram
+    
+    Each platform is served by a backend - its real API by default, or one
+    picked in MESSAGING_BACKENDS. Platforms in MESSAGING_PLATFORMS are set up
+    at start; any other platform gets its backend on first send, so one
+    process can serve SMS and Telegram users together. Every instance
+    sends against the process-wide rate limiter unless given its own.
+    """
+    
+    def __init__(self, platforms: Optional[Sequence[str]] = None, backends: Optional[str] = None,
+                 rate_limiter: Optional[RateLimiter] = None):
+        self.platform = os.getenv("MESSAGING_PLATFORM", "telegram").lower()
+        self.rate_limiter = rate_limiter or shared_rate_limiter()
+        self.overrides = parse_backend_overrides(MESSAGING_BACKENDS if backends is None else backends)
+        self.backends: Dict[str, MessagingBackend] = {}
+        self._lock = threading.Lock()
+        
+        if platforms is None:
+            platforms = [p.strip().lower() for p in MESSAGING_PLATFORMS.split(",") if p.strip()] or [self.platform]
+        for platform in platforms:
+            self.backend(platform)
+    
+    def backend_name(self, platform: str) -> str:
+        return self.overrides.get(platform, self.overrides.get("*", platform))
+    
+    def backend(self, platform: str) -> MessagingBackend:
+        """The platform's backend, created on first use"""
+        backend = self.backends.get(platform)
+        if backend is None:
+            with self._lock:
+                backend = self.backends.get(platform)
+                if backend is None:
+                    if platform not in MESSAGING_PLATFORM_NAMES:
+                        raise ValueError(f"Unknown platform: {platform}")
+                    backend = BACKENDS[self.backend_name(platform)](platform)
+                    self.backends[platform] = backend
+                    print(f"📨 {platform} messages go through the {backend.name} backend")
+        return backend
+    
+    def close(self):
+        for backend in self.backends.values():
+            backend.close()
+    
+    def stats(self) -> dict:
+        return {platform: backend.stats() for platform, backend in self.backends.items()}
+    
+    async def send_message(self, platform: str, recipient: str, message: str,
+                           timeout: Optional[float] = None) -> bool:
+        """
+        Send a message via the specified platform
+        
+        Sends wait for the platform's rate limits first; a 429 / RetryAfter
+        delays and retries the send rather than failing it.
+        
+        Args:
+            platform: 'twilio' or 'telegram'
+            recipient: phone number for SMS, chat_id for Telegram
+            message: text message to send
+            timeout: optional limit (seconds) on each delivery attempt, not
+                counting time spent waiting for the rate limiter; raises
+                asyncio.TimeoutError when exceeded. Not applied to backends
+                that time out their own requests (Twilio)
+        
+        Returns:
+            True if sent successfully, False otherwise
+        """
+        try:
+            backend = self.backend(platform)
+        except Exception as e:
+            print(f"❌ {e}")
+            return False
+        
+        for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+            await self.rate_limiter.acquire(platform, recipient)
+            # Latency covers the delivery attempt only, not the rate-limiter wait
+            started = time.perf_counter()
+            result = "failed"
+            try:
+                send = backend.send(recipient, message)
+                if timeout is not None and not backend.times_out_itself:
+                    ok = await asyncio.wait_for(send, timeout)
+                else:
+                    ok = await send
+                result = "sent" if ok else "failed"
+                return ok
+            except RateLimitedError as e:
+                result = "rate_limited"
+                self.rate_limiter.penalize(platform, recipient, e.retry_after, e.scope)
+                if attempt < RATE_LIMIT_MAX_RETRIES:
+                    print(f"⏳ Rate limited sending to {recipient}, retrying after "
+                          f"{e.retry_after or 'default back-off'}s (retry {attempt + 1}/{RATE_LIMIT_MAX_RETRIES})")
+            except asyncio.TimeoutError:
+                result = "timeout"
+                raise
+            except Exception as e:
+                print(f"❌ Error sending message: {e}")
+                return False
+            finally:
+                SEND_LATENCY.observe(time.perf_counter() - started, platform=platform)
+                SENDS.inc(platform=platform, result=result)
+        
+        print(f"❌ Giving up on {recipient} after {RATE_LIMIT_MAX_RETRIES} rate-limited retries")
+        return False
+
+
 # Helper functions for formatting responses
 
 def format_reminder_created_response(title: str, interval_minutes: Optional[int] = None, scheduled_time: Optional[str] = None) -> str:
@@ -0,0 +1,138 @@
+"""
+Schema Migrations - Versioned, in-place upgrades for existing databases
+create_all() only creates missing tables, so index and column changes to existing tables live here
+"""
+
+from datetime import datetime
+from typing import Callable, List, Tuple
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+# Ordered list of (version, description, upgrade function)
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = []
+
+
+def migration(version: int, description: str):
+    """Register an upgrade function under a schema version"""
+    def decorator(func: Callable[[Connection], None]):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return decorator
+
+
+def _ensure_version_table(conn: Connection):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, "
+        "description VARCHAR(200) NOT NULL, "
+        "applied_at TIMESTAMP NOT NULL)"
+    ))
+
+
+def get_schema_version(engine: Engine) -> int:
+    """Return the highest applied migration version (0 for a fresh database)"""
+    with engine.begin() as conn:
+        _ensure_version_table(conn)
+        version = conn.execute(text("SELECT MAX(version) FROM schema_migrations")).scalar()
+    return version or 0
+
+
+def run_migrations(engine: Engine) -> int:
+    """
+    Apply every pending migration, each in its own transaction
+
+    Returns:
+        number of migrations applied
+    """
+    current = get_schema_version(engine)
+    applied = 0
+
+    for version, description, upgrade in MIGRATIONS:
+        if version <= current:
+            continue
+        with engine.begin() as conn:
+            upgrade(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, description, applied_at) "
+                     "VALUES (:version, :description, :applied_at)"),
+                {"version": version, "description": description, "applied_at": datetime.utcnow()}
+            )
+        print(f"🔧 Applied migration {version}: {description}")
+        applied += 1
+
+    return applied
+
+
+# Helpers for writing idempotent migrations
+
+def _create_index(conn: Connection, name: str, table: str, columns: str):
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+
+
+def _has_column(conn: Connection, table: str, column: str) -> bool:
+    return any(c["name"] == column for c in inspect(conn).get_columns(table))
+
+
+def _add_column(conn: Connection, table: str, column: str, ddl_type: str):
+    if not _has_column(conn, table, column):
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+
+
+# Migrations
+
+@migration(1, "Add indexes for the due scan, per-user reminder filters and log stats")
+def _add_hot_query_indexes(conn: Connection):
+    _create_index(conn, "ix_reminders_active_next_send", "reminders", "is_active, next_send_at")
+    _create_index(conn, "ix_reminders_user_active_last_sent", "reminders", "user_id, is_active, last_sent_at")
+    _create_index(conn, "ix_reminder_logs_user_action_time", "reminder_logs", "user_id, action, timestamp")
+    _create_index(conn, "ix_reminder_logs_user_time", "reminder_logs", "user_id, timestamp")
+    _create_index(conn, "ix_reminder_logs_time", "reminder_logs", "timestamp")
+    _create_index(conn, "ix_reminder_logs_reminder", "reminder_logs", "reminder_id")
+    if conn.dialect.name == "sqlite":
+        # Refresh planner statistics so the new indexes are picked up
+        conn.execute(text("ANALYZE"))
+
+
+@migration(2, "Create the user_stats read model and backfill it from reminder_logs")
+def _add_user_stats(conn: Connection):
+    from models import UserStats
+    from reminder_service import ReminderService
+
+    UserStats.__table__.create(bind=conn, checkfirst=True)
+    session = Session(bind=conn)
+    try:
+        ReminderService.rebuild_user_stats(session)
+    finally:
+        session.close()
+
+
+@migration(3, "Add dispatch claim columns to reminders")
+def _add_reminder_claims(conn: Connection):
+    _add_column(conn, "reminders", "claimed_by", "VARCHAR(64)")
+    _add_column(conn, "reminders", "claim_expires_at", "TIMESTAMP")
+
+
+@migration(4, "Create the outbox table for queued outbound messages")
+def _add_outbox(conn: Connection):
+    from models import OutboxMessage
+
+    OutboxMessage.__table__.create(bind=conn, checkfirst=True)
+
+
+@migration(5, "Create the processed_updates table for Telegram webhook deduplication")
+def _add_processed_updates(conn: Connection):
+    from models import ProcessedUpdate
+
+    ProcessedUpdate.__table__.create(bind=conn, checkfirst=True)
+
+
+@migration(6, "Index outbox messages by reminder")
+def _add_outbox_reminder_index(conn: Connection):
+    _create_index(conn, "ix_outbox_reminder", "outbox", "reminder_id")
+
+
+@migration(7, "Add due_at to outbox messages")
+def _add_outbox_due_at(conn: Connection):
+    _add_column(conn, "outbox", "due_at", "TIMESTAMP")
@@ -4,11 +4,13 @@ Defines User, Reminder, and ReminderLog tables
 """
 
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, ForeignKey, Text
+from sqlalchemy import BigInteger, Column, Integer, String, Date, DateTime, Boolean, ForeignKey, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.orm import relationship, sessionmaker
 import os
 from dotenv import load_dotenv
+from storage import create_async_db_engine, create_db_engine
 
 load_dotenv()
 
@@ -30,6 +32,7 @@ class User(Base):
     # Relationships
     reminders = relationship("Reminder", back_populates="user", cascade=CASCADE_DELETE)
     logs = relationship("ReminderLog", back_populates="user", cascade=CASCADE_DELETE)
+    stats = relationship("UserStats", back_populates="user", uselist=False, cascade=CASCADE_DELETE)
 
 
 class Reminder(Base):
@@ -51,9 +54,21 @@ class Reminder(Base):
     next_send_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
+    # Dispatch lease: which worker's tick is sending this reminder, and until when
+    claimed_by = Column(String(64), nullable=True)
+    claim_expires_at = Column(DateTime, nullable=True)
+    
     # Relationships
     user = relationship("User", back_populates="reminders")
     logs = relationship("ReminderLog", back_populates="reminder", cascade=CASCADE_DELETE)
+    
+    # Indexes for the hot queries (see migrations.py for existing databases)
+    __table_args__ = (
+        # Due scan: is_active AND next_send_at <= now
+        Index("ix_reminders_active_next_send", "is_active", "next_send_at"),
+        # Per-user active filters and the 'done' lookup by last_sent_at DESC
+        Index("ix_reminders_user_active_last_sent", "user_id", "is_active", "last_sent_at"),
+    )
 
 
 class ReminderLog(Base):
@@ -73,17 +88,158 @@ class ReminderLog(Base):
     # Relationships
     user = relationship("User", back_populates="logs")
     reminder = relationship("Reminder", back_populates="logs")
+    
+    # Indexes for the hot queries (see migrations.py for existing databases)
+    __table_args__ = (
+        # Stats: completions per user ordered by time
+        Index("ix_reminder_logs_user_action_time", "user_id", "action", "timestamp"),
+        # Stats: recent activity per user
+        Index("ix_reminder_logs_user_time", "user_id", "timestamp"),
+        # CLI: most recent logs overall
+        Index("ix_reminder_logs_time", "timestamp"),
+        # Cascade deletes from reminders
+        Index("ix_reminder_logs_reminder", "reminder_id"),
+    )
+
+
+class UserStats(Base):
+    """Stats read model - one row per user, kept up to date by ReminderService"""
+    __tablename__ = "user_stats"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    total_completions = Column(Integer, default=0, nullable=False)
+    current_streak = Column(Integer, default=0, nullable=False)  # consecutive days ending at last_completion_date
+    last_completion_date = Column(Date, nullable=True)
+    active_reminders_count = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    user = relationship("User", back_populates="stats")
+
+
+class ReminderLogRollup(Base):
+    """Daily per-user, per-reminder counts of log rows removed by retention.py"""
+    __tablename__ = "reminder_log_rollups"
+    
+    id = Column(Integer, primary_key=True)
+    # Historical data - no foreign keys, so cleaning up reminders never touches it
+    user_id = Column(Integer, nullable=False)
+    reminder_id = Column(Integer, nullable=False, default=0)  # 0 when the log had no reminder
+    day = Column(Date, nullable=False)
+    action = Column(String(50), nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    first_at = Column(DateTime, nullable=True)
+    last_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        # One row per bucket; retention upserts into it
+        Index("ux_reminder_log_rollups_bucket", "user_id", "reminder_id", "day", "action", unique=True),
+    )
+
+
+class ReminderLogArchive(Base):
+    """Raw reminder_logs rows moved out of the hot table by retention.py"""
+    __tablename__ = "reminder_logs_archive"
+    
+    id = Column(Integer, primary_key=True)
+    # reminder_logs id at archive time - SQLite may reuse it once the table is emptied
+    log_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    reminder_id = Column(Integer, nullable=True)
+    action = Column(String(50), nullable=False)
+    reminder_title = Column(String(200), nullable=True)
+    notes = Column(Text, nullable=True)
+    timestamp = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ReminderArchive(Base):
+    """Inactive reminders moved out of the live table by 'cli.py clean --archive'"""
+    __tablename__ = "reminders_archive"
+    
+    id = Column(Integer, primary_key=True)
+    reminder_id = Column(Integer, nullable=False)  # id in reminders at archive time
+    user_id = Column(Integer, nullable=False)
+    title = Column(String(200), nullable=False)
+    interval_minutes = Column(Integer, nullable=True)
+    scheduled_time = Column(DateTime, nullable=True)
+    is_recurring = Column(Boolean, default=False)
+    last_sent_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+
+class OutboxMessage(Base):
+    """Outbound message waiting for delivery by outbox.py - deleted once sent"""
+    __tablename__ = "outbox"
+    
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(20), nullable=False)  # 'reminder' or 'reply'
+    # No foreign keys - cleanup may remove the reminder before its message goes out
+    user_id = Column(Integer, nullable=True)
+    reminder_id = Column(Integer, nullable=True)
+    platform = Column(String(20), nullable=False)
+    recipient = Column(String(100), nullable=False)
+    text = Column(Text, nullable=False)
+    due_at = Column(DateTime, nullable=True)  # the reminder's next_send_at, for the dispatch lag metric
+    
+    # Delivery state: 'pending' until sent (row deleted) or out of attempts ('dead')
+    status = Column(String(20), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.now)
+    last_error = Column(String(500), nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    
+    # Delivery lease, as on reminders
+    claimed_by = Column(String(64), nullable=True)
+    claim_expires_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        # Sender scan: pending AND next_attempt_at <= now
+        Index("ix_outbox_status_next_attempt", "status", "next_attempt_at"),
+        # A reminder's undelivered messages (no re-queueing, cancel/done clean-up)
+        Index("ix_outbox_reminder", "reminder_id"),
+    )
+
+
+class ProcessedUpdate(Base):
+    """Telegram update_ids already handled - the shared seen-set used by update_dedup.py"""
+    __tablename__ = "processed_updates"
+    
+    update_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    received_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
 
 
 # Database setup
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./hydrabot.db")
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {})
+# Storage profile and pool sizing come from SQLITE_PROFILE / SQLITE_* / DB_POOL_* (see storage.py)
+engine = create_db_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+def to_async_url(url: str) -> str:
+    """Map a sync DATABASE_URL onto its asyncio driver (aiosqlite / asyncpg)"""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    if url.startswith("postgres://"):
+        return "postgresql+asyncpg://" + url[len("postgres://"):]
+    if url.startswith("postgresql:") or url.startswith("postgresql+psycopg2:"):
+        return "postgresql+asyncpg:" + url.split(":", 1)[1]
+    return url
+
+
+# Async access path for the webhooks - same database, non-blocking driver
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", to_async_url(DATABASE_URL))
+async_engine = create_async_db_engine(ASYNC_DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False)
+
+
 def init_db():
-    """Initialize database - create all tables"""
+    """Initialize database - create all tables and apply pending migrations"""
+    from migrations import run_migrations
+    
     Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
     print("✅ Database initialized successfully")
 
 
@@ -94,3 +250,9 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """Dependency for getting an async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,367 @@
+"""
+Outbox - Durable queue for every outbound message
+Producers insert rows; the sender claims due rows in batches, delivers them through the dispatch
+engine and retries failures with exponential backoff until they are dead-lettered
+"""
+
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import case, delete, exists, func, select, update
+from sqlalchemy.orm import Session
+
+from dispatcher import OutboundMessage, TickStats
+from leases import LeaseKeeper, owned_ids
+from metrics import DISPATCH_LAG, OUTBOX_DEPTH
+from models import OutboxMessage, Reminder, SessionLocal
+from reminder_service import WORKER_ID, ReminderService
+
+load_dotenv()
+
+# Tunables (override via environment)
+# false sends reminders straight from the scheduler tick and replies inline, as before
+OUTBOX_ENABLED = os.getenv("OUTBOX_ENABLED", "true").lower() in ("1", "true", "yes")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+# Attempts before a message is dead-lettered
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+# Retry n waits OUTBOX_BACKOFF_SECONDS * 2^(n-1), capped at OUTBOX_BACKOFF_MAX_SECONDS
+OUTBOX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_BACKOFF_SECONDS", "30"))
+OUTBOX_BACKOFF_MAX_SECONDS = float(os.getenv("OUTBOX_BACKOFF_MAX_SECONDS", "3600"))
+# How often a standalone dispatcher's sender looks for messages queued by other
+# processes (retries and in-process messages wake it directly, without polling)
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "5"))
+OUTBOX_CLAIM_SECONDS = int(os.getenv("OUTBOX_CLAIM_SECONDS", "120"))
+
+PENDING = "pending"
+DEAD = "dead"
+
+
+def outbox_row(kind: str, platform: str, recipient: str, text: str,
+               user_id: Optional[int] = None, reminder_id: Optional[int] = None,
+               due_at: Optional[datetime] = None) -> dict:
+    """Column values for one queued message (for bulk inserts)"""
+    return {
+        "kind": kind,
+        "user_id": user_id,
+        "reminder_id": reminder_id,
+        "platform": platform,
+        "recipient": recipient,
+        "text": text,
+        "due_at": due_at,
+        "status": PENDING,
+        "attempts": 0,
+        "next_attempt_at": datetime.now(),
+        "created_at": datetime.now()
+    }
+
+
+def enqueue_claimed(db: Session, kind: str, platform: str, recipient: str, text: str,
+                    user_id: Optional[int] = None) -> Tuple[str, OutboxMessage]:
+    """
+    Queue one message already claimed by the caller, who delivers it right away
+    If that first attempt fails (or the process dies), the sender retries it
+    """
+    token = _new_token()
+    message = OutboxMessage(
+        **outbox_row(kind, platform, recipient, text, user_id=user_id),
+        claimed_by=token,
+        claim_expires_at=datetime.now() + timedelta(seconds=OUTBOX_CLAIM_SECONDS)
+    )
+    db.add(message)
+    db.commit()
+    return token, message
+
+
+def queued_reminder_ids(db: Session, reminder_ids: List[int]) -> Set[int]:
+    """Of these reminders, the ones with a message still waiting for delivery"""
+    if not reminder_ids:
+        return set()
+    return set(db.execute(
+        select(OutboxMessage.reminder_id).where(
+            OutboxMessage.reminder_id.in_(reminder_ids),
+            OutboxMessage.status == PENDING
+        )
+    ).scalars())
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Delay before the next attempt after this many failed ones"""
+    return min(OUTBOX_BACKOFF_SECONDS * 2 ** max(attempts - 1, 0), OUTBOX_BACKOFF_MAX_SECONDS)
+
+
+def _new_token(worker_id: Optional[str] = None) -> str:
+    return f"{worker_id or WORKER_ID}/{uuid.uuid4().hex[:12]}"
+
+
+def claim_batch(db: Session, limit: Optional[int] = None,
+                shard: Optional[Tuple[int, int]] = None) -> Tuple[str, List[OutboxMessage]]:
+    """
+    Atomically claim up to limit pending messages that are due for an attempt
+    Same lease scheme as ReminderService.claim_due_reminders; shard=(index, count)
+    limits the claim to users with user_id % count == index. Claimed messages for
+    reminders that are no longer active are deleted instead of returned
+    """
+    now = datetime.now()
+    token = _new_token()
+    claimable = (
+        OutboxMessage.status == PENDING,
+        OutboxMessage.next_attempt_at <= now,
+        (OutboxMessage.claimed_by.is_(None)) | (OutboxMessage.claim_expires_at < now)
+    )
+    if shard is not None:
+        claimable += (func.coalesce(OutboxMessage.user_id, 0) % shard[1] == shard[0],)
+
+    candidates = select(OutboxMessage.id).where(*claimable).order_by(
+        OutboxMessage.next_attempt_at
+    ).limit(limit or OUTBOX_BATCH_SIZE).with_for_update(skip_locked=True)
+
+    claimed = db.execute(
+        update(OutboxMessage).where(
+            OutboxMessage.id.in_(candidates.scalar_subquery()),
+            *claimable
+        ).values(
+            claimed_by=token,
+            claim_expires_at=now + timedelta(seconds=OUTBOX_CLAIM_SECONDS)
+        ).execution_options(synchronize_session=False)
+    ).rowcount
+    if claimed:
+        # Reminders cancelled or completed since they were queued (or since
+        # removed by cleanup) aren't sent
+        dropped = db.execute(
+            delete(OutboxMessage).where(
+                OutboxMessage.claimed_by == token,
+                OutboxMessage.reminder_id.is_not(None),
+                ~exists().where(Reminder.id == OutboxMessage.reminder_id, Reminder.is_active)
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+        if dropped:
+            print(f"🗑️  Dropped {dropped} outbox message(s) for inactive reminders")
+            claimed -= dropped
+    db.commit()
+
+    if not claimed:
+        return token, []
+    messages = db.query(OutboxMessage).filter(OutboxMessage.claimed_by == token).order_by(OutboxMessage.id).all()
+    return token, messages
+
+
+def record_results(db: Session, token: str, messages: List[OutboxMessage],
+                   results: Dict[int, bool]) -> Tuple[int, int, int]:
+    """
+    Delete delivered messages; reschedule failed ones with backoff or dead-letter them
+    Delivered reminders get their last_sent_at and 'sent' log in the same transaction,
+    and their lag behind next_send_at is observed.
+    Messages another sender has since reclaimed (the lease ran out) are left to it
+
+    Returns:
+        (sent, retrying, dead)
+    """
+    now = datetime.now()
+    sent_ids = []
+    delivered_reminders = []
+    lags = []
+    failures = []
+    dead = 0
+
+    owned = set(owned_ids(db, OutboxMessage, token, [message.id for message in messages], OUTBOX_CLAIM_SECONDS))
+    if len(owned) < len(messages):
+        print(f"⚠️  {len(messages) - len(owned)} outbox message(s) were reclaimed by another sender - not recording them")
+
+    for message in messages:
+        if message.id not in owned:
+            continue
+        if results.get(message.id):
+            sent_ids.append(message.id)
+            if message.reminder_id is not None:
+                delivered_reminders.append(message.reminder_id)
+            if message.due_at is not None:
+                lags.append(max((now - message.due_at).total_seconds(), 0.0))
+            continue
+        attempts = message.attempts + 1
+        row = {"id": message.id, "attempts": attempts, "claimed_by": None, "claim_expires_at": None}
+        if attempts >= OUTBOX_MAX_ATTEMPTS:
+            row["status"] = DEAD
+            dead += 1
+            print(f"☠️  Giving up on outbox message {message.id} to {message.recipient} after {attempts} attempts")
+        else:
+            row["next_attempt_at"] = now + timedelta(seconds=backoff_seconds(attempts))
+        failures.append(row)
+
+    if sent_ids:
+        db.execute(delete(OutboxMessage).where(OutboxMessage.id.in_(sent_ids)))
+        ReminderService.record_reminders_delivered(db, delivered_reminders, now)
+    if failures:
+        db.execute(update(OutboxMessage), failures)
+    db.commit()
+
+    for lag in lags:
+        DISPATCH_LAG.observe(lag)
+    return len(sent_ids), len(failures) - dead, dead
+
+
+def record_attempt(db: Session, token: str, message: OutboxMessage, ok: bool) -> Tuple[int, int, int]:
+    """record_results for a single message delivered by its producer"""
+    return record_results(db, token, [message], {message.id: ok})
+
+
+def to_outbound(messages: List[OutboxMessage]) -> List[OutboundMessage]:
+    return [OutboundMessage(m.id, m.platform, m.recipient, m.text) for m in messages]
+
+
+def drain(db: Session, dispatch_engine, shard: Optional[Tuple[int, int]] = None,
+          max_batches: Optional[int] = None) -> TickStats:
+    """Deliver due outbox messages batch by batch until none are left"""
+    ticks = []
+    while max_batches is None or len(ticks) < max_batches:
+        token, messages = claim_batch(db, shard=shard)
+        if not messages:
+            break
+
+        # Rate limits can stretch a batch past its lease - keep it while sending
+        with LeaseKeeper(db.get_bind(), OutboxMessage, token, OUTBOX_CLAIM_SECONDS):
+            results, stats = dispatch_engine.dispatch(to_outbound(messages))
+        sent, retrying, dead = record_results(db, token, messages, results)
+        ticks.append(stats)
+        print(f"📤 Outbox batch: {sent} sent, {retrying} to retry, {dead} dead-lettered")
+
+        if len(messages) < OUTBOX_BATCH_SIZE:
+            break
+    return TickStats.combine(ticks, parallel=False)
+
+
+def next_due_at(db: Session) -> Optional[datetime]:
+    """When the earliest pending message can next be claimed (None if the queue is empty)"""
+    claimable_at = case(
+        (OutboxMessage.claimed_by.is_(None), OutboxMessage.next_attempt_at),
+        (OutboxMessage.claim_expires_at > OutboxMessage.next_attempt_at, OutboxMessage.claim_expires_at),
+        else_=OutboxMessage.next_attempt_at
+    )
+    return db.query(func.min(claimable_at)).filter(OutboxMessage.status == PENDING).scalar()
+
+
+def outbox_stats(db: Session) -> dict:
+    """Queue depth by status, plus how overdue the oldest pending message is"""
+    counts = dict(db.query(OutboxMessage.status, func.count()).group_by(OutboxMessage.status).all())
+    oldest = db.query(func.min(OutboxMessage.next_attempt_at)).filter(OutboxMessage.status == PENDING).scalar()
+    return {
+        "pending": counts.get(PENDING, 0),
+        "dead": counts.get(DEAD, 0),
+        "oldest_due_seconds": max((datetime.now() - oldest).total_seconds(), 0.0) if oldest else 0.0
+    }
+
+
+def _scrape_depth() -> dict:
+    db = SessionLocal()
+    try:
+        stats = outbox_stats(db)
+    finally:
+        db.close()
+    return {(PENDING,): stats["pending"], (DEAD,): stats["dead"]}
+
+
+if OUTBOX_ENABLED:
+    OUTBOX_DEPTH.set_function(_scrape_depth)
+
+
+def requeue_dead(db: Session) -> int:
+    """Give dead-lettered messages a fresh set of attempts"""
+    requeued = db.execute(
+        update(OutboxMessage).where(OutboxMessage.status == DEAD).values(
+            status=PENDING, attempts=0, next_attempt_at=datetime.now(),
+            claimed_by=None, claim_expires_at=None
+        )
+    ).rowcount
+    db.commit()
+    return requeued
+
+
+class OutboxSender:
+    """
+    Background thread that drains the outbox
+
+    Sleeps until the earliest pending message is due (a retry's backoff, or
+    an expired claim) or until notify() - a tick just queued reminders, or an
+    inline reply failed - so an idle queue costs no queries. With
+    poll_seconds (standalone dispatchers), it also looks that often for
+    messages queued by other processes. Claims are leased, so senders in
+    several processes can share the queue.
+    """
+
+    def __init__(self, session_factory, dispatch_engine, poll_seconds: Optional[float] = None,
+                 drain_fn: Optional[Callable[[Session], TickStats]] = None):
+        self.session_factory = session_factory
+        self.dispatch_engine = dispatch_engine
+        # Override where the sending happens (e.g. on the sharded dispatch workers)
+        self.drain_fn = drain_fn or (lambda db: drain(db, self.dispatch_engine))
+        self.poll_seconds = poll_seconds
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_stats: Optional[TickStats] = None
+        self.next_due_at: Optional[datetime] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, poll_seconds: Optional[float] = None):
+        if self.running:
+            return
+        if poll_seconds is not None:
+            self.poll_seconds = poll_seconds
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="outbox-sender", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=10)
+        self._thread = None
+
+    def notify(self):
+        """Check the queue now instead of at the next due message"""
+        self._wake.set()
+
+    def _run(self):
+        # Look once at startup for messages left by an earlier run
+        timeout: Optional[float] = 0
+        while not self._stop.is_set():
+            self._wake.wait(timeout)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            db = self.session_factory()
+            try:
+                timeout = self._drain_due(db)
+            except Exception as e:
+                db.rollback()
+                print(f"❌ Error draining outbox: {e}")
+                timeout = self.poll_seconds or OUTBOX_BACKOFF_SECONDS
+            finally:
+                db.close()
+
+    def _drain_due(self, db: Session) -> Optional[float]:
+        """Drain if anything is due; returns how long to sleep (None: until notified)"""
+        due_at = next_due_at(db)
+        floor = 0.0
+        if due_at is not None and due_at <= datetime.now():
+            stats = self.drain_fn(db)
+            if stats.due:
+                self.last_stats = stats
+            else:
+                # Due but not claimable (e.g. locked by another sender) - don't spin
+                floor = 1.0
+            due_at = next_due_at(db)
+        self.next_due_at = due_at
+
+        timeout = self.poll_seconds or None
+        if due_at is not None:
+            until_due = max((due_at - datetime.now()).total_seconds(), floor)
+            timeout = min(timeout, until_due) if timeout else until_due
+        return timeout
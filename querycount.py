@@ -0,0 +1,68 @@
+"""
+Query Counter - Counts the SQL statements a code path emits
+Used to catch N+1 lazy-load regressions where query count grows with row count
+"""
+
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryCounter:
+    """Collects every statement executed on an engine while active"""
+
+    def __init__(self):
+        self.statements: List[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+@contextmanager
+def count_queries(engine: Optional[Engine] = None):
+    """
+    Count statements executed on engine inside the block
+
+    Usage:
+        with count_queries(engine) as counter:
+            list_reminders()
+        print(counter.count)
+    """
+    if engine is None:
+        from models import engine
+
+    counter = QueryCounter()
+    event.listen(engine, "before_cursor_execute", counter._record)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", counter._record)
+
+
+def assert_constant_query_count(run: Callable[[], object], seed: Callable[[int], object],
+                                sizes: Iterable[int] = (5, 50), engine: Optional[Engine] = None,
+                                label: str = "code path") -> Dict[int, int]:
+    """
+    Run a code path against datasets of increasing size and fail if the
+    number of statements it emits grows with the row count
+
+    seed(size) must (re)populate the database with `size` rows before each run.
+
+    Returns:
+        {size: statement count}
+    """
+    counts = {}
+    for size in sizes:
+        seed(size)
+        with count_queries(engine) as counter:
+            run()
+        counts[size] = counter.count
+
+    if len(set(counts.values())) > 1:
+        raise AssertionError(f"{label}: query count grows with rows {counts}")
+    return counts
@@ -0,0 +1,220 @@
+"""
+Rate Limiter - Token buckets for outbound messaging
+Keeps sends under each platform's global and per-recipient limits and honours Retry-After
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Messages per second (0 disables the bucket). Defaults follow the
+# documented limits: ~30 msg/s per Telegram bot and ~1 msg/s per chat,
+# ~1 msg/s per Twilio long-code number.
+PLATFORM_LIMITS = {
+    "telegram": {
+        "global": float(os.getenv("TELEGRAM_RATE_LIMIT", "30")),
+        "recipient": float(os.getenv("TELEGRAM_CHAT_RATE_LIMIT", "1")),
+    },
+    "twilio": {
+        "global": float(os.getenv("TWILIO_RATE_LIMIT", "1")),
+        "recipient": float(os.getenv("TWILIO_RECIPIENT_RATE_LIMIT", "1")),
+    },
+}
+
+# Back-off used when a 429 doesn't say how long to wait
+RATE_LIMIT_DEFAULT_BACKOFF = float(os.getenv("RATE_LIMIT_DEFAULT_BACKOFF", "1"))
+# How many times a throttled send is delayed and retried before giving up
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "3"))
+# Idle per-recipient buckets are pruned once this many are tracked
+RATE_LIMIT_MAX_RECIPIENTS = int(os.getenv("RATE_LIMIT_MAX_RECIPIENTS", "10000"))
+
+
+class RateLimitedError(Exception):
+    """Raised by a transport when the platform answers 429 / RetryAfter"""
+
+    def __init__(self, retry_after: Optional[float] = None, scope: str = "recipient"):
+        super().__init__(f"rate limited ({scope}), retry after {retry_after}s")
+        self.retry_after = retry_after
+        self.scope = scope  # 'recipient' or 'global'
+
+
+class TokenBucket:
+    """
+    Token bucket implemented as a virtual schedule (GCRA)
+
+    Instead of counting tokens, each bucket tracks the theoretical time the
+    next send would be allowed at a steady rate; up to `burst` sends may run
+    ahead of that schedule. reserve() never blocks - it returns the time the
+    caller may send at, so waiting happens outside any lock.
+    """
+
+    __slots__ = ("interval", "tolerance", "next_free", "blocked_until")
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        burst = max(1.0, burst if burst is not None else rate)
+        self.interval = 1.0 / rate
+        self.tolerance = (burst - 1.0) * self.interval
+        self.next_free = 0.0
+        self.blocked_until = 0.0
+
+    def earliest(self, at: float) -> float:
+        """Earliest time >= at that a send would conform"""
+        return max(at, self.next_free - self.tolerance, self.blocked_until)
+
+    def consume(self, at: float):
+        """Record a send at time `at` (which must come from earliest())"""
+        self.next_free = max(self.next_free, at) + self.interval
+
+    def block(self, until: float):
+        """Hold all sends until the given time (Retry-After)"""
+        self.blocked_until = max(self.blocked_until, until)
+
+    def idle(self, now: float) -> bool:
+        return self.next_free <= now and self.blocked_until <= now
+
+
+class PlatformLimiter:
+    """Global bucket plus one bucket per recipient for a single platform"""
+
+    def __init__(self, global_rate: float, recipient_rate: float):
+        self.global_bucket = TokenBucket(global_rate) if global_rate > 0 else None
+        self.recipient_rate = recipient_rate
+        self.recipients: Dict[str, TokenBucket] = {}
+
+        # Observability
+        self.waiting = 0
+        self.acquired = 0
+        self.delayed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.throttled = 0
+
+    def _recipient_bucket(self, recipient: str, now: float) -> Optional[TokenBucket]:
+        if self.recipient_rate <= 0:
+            return None
+        bucket = self.recipients.get(recipient)
+        if bucket is None:
+            if len(self.recipients) >= RATE_LIMIT_MAX_RECIPIENTS:
+                self.recipients = {key: b for key, b in self.recipients.items() if not b.idle(now)}
+            bucket = TokenBucket(self.recipient_rate, burst=1)
+            self.recipients[recipient] = bucket
+        return bucket
+
+    def reserve(self, recipient: str, now: float) -> float:
+        """Reserve a send slot; returns the time the send may start"""
+        recipient_bucket = self._recipient_bucket(recipient, now)
+        at = now
+        if recipient_bucket:
+            at = recipient_bucket.earliest(at)
+        if self.global_bucket:
+            at = self.global_bucket.earliest(at)
+        if recipient_bucket:
+            recipient_bucket.consume(at)
+        if self.global_bucket:
+            self.global_bucket.consume(at)
+        return at
+
+    def backlog_seconds(self, now: float) -> float:
+        """How far ahead of now the global schedule is already booked"""
+        if not self.global_bucket:
+            return 0.0
+        return max(0.0, self.global_bucket.earliest(now) - now)
+
+
+class RateLimiter:
+    """Rate limits for every platform, shared by all sends in the process (see shared_rate_limiter)"""
+
+    def __init__(self, limits: Optional[dict] = None):
+        limits = limits if limits is not None else PLATFORM_LIMITS
+        self._lock = threading.Lock()
+        self.platforms = {
+            platform: PlatformLimiter(config["global"], config["recipient"])
+            for platform, config in limits.items()
+        }
+
+    async def acquire(self, platform: str, recipient: str) -> float:
+        """
+        Wait until a send to recipient is allowed
+
+        Returns:
+            seconds spent waiting
+        """
+        limiter = self.platforms.get(platform)
+        if limiter is None:
+            return 0.0
+
+        now = time.monotonic()
+        with self._lock:
+            start_at = limiter.reserve(recipient, now)
+            wait = start_at - now
+            limiter.acquired += 1
+            if wait > 0:
+                limiter.delayed += 1
+                limiter.waiting += 1
+                limiter.total_wait += wait
+                limiter.max_wait = max(limiter.max_wait, wait)
+
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                with self._lock:
+                    limiter.waiting -= 1
+        return wait
+
+    def penalize(self, platform: str, recipient: str, retry_after: Optional[float], scope: str = "recipient"):
+        """Apply a platform Retry-After to the recipient's (or the global) bucket"""
+        limiter = self.platforms.get(platform)
+        if limiter is None:
+            return
+
+        delay = retry_after if retry_after is not None else RATE_LIMIT_DEFAULT_BACKOFF
+        now = time.monotonic()
+        with self._lock:
+            limiter.throttled += 1
+            if scope == "global" or limiter.recipient_rate <= 0:
+                bucket = limiter.global_bucket
+            else:
+                bucket = limiter._recipient_bucket(recipient, now)
+            if bucket is not None:
+                bucket.block(now + delay)
+
+    def stats(self) -> dict:
+        """Queue depth and wait times per platform"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                platform: {
+                    "queue_depth": limiter.waiting,
+                    "acquired": limiter.acquired,
+                    "delayed": limiter.delayed,
+                    "throttled": limiter.throttled,
+                    "avg_wait_seconds": round(limiter.total_wait / limiter.acquired, 4) if limiter.acquired else 0.0,
+                    "max_wait_seconds": round(limiter.max_wait, 4),
+                    "backlog_seconds": round(limiter.backlog_seconds(now), 4),
+                    "tracked_recipients": len(limiter.recipients)
+                }
+                for platform, limiter in self.platforms.items()
+            }
+
+
+_shared_limiter: Optional[RateLimiter] = None
+_shared_lock = threading.Lock()
+
+
+def shared_rate_limiter() -> RateLimiter:
+    """
+    The process-wide limiter, created on first use
+    The web app's replies and the scheduler's dispatch use separate
+    MessagingService objects, but a bot's limit covers both
+    """
+    global _shared_limiter
+    with _shared_lock:
+        if _shared_limiter is None:
+            _shared_limiter = RateLimiter()
+        return _shared_limiter
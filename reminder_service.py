@@ -3,11 +3,155 @@ Reminder Service - Core logic for parsing commands and managing reminders
 Handles: creating reminders, cancelling, listing, and processing "done" responses
 """
 
+import os
 import re
-from datetime import datetime, timedelta
+import socket
+import uuid
+from datetime import date, datetime, timedelta
+from functools import lru_cache
 from typing import Optional, List, Tuple
-from sqlalchemy.orm import Session
-from models import User, Reminder, ReminderLog
+from sqlalchemy import DateTime, delete, func, insert, literal, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload, make_transient_to_detached
+from models import User, Reminder, ReminderLog, UserStats, OutboxMessage
+from leases import owned_ids
+from timer_heap import REMINDER_RETRY_SECONDS
+from tracing import span
+from ttl_cache import TTLCache
+
+# Command patterns, compiled once at import
+_EXACT_COMMANDS = {
+    "done": "done",
+    "stats": "stats",
+    "show stats": "stats",
+    "my stats": "stats",
+}
+# Pattern: "cancel X reminders"
+_CANCEL_KEYWORD_RE = re.compile(r"cancel\s+(.+?)\s+reminder")
+# Pattern: "remind me to X every Y hours/minutes"
+_RECURRING_RE = re.compile(r"remind\s+me\s+to\s+(.+?)\s+every\s+(\d+)\s+(hour|minute|min|hr)")
+# Pattern: "remind me to X at Y"
+_ONE_TIME_RE = re.compile(r"remind\s+me\s+to\s+(.+?)\s+at\s+(.+)")
+# Time formats like "6pm", "6:30pm", "18:00"
+_TIME_RE = re.compile(r"(\d+)(?::(\d+))?\s*(am|pm)?")
+
+# Bound on the number of distinct normalized messages kept by the parser cache
+PARSER_CACHE_SIZE = int(os.getenv("PARSER_CACHE_SIZE", "4096"))
+
+
+@lru_cache(maxsize=PARSER_CACHE_SIZE)
+def _classify_command(message: str) -> Tuple[str, tuple]:
+    """
+    Classify a normalized (stripped, lowercased) message
+    Returns (command_type, args) with only time-independent args, so results
+    can be cached; repeated messages like "done" skip the checks entirely
+    """
+    command_type = _EXACT_COMMANDS.get(message)
+    if command_type:
+        return (command_type, ())
+    
+    if "list" in message and "reminder" in message:
+        return ("list", ())
+    
+    if "cancel" in message:
+        if "all" in message:
+            return ("cancel_all", ())
+        # Extract keyword to cancel specific reminders
+        match = _CANCEL_KEYWORD_RE.search(message)
+        if match:
+            return ("cancel", (match.group(1).strip(),))
+        return ("cancel_all", ())
+    
+    # Both reminder patterns need the literal "remind"
+    if "remind" not in message:
+        return ("unknown", ())
+    
+    match = _RECURRING_RE.search(message)
+    if match:
+        interval = int(match.group(2))
+        # Convert to minutes
+        interval_minutes = interval * 60 if match.group(3) in ("hour", "hr") else interval
+        return ("remind_recurring", (match.group(1).strip(), interval_minutes))
+    
+    match = _ONE_TIME_RE.search(message)
+    if match:
+        return ("remind_once", (match.group(1).strip(), match.group(2).strip()))
+    
+    # Unknown command
+    return ("unknown", ())
+
+
+@lru_cache(maxsize=PARSER_CACHE_SIZE)
+def _parse_clock(time_str: str) -> Optional[Tuple[int, int]]:
+    """Parse "6pm", "6:30pm" or "18:00" into a 24-hour (hour, minute)"""
+    match = _TIME_RE.search(time_str)
+    if not match:
+        return None
+    
+    hour = int(match.group(1))
+    minute = int(match.group(2)) if match.group(2) else 0
+    period = match.group(3)
+    
+    # Convert to 24-hour format
+    if period == "pm" and hour != 12:
+        hour += 12
+    elif period == "am" and hour == 12:
+        hour = 0
+    
+    return (hour, minute)
+
+
+# (platform, platform_id) -> (user id, stored platform) for inbound messages
+user_cache = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("USER_CACHE_TTL", "300"))
+)
+
+# Identifies this process in reminder claims; must differ between dispatchers
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+
+# How long a claimed reminder stays reserved for the claiming tick. A worker
+# that dies mid-tick loses its claims when this runs out.
+REMINDER_CLAIM_SECONDS = int(os.getenv("REMINDER_CLAIM_SECONDS", "120"))
+
+# Most reminders one claim takes, so several dispatchers share a large due set
+REMINDER_CLAIM_BATCH = int(os.getenv("REMINDER_CLAIM_BATCH", "1000"))
+
+# Dialects that support INSERT ... ON CONFLICT ... RETURNING
+_UPSERT_INSERTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+
+# Callbacks told when a commit changes when reminders are next due.
+# Each is called with a list of (reminder_id, next_send_at) pairs, where
+# next_send_at is None once the reminder is no longer active.
+_schedule_listeners = []
+
+
+def add_schedule_listener(callback):
+    """Register a callback for reminder schedule changes"""
+    if callback not in _schedule_listeners:
+        _schedule_listeners.append(callback)
+
+
+def remove_schedule_listener(callback):
+    """Unregister a schedule change callback"""
+    if callback in _schedule_listeners:
+        _schedule_listeners.remove(callback)
+
+
+def notify_schedule_change(changes: List[Tuple[int, Optional[datetime]]]):
+    """Tell listeners about committed schedule changes"""
+    if not changes:
+        return
+    for callback in list(_schedule_listeners):
+        try:
+            callback(changes)
+        except Exception as e:
+            print(f"❌ Error in schedule listener: {e}")
 
 
 class ReminderService:
@@ -15,14 +159,51 @@ class ReminderService:
     
     @staticmethod
     def get_or_create_user(db: Session, platform: str, platform_id: str) -> User:
-        """Get existing user or create new one"""
+        """
+        Get existing user or create new one
+        Cache hits cost no queries; misses resolve with a single upsert
+        """
+        key = (platform, platform_id)
+        cached = user_cache.get(key)
+        if cached is None:
+            cached = ReminderService._upsert_user(db, platform, platform_id)
+            user_cache.set(key, cached)
+        
+        user_id, stored_platform = cached
+        
+        # Attach a persistent instance without a SELECT; other columns and
+        # relationships still lazy-load on access
+        user = User(id=user_id, platform=stored_platform, platform_id=platform_id)
+        make_transient_to_detached(user)
+        return db.merge(user, load=False)
+    
+    @staticmethod
+    def _upsert_user(db: Session, platform: str, platform_id: str) -> Tuple[int, str]:
+        """Insert the user if missing and return (id, platform), race-free"""
+        make_insert = _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+        
+        if make_insert is not None:
+            stmt = make_insert(User).values(platform=platform, platform_id=platform_id)
+            # The no-op update makes RETURNING yield the existing row on conflict
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[User.platform_id],
+                set_={"platform_id": stmt.excluded.platform_id}
+            ).returning(User.id, User.platform)
+            row = db.execute(stmt).one()
+            db.commit()
+            return (row.id, row.platform)
+        
+        # Portable fallback: look up, insert, and re-read if a concurrent insert won
         user = db.query(User).filter(User.platform_id == platform_id).first()
         if not user:
-            user = User(platform=platform, platform_id=platform_id)
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-        return user
+            try:
+                user = User(platform=platform, platform_id=platform_id)
+                db.add(user)
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                user = db.query(User).filter(User.platform_id == platform_id).one()
+        return (user.id, user.platform)
     
     @staticmethod
     def parse_command(message: str) -> Tuple[str, dict]:
@@ -39,100 +220,44 @@ class ReminderService:
         - "stats"
         - "done"
         """
-        message = message.strip().lower()
-        
-        # Check for "done" response
-        if message == "done":
-            return ("done", {})
-        
-        # Check for stats command
-        if message in ["stats", "show stats", "my stats"]:
-            return ("stats", {})
-        
-        # Check for list command
-        if "list" in message and "reminder" in message:
-            return ("list", {})
-        
-        # Check for cancel command
-        if "cancel" in message:
-            if "all" in message:
-                return ("cancel_all", {})
-            # Extract keyword to cancel specific reminders
-            match = re.search(r"cancel\s+(.+?)\s+reminder", message)
-            if match:
-                keyword = match.group(1).strip()
-                return ("cancel", {"keyword": keyword})
-            return ("cancel_all", {})
-        
-        # Check for remind command with recurring interval
-        # Pattern: "remind me to X every Y hours/minutes"
-        recurring_match = re.search(
-            r"remind\s+me\s+to\s+(.+?)\s+every\s+(\d+)\s+(hour|minute|min|hr)",
-            message
-        )
-        if recurring_match:
-            title = recurring_match.group(1).strip()
-            interval = int(recurring_match.group(2))
-            unit = recurring_match.group(3)
-            
-            # Convert to minutes
-            if unit in ["hour", "hr"]:
-                interval_minutes = interval * 60
-            else:
-                interval_minutes = interval
-            
+        command_type, args = _classify_command(message.strip().lower())
+        
+        if command_type == "cancel":
+            return ("cancel", {"keyword": args[0]})
+        
+        if command_type == "remind_recurring":
             return ("remind_recurring", {
-                "title": title,
-                "interval_minutes": interval_minutes
+                "title": args[0],
+                "interval_minutes": args[1]
             })
         
-        # Check for remind command with specific time
-        # Pattern: "remind me to X at Y"
-        time_match = re.search(r"remind\s+me\s+to\s+(.+?)\s+at\s+(.+)", message)
-        if time_match:
-            title = time_match.group(1).strip()
-            time_str = time_match.group(2).strip()
-            
-            # Parse time (simplified - accepts formats like "6pm", "18:00", "6:30pm")
-            scheduled_time = ReminderService._parse_time(time_str)
-            
+        if command_type == "remind_once":
+            # Resolved per call - the result depends on the current time
             return ("remind_once", {
-                "title": title,
-                "scheduled_time": scheduled_time
+                "title": args[0],
+                "scheduled_time": ReminderService._parse_time(args[1])
             })
         
-        # Unknown command
-        return ("unknown", {})
+        return (command_type, {})
     
     @staticmethod
     def _parse_time(time_str: str) -> Optional[datetime]:
         """Parse time string into datetime object for today"""
-        time_str = time_str.lower().strip()
+        clock = _parse_clock(time_str.lower().strip())
+        if clock is None:
+            return None
         
-        # Handle "6pm", "6:30pm" format
-        match = re.search(r"(\d+)(?::(\d+))?\s*(am|pm)?", time_str)
-        if match:
-            hour = int(match.group(1))
-            minute = int(match.group(2)) if match.group(2) else 0
-            period = match.group(3)
-            
-            # Convert to 24-hour format
-            if period == "pm" and hour != 12:
-                hour += 12
-            elif period == "am" and hour == 12:
-                hour = 0
-            
-            # Create datetime for today
-            now = datetime.now()
-            scheduled = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
-            
-            # If time has passed today, schedule for tomorrow
-            if scheduled < now:
-                scheduled += timedelta(days=1)
-            
-            return scheduled
+        hour, minute = clock
         
-        return None
+        # Create datetime for today
+        now = datetime.now()
+        scheduled = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        
+        # If time has passed today, schedule for tomorrow
+        if scheduled < now:
+            scheduled += timedelta(days=1)
+        
+        return scheduled
     
     @staticmethod
     def create_recurring_reminder(db: Session, user: User, title: str, interval_minutes: int) -> Reminder:
@@ -149,9 +274,10 @@ class ReminderService:
             next_send_at=next_send
         )
         
-        db.add(reminder)
-        db.commit()
-        db.refresh(reminder)
+        with span("reminder.insert"):
+            db.add(reminder)
+            db.commit()
+            db.refresh(reminder)
         
         # Log the creation
         log = ReminderLog(
@@ -161,9 +287,13 @@ class ReminderService:
             reminder_title=title,
             notes=f"Recurring every {interval_minutes} minutes"
         )
-        db.add(log)
-        db.commit()
+        with span("reminder.log_and_stats"):
+            db.add(log)
+            ReminderService._adjust_active_count(db, user.id, 1)
+            schedule = [(reminder.id, reminder.next_send_at)]
+            db.commit()
         
+        notify_schedule_change(schedule)
         return reminder
     
     @staticmethod
@@ -178,9 +308,10 @@ class ReminderService:
             next_send_at=scheduled_time
         )
         
-        db.add(reminder)
-        db.commit()
-        db.refresh(reminder)
+        with span("reminder.insert"):
+            db.add(reminder)
+            db.commit()
+            db.refresh(reminder)
         
         # Log the creation
         log = ReminderLog(
@@ -190,9 +321,13 @@ class ReminderService:
             reminder_title=title,
             notes=f"Scheduled for {scheduled_time.strftime('%I:%M %p')}"
         )
-        db.add(log)
-        db.commit()
+        with span("reminder.log_and_stats"):
+            db.add(log)
+            ReminderService._adjust_active_count(db, user.id, 1)
+            schedule = [(reminder.id, reminder.next_send_at)]
+            db.commit()
         
+        notify_schedule_change(schedule)
         return reminder
     
     @staticmethod
@@ -208,6 +343,7 @@ class ReminderService:
         
         reminders = query.all()
         count = len(reminders)
+        cancelled_ids = [reminder.id for reminder in reminders]
         
         for reminder in reminders:
             reminder.is_active = False
@@ -219,7 +355,11 @@ class ReminderService:
             )
             db.add(log)
         
+        if count:
+            ReminderService._adjust_active_count(db, user.id, -count)
+            ReminderService._drop_queued_messages(db, cancelled_ids)
         db.commit()
+        notify_schedule_change([(reminder_id, None) for reminder_id in cancelled_ids])
         return count
     
     @staticmethod
@@ -248,11 +388,13 @@ class ReminderService:
             return None
         
         # Log completion
+        completed_at = datetime.utcnow()
         log = ReminderLog(
             user_id=user.id,
             reminder_id=reminder.id,
             action="completed",
-            reminder_title=reminder.title
+            reminder_title=reminder.title,
+            timestamp=completed_at
         )
         db.add(log)
         
@@ -265,72 +407,362 @@ class ReminderService:
             # One-time reminder - mark as done
             reminder.is_active = False
         
+        ReminderService._record_completion(
+            db, user.id, completed_at.date(), active_delta=0 if reminder.is_recurring else -1
+        )
+        # Already done - a nudge still waiting in the outbox would be stale
+        ReminderService._drop_queued_messages(db, [reminder.id])
         db.commit()
         db.refresh(reminder)
         
+        notify_schedule_change([
+            (reminder.id, reminder.next_send_at if reminder.is_active else None)
+        ])
         return reminder
     
     @staticmethod
-    def get_stats(db: Session, user: User) -> dict:
+    def _drop_queued_messages(db: Session, reminder_ids: List[int]):
+        """Delete these reminders' undelivered outbox messages, in the caller's transaction"""
+        db.execute(
+            delete(OutboxMessage).where(
+                OutboxMessage.reminder_id.in_(reminder_ids),
+                OutboxMessage.status == "pending"
+            ).execution_options(synchronize_session=False)
+        )
+    
+    @staticmethod
+    def _adjust_active_count(db: Session, user_id: int, delta: int):
+        """Add delta to a user's active reminder count as a single atomic upsert"""
+        now = datetime.utcnow()
+        insert_fn = _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+        
+        if insert_fn is None:
+            stats = db.get(UserStats, user_id)
+            if stats is None:
+                db.add(UserStats(user_id=user_id, total_completions=0, current_streak=0,
+                                 active_reminders_count=max(delta, 0)))
+            else:
+                stats.active_reminders_count = UserStats.active_reminders_count + delta
+            db.flush()
+            return
+        
+        stmt = insert_fn(UserStats).values(
+            user_id=user_id,
+            total_completions=0,
+            current_streak=0,
+            active_reminders_count=max(delta, 0),
+            updated_at=now
+        )
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[UserStats.user_id],
+            set_={
+                "active_reminders_count": UserStats.active_reminders_count + delta,
+                "updated_at": now
+            }
+        ))
+    
+    @staticmethod
+    def _record_completion(db: Session, user_id: int, completed_on: date, active_delta: int = 0):
+        """Count one completion and extend (or restart) the user's daily streak"""
+        # The upsert creates the row if needed and holds its write lock, so the
+        # read-modify-write below can't race another request for the same user
+        ReminderService._adjust_active_count(db, user_id, active_delta)
+        stats = db.get(UserStats, user_id, populate_existing=True)
+        
+        last = stats.last_completion_date
+        if last is None or last < completed_on - timedelta(days=1):
+            stats.current_streak = 1
+        elif last == completed_on - timedelta(days=1):
+            stats.current_streak = (stats.current_streak or 0) + 1
+        # A second completion on the same day leaves the streak alone
+        
+        if last is None or last < completed_on:
+            stats.last_completion_date = completed_on
+        stats.total_completions = (stats.total_completions or 0) + 1
+    
+    @staticmethod
+    def get_stats(db: Session, user: User, include_recent_logs: bool = True) -> dict:
         """Get user stats: hydration streak, total completions, recent reminders"""
-        # Get completion logs
-        completion_logs = db.query(ReminderLog).filter(
-            ReminderLog.user_id == user.id,
-            ReminderLog.action == "completed"
-        ).order_by(ReminderLog.timestamp.desc()).limit(100).all()
+        # One primary-key read of the materialized stats row
+        stats = db.get(UserStats, user.id)
         
-        # Calculate hydration streak (consecutive days with at least one completion)
+        # The streak only counts if it runs up to today
         streak = 0
-        if completion_logs:
-            current_date = datetime.now().date()
-            dates_with_completions = set()
-            
-            for log in completion_logs:
-                dates_with_completions.add(log.timestamp.date())
-            
-            # Count consecutive days from today backwards
-            check_date = current_date
-            while check_date in dates_with_completions:
-                streak += 1
-                check_date -= timedelta(days=1)
+        if stats and stats.last_completion_date == datetime.utcnow().date():
+            streak = stats.current_streak
         
         # Get recent activity (last 5 logs)
-        recent_logs = db.query(ReminderLog).filter(
-            ReminderLog.user_id == user.id
-        ).order_by(ReminderLog.timestamp.desc()).limit(5).all()
+        recent_logs = []
+        if include_recent_logs:
+            recent_logs = db.query(ReminderLog).filter(
+                ReminderLog.user_id == user.id
+            ).order_by(ReminderLog.timestamp.desc()).limit(5).all()
         
         return {
-            "total_completions": len(completion_logs),
+            "total_completions": stats.total_completions if stats else 0,
             "hydration_streak_days": streak,
             "recent_logs": recent_logs,
-            "active_reminders_count": len(ReminderService.list_active_reminders(db, user))
+            "active_reminders_count": stats.active_reminders_count if stats else 0
         }
     
+    @staticmethod
+    def rebuild_user_stats(db: Session) -> int:
+        """
+        Recompute every user's stats row from reminders and reminder_logs
+        Used to backfill the table and to repair drift; replaces existing rows
+        
+        Returns:
+            number of stats rows written
+        """
+        completions = dict(db.query(ReminderLog.user_id, func.count(ReminderLog.id)).filter(
+            ReminderLog.action == "completed"
+        ).group_by(ReminderLog.user_id).all())
+        
+        active_counts = dict(db.query(Reminder.user_id, func.count(Reminder.id)).filter(
+            Reminder.is_active
+        ).group_by(Reminder.user_id).all())
+        
+        # Distinct completion days per user, newest first, streamed in one pass
+        days = db.query(ReminderLog.user_id, func.date(ReminderLog.timestamp).label("day")).filter(
+            ReminderLog.action == "completed"
+        ).distinct().order_by(ReminderLog.user_id, func.date(ReminderLog.timestamp).desc())
+        
+        streaks = {}  # user_id -> [last_completion_date, streak, still_counting]
+        for user_id, day in days.yield_per(5000):
+            if isinstance(day, str):
+                day = date.fromisoformat(day)
+            entry = streaks.get(user_id)
+            if entry is None:
+                streaks[user_id] = [day, 1, True]
+            elif entry[2] and day == entry[0] - timedelta(days=entry[1]):
+                entry[1] += 1
+            else:
+                entry[2] = False
+        
+        now = datetime.utcnow()
+        rows = []
+        for user_id in set(completions) | set(active_counts):
+            last_day, streak, _ = streaks.get(user_id, (None, 0, False))
+            rows.append({
+                "user_id": user_id,
+                "total_completions": completions.get(user_id, 0),
+                "current_streak": streak,
+                "last_completion_date": last_day,
+                "active_reminders_count": active_counts.get(user_id, 0),
+                "updated_at": now
+            })
+        
+        db.execute(delete(UserStats))
+        if rows:
+            db.execute(insert(UserStats), rows)
+        db.commit()
+        return len(rows)
+    
     @staticmethod
     def get_due_reminders(db: Session) -> List[Reminder]:
-        """Get all reminders that are due to be sent"""
+        """Get all reminders that are due to be sent, with their users loaded in the same query"""
         now = datetime.now()
-        return db.query(Reminder).filter(
+        return db.query(Reminder).options(
+            joinedload(Reminder.user)
+        ).filter(
             Reminder.is_active,
             Reminder.next_send_at <= now
         ).all()
     
     @staticmethod
-    def mark_reminder_sent(db: Session, reminder: Reminder):
-        """Mark a reminder as sent and update timing"""
+    def get_due_reminder_ids(db: Session) -> List[int]:
+        """Ids of every reminder that is due, whoever has claimed it"""
         now = datetime.now()
-        reminder.last_sent_at = now
+        return [reminder_id for reminder_id, in db.query(Reminder.id).filter(
+            Reminder.is_active,
+            Reminder.next_send_at <= now
+        )]
+    
+    @staticmethod
+    def claim_due_reminders(db: Session, worker_id: Optional[str] = None, limit: Optional[int] = None,
+                            lease_seconds: Optional[int] = None,
+                            shard: Optional[Tuple[int, int]] = None) -> Tuple[str, List[Reminder]]:
+        """
+        Atomically claim up to limit due reminders for this worker
         
-        # Update next_send_at for recurring reminders
-        if reminder.is_recurring:
-            reminder.next_send_at = now + timedelta(minutes=reminder.interval_minutes)
+        A single conditional UPDATE takes every due reminder that is unclaimed
+        or whose lease ran out. On Postgres the candidate subquery uses FOR
+        UPDATE SKIP LOCKED so concurrent workers split the due set instead of
+        queueing on each other; SQLite serializes writers, so the UPDATE's own
+        WHERE clause is enough there.
         
-        # Log the send
-        log = ReminderLog(
-            user_id=reminder.user_id,
-            reminder_id=reminder.id,
-            action="sent",
-            reminder_title=reminder.title
+        shard=(index, count) limits the claim to users with user_id % count == index.
+        
+        Returns:
+            (claim token, claimed reminders with their users loaded)
+        """
+        now = datetime.now()
+        token = f"{worker_id or WORKER_ID}/{uuid.uuid4().hex[:12]}"
+        claimable = (
+            Reminder.is_active,
+            Reminder.next_send_at <= now,
+            or_(Reminder.claimed_by.is_(None), Reminder.claim_expires_at < now)
         )
-        db.add(log)
+        if shard is not None:
+            claimable += (Reminder.user_id % shard[1] == shard[0],)
+        
+        candidates = select(Reminder.id).where(*claimable).order_by(
+            Reminder.next_send_at
+        ).limit(limit or REMINDER_CLAIM_BATCH).with_for_update(skip_locked=True)
+        
+        claimed = db.execute(
+            update(Reminder).where(
+                Reminder.id.in_(candidates.scalar_subquery()),
+                *claimable
+            ).values(
+                claimed_by=token,
+                claim_expires_at=now + timedelta(seconds=lease_seconds or REMINDER_CLAIM_SECONDS)
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        
+        if not claimed:
+            return token, []
+        
+        reminders = db.query(Reminder).options(
+            joinedload(Reminder.user)
+        ).filter(Reminder.claimed_by == token).all()
+        return token, reminders
+    
+    @staticmethod
+    def release_claims(db: Session, token: str, reminder_ids: Optional[List[int]] = None) -> int:
+        """Give claimed reminders back (e.g. after a failed send) so any worker can retry them"""
+        query = update(Reminder).where(Reminder.claimed_by == token)
+        if reminder_ids is not None:
+            if not reminder_ids:
+                return 0
+            query = query.where(Reminder.id.in_(reminder_ids))
+        released = db.execute(
+            query.values(claimed_by=None, claim_expires_at=None).execution_options(synchronize_session=False)
+        ).rowcount
         db.commit()
+        return released
+    
+    @staticmethod
+    def mark_reminder_sent(db: Session, reminder: Reminder):
+        """Mark a reminder as sent and update timing"""
+        ReminderService.mark_reminders_sent(db, [reminder])
+    
+    @staticmethod
+    def mark_reminders_sent(db: Session, reminders: List[Reminder], sent_at: Optional[datetime] = None,
+                            chunk_size: Optional[int] = None, token: Optional[str] = None) -> int:
+        """
+        Mark a batch of reminders as sent
+        Each chunk is one transaction: a bulk UPDATE on reminders plus a bulk INSERT of 'sent' logs
+        With the claim token, reminders another worker has since reclaimed are left alone
+        
+        Returns:
+            number of reminders recorded
+        """
+        return ReminderService._record_dispatched(db, reminders, "sent", sent_at, chunk_size, token)
+    
+    @staticmethod
+    def mark_reminders_queued(db: Session, reminders: List[Reminder], outbox_rows: List[dict],
+                              chunk_size: Optional[int] = None, token: Optional[str] = None) -> int:
+        """
+        Advance the schedules of reminders handed to the outbox
+        outbox_rows (one per reminder) are inserted in the same transaction as their
+        reminder - nothing is logged yet; last_sent_at and the 'sent' log wait for
+        delivery (record_reminders_delivered)
+        
+        Returns:
+            number of reminders recorded
+        """
+        return ReminderService._record_dispatched(db, reminders, "queued", None, chunk_size, token, outbox_rows)
+    
+    @staticmethod
+    def record_reminders_delivered(db: Session, reminder_ids: List[int], delivered_at: Optional[datetime] = None):
+        """
+        Set last_sent_at and log 'sent' for reminders whose outbox message was delivered
+        Runs in the caller's transaction (the outbox commits it with the delivered rows)
+        """
+        if not reminder_ids:
+            return
+        db.execute(
+            update(Reminder).where(Reminder.id.in_(reminder_ids)).values(
+                last_sent_at=delivered_at or datetime.now()
+            ).execution_options(synchronize_session=False)
+        )
+        db.execute(insert(ReminderLog).from_select(
+            ["user_id", "reminder_id", "action", "reminder_title", "timestamp"],
+            select(
+                Reminder.user_id, Reminder.id, literal("sent"), Reminder.title,
+                literal(datetime.utcnow(), DateTime)
+            ).where(Reminder.id.in_(reminder_ids))
+        ))
+    
+    @staticmethod
+    def _record_dispatched(db: Session, reminders: List[Reminder], action: str, sent_at: Optional[datetime],
+                           chunk_size: Optional[int], token: Optional[str],
+                           outbox_rows: Optional[List[dict]] = None) -> int:
+        """Shared bookkeeping for mark_reminders_sent and mark_reminders_queued"""
+        now = sent_at or datetime.now()
+        updates = []
+        logs = []
+        
+        # Read everything up front - committing a chunk expires the remaining objects
+        for reminder in reminders:
+            # Update next_send_at for recurring reminders; a one-time reminder
+            # awaiting 'done' is resent after REMINDER_RETRY_SECONDS, and until
+            # then must not be claimable again
+            if reminder.is_recurring:
+                next_send_at = now + timedelta(minutes=reminder.interval_minutes)
+            else:
+                next_send_at = now + timedelta(seconds=REMINDER_RETRY_SECONDS)
+            
+            # Recording the send also releases the reminder's dispatch claim
+            row = {
+                "id": reminder.id,
+                "next_send_at": next_send_at,
+                "claimed_by": None,
+                "claim_expires_at": None
+            }
+            updates.append(row)
+            # A queued reminder's outbox row is its record until delivery logs it
+            if action == "sent":
+                row["last_sent_at"] = now
+                logs.append({
+                    "user_id": reminder.user_id,
+                    "reminder_id": reminder.id,
+                    "action": action,
+                    "reminder_title": reminder.title
+                })
+        
+        chunk_size = chunk_size or len(updates) or 1
+        recorded = 0
+        
+        for start in range(0, len(updates), chunk_size):
+            chunk = updates[start:start + chunk_size]
+            chunk_logs = logs[start:start + chunk_size]
+            chunk_outbox = outbox_rows[start:start + chunk_size] if outbox_rows else []
+            try:
+                if token is not None:
+                    owned = set(owned_ids(db, Reminder, token, [row["id"] for row in chunk], REMINDER_CLAIM_SECONDS))
+                    if len(owned) < len(chunk):
+                        print(f"⚠️  {len(chunk) - len(owned)} reminder(s) were reclaimed by another worker - not recording them")
+                        keep = [i for i, row in enumerate(chunk) if row["id"] in owned]
+                        chunk = [chunk[i] for i in keep]
+                        chunk_logs = [chunk_logs[i] for i in keep] if chunk_logs else []
+                        chunk_outbox = [chunk_outbox[i] for i in keep] if chunk_outbox else []
+                if chunk:
+                    db.execute(update(Reminder), chunk)
+                    if chunk_logs:
+                        db.execute(insert(ReminderLog), chunk_logs)
+                    if chunk_outbox:
+                        db.execute(insert(OutboxMessage), chunk_outbox)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                print(f"❌ Error recording {len(chunk)} {action} reminder(s): {e}")
+                continue
+            
+            recorded += len(chunk)
+            if chunk:
+                notify_schedule_change([(row["id"], row["next_send_at"]) for row in chunk])
+        
+        return recorded
@@ -0,0 +1,373 @@
+"""
+Retention - Rolls old reminder_logs rows into daily aggregates and purges old inactive reminders
+Works in small batches, each its own short transaction, so it can run while the bot is live
+"""
+
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import case, delete, func, insert, update
+from sqlalchemy.orm import Session
+from models import SessionLocal, Reminder, ReminderArchive, ReminderLog, ReminderLogArchive, ReminderLogRollup
+from reminder_service import _UPSERT_INSERTS
+
+load_dotenv()
+
+# Tunables (override via environment)
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "30"))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "1000"))
+RETENTION_PAUSE_SECONDS = float(os.getenv("RETENTION_PAUSE_SECONDS", "0.05"))
+CLEANUP_INACTIVE_DAYS = int(os.getenv("CLEANUP_INACTIVE_DAYS", "7"))
+
+# 'completed' rows stay raw: streaks and user_stats backfills are built from them
+ROLLUP_ACTIONS = ("sent", "created", "cancelled")
+ARCHIVE_MODES = ("table", "file", "none")
+
+# (user_id, reminder_id, day, action)
+BucketKey = Tuple[int, int, object, str]
+
+
+class RetentionResult:
+    """Counters for one retention run"""
+
+    def __init__(self, cutoff: datetime, dry_run: bool = False):
+        self.cutoff = cutoff
+        self.dry_run = dry_run
+        self.eligible = 0
+        self.rolled_up = 0
+        self.archived = 0
+        self.buckets = 0
+        self.batches = 0
+        self.retries = 0
+        self.duration_seconds = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "cutoff": self.cutoff.isoformat(),
+            "dry_run": self.dry_run,
+            "eligible": self.eligible,
+            "rolled_up": self.rolled_up,
+            "archived": self.archived,
+            "buckets": self.buckets,
+            "batches": self.batches,
+            "retries": self.retries,
+            "duration_seconds": round(self.duration_seconds, 2)
+        }
+
+    def __str__(self) -> str:
+        if self.dry_run:
+            return f"{self.eligible} log rows older than {self.cutoff:%Y-%m-%d} would be rolled up"
+        return (f"{self.rolled_up} log rows rolled into {self.buckets} daily bucket update(s), "
+                f"{self.archived} archived, in {self.batches} batch(es) "
+                f"({self.retries} retried) in {self.duration_seconds:.2f}s")
+
+
+def count_eligible(db: Session, cutoff: datetime, actions: Iterable[str] = ROLLUP_ACTIONS) -> Dict[str, int]:
+    """Count the rows a run would roll up, per action"""
+    return dict(db.query(ReminderLog.action, func.count(ReminderLog.id)).filter(
+        ReminderLog.action.in_(tuple(actions)),
+        ReminderLog.timestamp < cutoff
+    ).group_by(ReminderLog.action).all())
+
+
+def _aggregate(rows: List[dict]) -> Dict[BucketKey, dict]:
+    """Fold raw log rows into daily per-user, per-reminder buckets"""
+    buckets: Dict[BucketKey, dict] = {}
+    for row in rows:
+        key = (row["user_id"], row["reminder_id"] or 0, row["timestamp"].date(), row["action"])
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = {"count": 1, "first_at": row["timestamp"], "last_at": row["timestamp"]}
+        else:
+            bucket["count"] += 1
+            bucket["first_at"] = min(bucket["first_at"], row["timestamp"])
+            bucket["last_at"] = max(bucket["last_at"], row["timestamp"])
+    return buckets
+
+
+def _upsert_rollups(db: Session, buckets: Dict[BucketKey, dict]):
+    """Add bucket counts to reminder_log_rollups, creating rows as needed"""
+    values = [
+        {"user_id": user_id, "reminder_id": reminder_id, "day": day, "action": action, **bucket}
+        for (user_id, reminder_id, day, action), bucket in buckets.items()
+    ]
+    insert_fn = _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+
+    if insert_fn is None:
+        for row in values:
+            rollup = db.query(ReminderLogRollup).filter_by(
+                user_id=row["user_id"], reminder_id=row["reminder_id"], day=row["day"], action=row["action"]
+            ).first()
+            if rollup is None:
+                db.add(ReminderLogRollup(**row))
+            else:
+                rollup.count += row["count"]
+                rollup.first_at = min(rollup.first_at or row["first_at"], row["first_at"])
+                rollup.last_at = max(rollup.last_at or row["last_at"], row["last_at"])
+        db.flush()
+        return
+
+    for start in range(0, len(values), 500):
+        stmt = insert_fn(ReminderLogRollup).values(values[start:start + 500])
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["user_id", "reminder_id", "day", "action"],
+            set_={
+                "count": ReminderLogRollup.count + stmt.excluded.count,
+                "first_at": case(
+                    (stmt.excluded.first_at < ReminderLogRollup.first_at, stmt.excluded.first_at),
+                    else_=ReminderLogRollup.first_at
+                ),
+                "last_at": case(
+                    (stmt.excluded.last_at > ReminderLogRollup.last_at, stmt.excluded.last_at),
+                    else_=ReminderLogRollup.last_at
+                )
+            }
+        ))
+
+
+def _write_archive_file(archive_file, rows: List[dict]):
+    """Append rows as JSON lines and make sure they are on disk before the delete commits"""
+    for row in rows:
+        archive_file.write(json.dumps(row, default=lambda value: value.isoformat()) + "\n")
+    archive_file.flush()
+    os.fsync(archive_file.fileno())
+
+
+def apply_retention(older_than_days: Optional[int] = None, batch_size: Optional[int] = None,
+                    archive: str = "table", archive_path: Optional[str] = None,
+                    actions: Iterable[str] = ROLLUP_ACTIONS, pause: Optional[float] = None,
+                    max_batches: Optional[int] = None, dry_run: bool = False,
+                    session_factory: Callable[[], Session] = SessionLocal) -> RetentionResult:
+    """
+    Roll up and archive reminder_logs rows older than the retention window
+
+    Each batch is one transaction: upsert the daily rollups, copy the raw rows to
+    the archive, delete them from reminder_logs. A batch whose rows changed
+    underneath it (e.g. a concurrent cleanup) is rolled back and retried, so
+    counts are never applied twice.
+
+    Args:
+        older_than_days: keep rows newer than this many days raw
+        archive: 'table' (reminder_logs_archive), 'file' (JSON lines) or 'none'
+        pause: seconds to sleep between batches so live writers get the database
+        max_batches: stop after this many batches (None = until done)
+    """
+    if archive not in ARCHIVE_MODES:
+        raise ValueError(f"archive must be one of {', '.join(ARCHIVE_MODES)}")
+    if archive == "file" and not archive_path:
+        raise ValueError("archive='file' needs an archive_path")
+
+    older_than_days = RETENTION_DAYS if older_than_days is None else older_than_days
+    batch_size = batch_size or RETENTION_BATCH_SIZE
+    pause = RETENTION_PAUSE_SECONDS if pause is None else pause
+    actions = tuple(actions)
+    result = RetentionResult(datetime.utcnow() - timedelta(days=older_than_days), dry_run)
+    started = time.perf_counter()
+
+    db = session_factory()
+    try:
+        result.eligible = sum(count_eligible(db, result.cutoff, actions).values())
+    finally:
+        db.close()
+    if dry_run or not result.eligible:
+        result.duration_seconds = time.perf_counter() - started
+        return result
+
+    archive_file = open(archive_path, "a", encoding="utf-8") if archive == "file" else None
+    last_id = 0
+    try:
+        while max_batches is None or result.batches < max_batches:
+            db = session_factory()
+            try:
+                rows = [dict(row._mapping) for row in db.query(
+                    ReminderLog.id, ReminderLog.user_id, ReminderLog.reminder_id, ReminderLog.action,
+                    ReminderLog.reminder_title, ReminderLog.notes, ReminderLog.timestamp
+                ).filter(
+                    ReminderLog.action.in_(actions),
+                    ReminderLog.timestamp < result.cutoff,
+                    ReminderLog.id > last_id
+                ).order_by(ReminderLog.id).limit(batch_size)]
+                if not rows:
+                    break
+
+                ids = [row["id"] for row in rows]
+                buckets = _aggregate(rows)
+                _upsert_rollups(db, buckets)
+                if archive == "table":
+                    db.execute(insert(ReminderLogArchive), [
+                        {**row, "id": None, "log_id": row["id"]} for row in rows
+                    ])
+
+                deleted = db.execute(delete(ReminderLog).where(ReminderLog.id.in_(ids))).rowcount
+                if deleted != len(ids):
+                    # Someone else removed rows from this batch - start it over
+                    db.rollback()
+                    result.retries += 1
+                    continue
+
+                # Written before the commit: a failed commit can duplicate lines, never lose rows
+                if archive_file:
+                    _write_archive_file(archive_file, rows)
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+
+            last_id = ids[-1]
+            result.batches += 1
+            result.rolled_up += len(rows)
+            result.archived += len(rows) if archive != "none" else 0
+            result.buckets += len(buckets)
+            if pause:
+                time.sleep(pause)
+    finally:
+        if archive_file:
+            archive_file.close()
+
+    result.duration_seconds = time.perf_counter() - started
+    return result
+
+
+class PurgeResult:
+    """Counters for one inactive-reminder cleanup"""
+
+    def __init__(self, cutoff: datetime, dry_run: bool = False):
+        self.cutoff = cutoff
+        self.dry_run = dry_run
+        self.eligible = 0
+        self.eligible_logs = 0
+        self.reminders = 0
+        self.logs_rolled_up = 0
+        self.logs_kept = 0
+        self.archived = 0
+        self.batches = 0
+        self.retries = 0
+        self.duration_seconds = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        if self.duration_seconds <= 0:
+            return 0.0
+        return (self.reminders + self.logs_rolled_up) / self.duration_seconds
+
+    def __str__(self) -> str:
+        if self.dry_run:
+            return (f"{self.eligible} inactive reminder(s) created before {self.cutoff:%Y-%m-%d} "
+                    f"with {self.eligible_logs} log row(s) would be removed")
+        return (f"{self.reminders}/{self.eligible} reminders and {self.logs_rolled_up} log rows removed "
+                f"({self.archived} archived, {self.logs_kept} completions kept) in {self.batches} batch(es) "
+                f"- {self.duration_seconds:.2f}s, {self.rows_per_second:.0f} rows/s")
+
+
+def _inactive_filter(cutoff: datetime):
+    return (Reminder.is_active.is_(False), Reminder.created_at < cutoff)
+
+
+def purge_inactive_reminders(older_than_days: Optional[int] = None, batch_size: Optional[int] = None,
+                             archive: bool = False, pause: Optional[float] = None, dry_run: bool = False,
+                             progress: Optional[Callable[[PurgeResult], None]] = None,
+                             session_factory: Callable[[], Session] = SessionLocal) -> PurgeResult:
+    """
+    Delete (or archive) inactive reminders created more than older_than_days ago
+
+    Each batch is one transaction over at most batch_size reminders: their
+    sent/created/cancelled logs are rolled up and deleted, their completed logs
+    are kept (detached from the reminder) for streaks, then the reminders are
+    deleted with a single statement. With archive=True the raw rows are copied
+    to reminders_archive and reminder_logs_archive first.
+
+    Args:
+        progress: called with the running totals after every batch
+    """
+    older_than_days = CLEANUP_INACTIVE_DAYS if older_than_days is None else older_than_days
+    batch_size = batch_size or RETENTION_BATCH_SIZE
+    pause = RETENTION_PAUSE_SECONDS if pause is None else pause
+    result = PurgeResult(datetime.now() - timedelta(days=older_than_days), dry_run)
+    started = time.perf_counter()
+
+    db = session_factory()
+    try:
+        eligible_ids = db.query(Reminder.id).filter(*_inactive_filter(result.cutoff))
+        result.eligible = eligible_ids.count()
+        if dry_run:
+            result.eligible_logs = db.query(func.count(ReminderLog.id)).filter(
+                ReminderLog.reminder_id.in_(eligible_ids.scalar_subquery())
+            ).scalar()
+    finally:
+        db.close()
+    if dry_run or not result.eligible:
+        result.duration_seconds = time.perf_counter() - started
+        return result
+
+    last_id = 0
+    while True:
+        db = session_factory()
+        try:
+            reminders = [dict(row._mapping) for row in db.query(
+                Reminder.id, Reminder.user_id, Reminder.title, Reminder.interval_minutes,
+                Reminder.scheduled_time, Reminder.is_recurring, Reminder.last_sent_at, Reminder.created_at
+            ).filter(
+                *_inactive_filter(result.cutoff),
+                Reminder.id > last_id
+            ).order_by(Reminder.id).limit(batch_size)]
+            if not reminders:
+                break
+
+            ids = [row["id"] for row in reminders]
+            logs = [dict(row._mapping) for row in db.query(
+                ReminderLog.id, ReminderLog.user_id, ReminderLog.reminder_id, ReminderLog.action,
+                ReminderLog.reminder_title, ReminderLog.notes, ReminderLog.timestamp
+            ).filter(
+                ReminderLog.reminder_id.in_(ids),
+                ReminderLog.action != "completed"
+            )]
+
+            if logs:
+                _upsert_rollups(db, _aggregate(logs))
+            if archive:
+                db.execute(insert(ReminderArchive), [
+                    {**row, "id": None, "reminder_id": row["id"]} for row in reminders
+                ])
+                if logs:
+                    db.execute(insert(ReminderLogArchive), [
+                        {**row, "id": None, "log_id": row["id"]} for row in logs
+                    ])
+
+            if logs:
+                db.execute(delete(ReminderLog).where(ReminderLog.id.in_([row["id"] for row in logs])))
+            # Completions stay behind for streaks and user_stats rebuilds
+            kept = db.execute(
+                update(ReminderLog).where(ReminderLog.reminder_id.in_(ids)).values(reminder_id=None)
+            ).rowcount
+            deleted = db.execute(delete(Reminder).where(Reminder.id.in_(ids), Reminder.is_active.is_(False))).rowcount
+            if deleted != len(ids):
+                # Rows changed underneath this batch - start it over
+                db.rollback()
+                result.retries += 1
+                continue
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        last_id = ids[-1]
+        result.batches += 1
+        result.reminders += len(ids)
+        result.logs_rolled_up += len(logs)
+        result.logs_kept += kept
+        result.archived += len(ids) + len(logs) if archive else 0
+        result.duration_seconds = time.perf_counter() - started
+        if progress:
+            progress(result)
+        if pause:
+            time.sleep(pause)
+
+    result.duration_seconds = time.perf_counter() - started
+    return result
@@ -1,70 +1,261 @@
 """
-Scheduler - APScheduler setup for sending reminders
-Checks for due reminders every minute and sends them
+Scheduler - Timer heap and APScheduler setup for sending reminders
+Fires reminders as soon as they are due and periodically resyncs the heap from the database
+Runs inside the web app by default, or on its own with: python -m scheduler
 """
 
+import os
+import signal
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
-import asyncio
-from models import SessionLocal
-from reminder_service import ReminderService
+from models import Reminder, SessionLocal
+from reminder_service import REMINDER_CLAIM_BATCH, REMINDER_CLAIM_SECONDS, WORKER_ID, ReminderService, add_schedule_listener, remove_schedule_listener
 from messaging_service import MessagingService
+from dispatcher import DispatchEngine, OutboundMessage, TickStats
+from dispatch_pool import DISPATCH_SHARDS, ShardedDispatcher
+from leases import LeaseKeeper
+from outbox import OUTBOX_ENABLED, OUTBOX_POLL_SECONDS, OutboxSender, outbox_row, outbox_stats, queued_reminder_ids
+from metrics import DISPATCH_LAG, DUE_REMINDERS, METRICS_PORT, REMINDERS_DISPATCHED, TICK_DURATION, start_http_server
+from timer_heap import ReminderTimerHeap
+
+# Full rebuild of the timer heap, as a safety net for changes made outside this process
+SCHEDULER_RESYNC_SECONDS = int(os.getenv("SCHEDULER_RESYNC_SECONDS", "300"))
+
+# How often a standalone dispatcher polls for reminders the web workers scheduled
+# in the near future; 0 disables polling and leaves cross-process changes to the
+# resync. A scheduler inside the web app hears about them directly and never polls.
+SCHEDULER_POLL_SECONDS = float(os.getenv("SCHEDULER_POLL_SECONDS", "5"))
+
+# Successful sends are recorded in one transaction per chunk of this many reminders
+DISPATCH_COMMIT_BATCH = int(os.getenv("DISPATCH_COMMIT_BATCH", "1000"))
 
 # Global scheduler instance
 scheduler = None
 messaging_service = MessagingService()
+dispatch_engine = DispatchEngine(messaging_service)
+sharded_dispatcher = ShardedDispatcher() if DISPATCH_SHARDS > 0 else None
+if not OUTBOX_ENABLED:
+    outbox_sender = None
+elif sharded_dispatcher is not None:
+    # Only the workers send, at their share of the rate limits and each for its
+    # own users; this process just decides when retries are due
+    outbox_sender = OutboxSender(SessionLocal, dispatch_engine, drain_fn=lambda db: sharded_dispatcher.drain_outbox())
+else:
+    outbox_sender = OutboxSender(SessionLocal, dispatch_engine)
+last_tick_stats = None
+
+
+def format_reminder_message(reminder) -> str:
+    """Format the outbound text for a due reminder"""
+    return f"⏰ Reminder: {reminder.title}\n\nReply 'done' when complete!"
+
+
+def build_outbound(reminders) -> list:
+    """Turn due reminders (with users eagerly loaded) into outbound messages"""
+    return [
+        OutboundMessage(
+            reminder.id,
+            reminder.user.platform,
+            reminder.user.platform_id,
+            format_reminder_message(reminder)
+        )
+        for reminder in reminders
+    ]
+
+
+def queue_claimed(db, token: str, reminders) -> Tuple[TickStats, List[int]]:
+    """
+    Queue one claimed batch in the outbox and advance the reminders' schedules
+    The outbox sender delivers and retries, so the tick never waits on a platform;
+    last_sent_at and the 'sent' log are written when a message is delivered.
+    A reminder whose last message is still waiting (e.g. backing off through an
+    outage) isn't queued again - it stays due and the timer heap retries it later
+    
+    Returns:
+        (TickStats counting queued reminders as sent, ids of reminders still
+        waiting on a message - a chunk that can't be recorded keeps its claims
+        until the lease expires)
+    """
+    waiting = queued_reminder_ids(db, [reminder.id for reminder in reminders])
+    if waiting:
+        print(f"⏳ {len(waiting)} reminder(s) still have an undelivered message - not queueing them again")
+        reminders = [reminder for reminder in reminders if reminder.id not in waiting]
+    
+    stats = TickStats(due=len(reminders))
+    started = time.perf_counter()
+    rows = [
+        outbox_row("reminder", message.platform, message.recipient, message.text,
+                   user_id=reminder.user_id, reminder_id=reminder.id, due_at=reminder.next_send_at)
+        for reminder, message in zip(reminders, build_outbound(reminders))
+    ]
+    stats.sent = ReminderService.mark_reminders_queued(
+        db, reminders, rows, chunk_size=DISPATCH_COMMIT_BATCH, token=token
+    )
+    stats.failed = stats.due - stats.sent
+    stats.duration_seconds = time.perf_counter() - started
+    return stats, sorted(waiting)
+
+
+def dispatch_claimed(db, token: str, reminders) -> Tuple[TickStats, List[int]]:
+    """
+    Send one claimed batch and record the successes
+    Rate limits can stretch a batch past its lease, so the claim is renewed while sending
+    
+    Returns:
+        (TickStats, ids of reminders that failed to send)
+    """
+    if OUTBOX_ENABLED:
+        return queue_claimed(db, token, reminders)
+    
+    outbound = build_outbound(reminders)
+    
+    # Send everything concurrently on the dispatch loop
+    with LeaseKeeper(db.get_bind(), Reminder, token, REMINDER_CLAIM_SECONDS):
+        results, stats = dispatch_engine.dispatch(outbound)
+    
+    # Bookkeeping stays on this thread - the session is not thread-safe.
+    # Failed sends are left out so their schedule is not advanced.
+    sent = []
+    failed_ids = []
+    delivered_at = datetime.now()
+    for reminder, message in zip(reminders, outbound):
+        if results.get(reminder.id):
+            sent.append(reminder)
+            DISPATCH_LAG.observe(max((delivered_at - reminder.next_send_at).total_seconds(), 0.0))
+        else:
+            failed_ids.append(reminder.id)
+            print(f"❌ Failed to send reminder '{reminder.title}' to {message.recipient}")
+    
+    ReminderService.mark_reminders_sent(db, sent, chunk_size=DISPATCH_COMMIT_BATCH, token=token)
+    return stats, failed_ids
+
+
+def dispatch_due(db, shard: Optional[Tuple[int, int]] = None) -> TickStats:
+    """
+    Claim due reminders batch by batch and send them
+    shard=(index, count) restricts the claims to one hash partition of users
+    """
+    ticks = []
+    failures = []
+    handled = set()
+    while True:
+        token, claimed = ReminderService.claim_due_reminders(db, shard=shard)
+        
+        # A reminder handled earlier in this tick that is due again (e.g. its
+        # bookkeeping failed) waits for the next tick instead of looping here
+        repeats = [reminder.id for reminder in claimed if reminder.id in handled]
+        if repeats:
+            failures.append((token, repeats))
+            claimed = [reminder for reminder in claimed if reminder.id not in handled]
+        if not claimed:
+            break
+        handled.update(reminder.id for reminder in claimed)
+        
+        print(f"📬 Claimed {len(claimed)} due reminder(s)" + (f" for shard {shard[0]}/{shard[1]}" if shard else ""))
+        claimed_at = datetime.now()
+        lags = [max((claimed_at - reminder.next_send_at).total_seconds(), 0.0) for reminder in claimed]
+        stats, failed_ids = dispatch_claimed(db, token, claimed)
+        stats.lag_seconds = lags
+        failures.append((token, failed_ids))
+        ticks.append(stats)
+        print(f"📈 Dispatch tick: {stats}")
+        
+        if len(claimed) < REMINDER_CLAIM_BATCH:
+            break
+    
+    # Released only after the tick so this loop doesn't pick the failures (or
+    # reminders still waiting on the outbox) straight back up; the timer heap
+    # retries them later
+    for token, failed_ids in failures:
+        ReminderService.release_claims(db, token, failed_ids)
+    
+    return TickStats.combine(ticks, parallel=False)
 
 
 def send_due_reminders():
     """
-    Check for due reminders and send them
-    This function is called by the scheduler every minute
+    Claim due reminders and queue them in the outbox (or, with
+    OUTBOX_ENABLED=false, send them directly)
+    Called by the timer heap whenever a deadline passes. Claims are taken in
+    batches, so several scheduler processes can share the due set without
+    sending anything twice. With DISPATCH_SHARDS set, the tick is split by
+    user across a pool of worker processes.
+    
+    Returns:
+        ids of the reminders that were due, including ones other workers hold
     """
+    global last_tick_stats
+    due_ids = []
+    started = time.perf_counter()
     db = SessionLocal()
     try:
-        # Get all due reminders
-        due_reminders = ReminderService.get_due_reminders(db)
+        due_ids = ReminderService.get_due_reminder_ids(db)
+        DUE_REMINDERS.set(len(due_ids))
+        if not due_ids:
+            return due_ids
         
-        if due_reminders:
-            print(f"📬 Found {len(due_reminders)} due reminder(s)")
+        if sharded_dispatcher is not None:
+            stats = sharded_dispatcher.dispatch()
+        else:
+            stats = dispatch_due(db)
         
-        # Send each reminder
-        for reminder in due_reminders:
-            try:
-                # Get user info
-                user = reminder.user
-                
-                # Format reminder message
-                message = f"⏰ Reminder: {reminder.title}\n\nReply 'done' when complete!"
-                
-                # Send message (handle async)
-                success = asyncio.run(
-                    messaging_service.send_message(
-                        user.platform,
-                        user.platform_id,
-                        message
-                    )
-                )
-                
-                if success:
-                    # Mark as sent and update timing
-                    ReminderService.mark_reminder_sent(db, reminder)
-                    print(f"✅ Sent reminder '{reminder.title}' to {user.platform_id}")
-                else:
-                    print(f"❌ Failed to send reminder '{reminder.title}' to {user.platform_id}")
-            
-            except Exception as e:
-                print(f"❌ Error sending reminder {reminder.id}: {e}")
+        REMINDERS_DISPATCHED.inc(stats.sent, result="sent")
+        REMINDERS_DISPATCHED.inc(stats.failed, result="failed")
+        if stats.due:
+            last_tick_stats = stats
+            if sharded_dispatcher is not None:
+                print(f"📈 Sharded tick ({sharded_dispatcher.shards} workers): {stats}")
+        # Sharded workers already delivered what their tick queued
+        if outbox_sender is not None and sharded_dispatcher is None:
+            outbox_sender.notify()
     
     except Exception as e:
         print(f"❌ Error in send_due_reminders: {e}")
     
     finally:
         db.close()
+        TICK_DURATION.observe(time.perf_counter() - started)
+    
+    return due_ids
+
 
+timer_heap = ReminderTimerHeap(fire_callback=lambda due_ids: send_due_reminders())
 
-def start_scheduler():
-    """Start the background scheduler"""
+
+def resync_timer_heap():
+    """Rebuild the timer heap from the reminders table"""
+    db = SessionLocal()
+    try:
+        return timer_heap.load(db)
+    except Exception as e:
+        print(f"❌ Error loading reminders into timer heap: {e}")
+        return 0
+    finally:
+        db.close()
+
+
+def poll_timer_heap():
+    """Merge reminders due soon that were scheduled outside this process"""
+    db = SessionLocal()
+    try:
+        return timer_heap.merge_upcoming(db, SCHEDULER_POLL_SECONDS * 2)
+    except Exception as e:
+        print(f"❌ Error polling upcoming reminders: {e}")
+        return 0
+    finally:
+        db.close()
+
+
+def start_scheduler(standalone: bool = False):
+    """
+    Start the background scheduler
+    standalone: running apart from the web app (see run_dispatcher), so reminders
+    are scheduled in other processes and have to be polled for
+    """
     global scheduler
     
     if scheduler is not None:
@@ -73,17 +264,37 @@ def start_scheduler():
     
     scheduler = BackgroundScheduler()
     
-    # Add job to check for due reminders every minute
+    # Periodically rebuild the heap in case reminders changed elsewhere
     scheduler.add_job(
-        func=send_due_reminders,
-        trigger=IntervalTrigger(seconds=60),
-        id="send_reminders",
-        name="Check and send due reminders",
-        replace_existing=True
+        func=resync_timer_heap,
+        trigger=IntervalTrigger(seconds=SCHEDULER_RESYNC_SECONDS),
+        id="resync_reminders",
+        name="Rebuild reminder timer heap",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
     )
     
+    if standalone and SCHEDULER_POLL_SECONDS > 0:
+        scheduler.add_job(
+            func=poll_timer_heap,
+            trigger=IntervalTrigger(seconds=SCHEDULER_POLL_SECONDS),
+            id="poll_reminders",
+            name="Merge reminders scheduled by other processes",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True
+        )
+    
+    # Listen before loading so changes made during the load aren't lost
+    add_schedule_listener(timer_heap.apply_changes)
+    loaded = resync_timer_heap()
+    timer_heap.start()
+    if outbox_sender is not None:
+        outbox_sender.start(poll_seconds=OUTBOX_POLL_SECONDS if standalone else 0)
+    
     scheduler.start()
-    print("⏰ Scheduler started - checking for reminders every minute")
+    print(f"⏰ Scheduler started - {loaded} reminder(s) loaded into the timer heap")
 
 
 def stop_scheduler():
@@ -93,6 +304,13 @@ def stop_scheduler():
     if scheduler is not None:
         scheduler.shutdown()
         scheduler = None
+        remove_schedule_listener(timer_heap.apply_changes)
+        timer_heap.stop()
+        if outbox_sender is not None:
+            outbox_sender.stop()
+        dispatch_engine.stop()
+        if sharded_dispatcher is not None:
+            sharded_dispatcher.stop()
         print("⏹️  Scheduler stopped")
 
 
@@ -111,7 +329,64 @@ def get_scheduler_status() -> dict:
             "next_run": job.next_run_time.isoformat() if job.next_run_time else None
         })
     
+    next_deadline = timer_heap.next_deadline
+    
     return {
         "status": "running",
-        "jobs": jobs
+        "jobs": jobs,
+        "timer_heap": {
+            "size": len(timer_heap),
+            "next_deadline": next_deadline.isoformat() if next_deadline else None
+        },
+        "last_tick": last_tick_stats.as_dict() if last_tick_stats else None,
+        "outbox": outbox_status(),
+        "rate_limits": messaging_service.rate_limiter.stats(),
+        "messaging": messaging_service.stats()
     }
+
+
+def notify_outbox():
+    """Have the outbox sender look at the queue again (e.g. after a failed inline reply)"""
+    if outbox_sender is not None:
+        outbox_sender.notify()
+
+
+def outbox_status() -> Optional[dict]:
+    """Outbox queue depth and the sender's last drain"""
+    if outbox_sender is None:
+        return None
+    db = SessionLocal()
+    try:
+        status = outbox_stats(db)
+    finally:
+        db.close()
+    status["last_drain"] = outbox_sender.last_stats.as_dict() if outbox_sender.last_stats else None
+    status["next_due_at"] = outbox_sender.next_due_at.isoformat() if outbox_sender.next_due_at else None
+    return status
+
+
+def run_dispatcher():
+    """
+    Run the scheduler as a standalone dispatcher process, without the web app
+    Blocks until SIGINT/SIGTERM, then stops cleanly
+    """
+    from models import init_db
+    
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+    
+    print(f"🚚 Starting dispatcher {WORKER_ID}...")
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+    init_db()
+    start_scheduler(standalone=True)
+    try:
+        stop.wait()
+    finally:
+        stop_scheduler()
+    print("👋 Dispatcher stopped")
+
+
+if __name__ == "__main__":
+    run_dispatcher()
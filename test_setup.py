@@ -4,6 +4,8 @@ Run this after setup to check if everything is configured correctly
 """
 
 import os
+import subprocess
+import sys
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -83,6 +85,27 @@ try:
 except Exception as e:
     print(f"❌ Command parsing error: {e}")
 
+# Regression checks - each script uses its own throwaway database
+print("\n🔁 Running regression checks...")
+BENCHMARKS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+REGRESSION_CHECKS = [
+    ("Query counts stay constant as rows grow", ["check_query_counts.py"]),
+    ("Command parser matches the original parser", ["bench_parser.py", "--messages", "2000", "--rounds", "1"]),
+]
+failed_checks = []
+for label, command in REGRESSION_CHECKS:
+    result = subprocess.run([sys.executable, *command], cwd=BENCHMARKS_DIR, capture_output=True, text=True)
+    if result.returncode == 0:
+        print(f"✅ {label}")
+    else:
+        failed_checks.append(label)
+        print(f"❌ {label}:")
+        print(result.stdout + result.stderr)
+
+if failed_checks:
+    print(f"\n❌ {len(failed_checks)} regression check(s) failed")
+    sys.exit(1)
+
 print("\n" + "=" * 50)
 print("\n✅ Configuration test complete!")
 print("\nNext steps:")
@@ -0,0 +1,209 @@
+"""
+Timer Heap - In-memory min-heap of reminder deadlines
+Sleeps until the earliest next_send_at and wakes immediately when the schedule changes
+"""
+
+import heapq
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from models import Reminder
+
+load_dotenv()
+
+# How long to wait before re-firing a reminder that is still due after a
+# dispatch (failed send, or a one-time reminder awaiting 'done')
+REMINDER_RETRY_SECONDS = int(os.getenv("REMINDER_RETRY_SECONDS", "60"))
+
+
+class ReminderTimerHeap:
+    """
+    Deadline scheduler for reminders
+
+    Entries are (next_send_at, reminder_id) tuples. Updates never remove
+    entries from the heap; instead the authoritative deadline for each
+    reminder lives in a dict and stale heap entries are skipped when popped.
+
+    fire_callback(due_ids) is invoked from the heap thread whenever one or
+    more deadlines pass. It must return the ids it found due in the database,
+    so reminders that are still due afterwards can be retried later.
+    """
+
+    def __init__(self, fire_callback: Callable[[List[int]], Iterable[int]],
+                 retry_seconds: Optional[int] = None):
+        self.fire_callback = fire_callback
+        self.retry_seconds = retry_seconds or REMINDER_RETRY_SECONDS
+        self._heap: List[Tuple[datetime, int]] = []
+        self._deadlines: Dict[int, datetime] = {}
+        self._pending: Optional[Dict[int, Optional[datetime]]] = None
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self.fire_count = 0
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    @property
+    def next_deadline(self) -> Optional[datetime]:
+        with self._cond:
+            self._discard_stale()
+            return self._heap[0][0] if self._heap else None
+
+    # Schedule maintenance
+
+    def load(self, db: Session):
+        """Rebuild the heap from the active reminders in the database"""
+        with self._cond:
+            # Capture changes that land while the snapshot is being read
+            self._pending = {}
+
+        try:
+            rows = db.query(Reminder.id, Reminder.next_send_at).filter(
+                Reminder.is_active,
+                Reminder.next_send_at.is_not(None)
+            ).all()
+        except Exception:
+            with self._cond:
+                self._pending = None
+            raise
+
+        deadlines = {reminder_id: next_send_at for reminder_id, next_send_at in rows}
+        with self._cond:
+            for reminder_id, deadline in self._pending.items():
+                if deadline is None:
+                    deadlines.pop(reminder_id, None)
+                else:
+                    deadlines[reminder_id] = deadline
+            self._pending = None
+            self._deadlines = deadlines
+            self._heap = [(deadline, reminder_id) for reminder_id, deadline in deadlines.items()]
+            heapq.heapify(self._heap)
+            self._cond.notify()
+
+        return len(deadlines)
+
+    def merge_upcoming(self, db: Session, horizon_seconds: float) -> int:
+        """
+        Pick up reminders due within the next horizon_seconds that other
+        processes created or rescheduled; cheap enough to run every few seconds
+
+        Overdue reminders are left to the retry path and the full resync, so
+        a reminder awaiting 'done' isn't re-fired on every poll.
+
+        Returns:
+            number of deadlines added or moved
+        """
+        now = datetime.now()
+        rows = db.query(Reminder.id, Reminder.next_send_at).filter(
+            Reminder.is_active,
+            Reminder.next_send_at > now,
+            Reminder.next_send_at <= now + timedelta(seconds=horizon_seconds)
+        ).all()
+
+        with self._cond:
+            changes = [(reminder_id, deadline) for reminder_id, deadline in rows
+                       if self._deadlines.get(reminder_id) != deadline]
+        if changes:
+            self.apply_changes(changes)
+        return len(changes)
+
+    def schedule(self, reminder_id: int, deadline: Optional[datetime]):
+        """Set (or with None, clear) the deadline for one reminder"""
+        self.apply_changes([(reminder_id, deadline)])
+
+    def apply_changes(self, changes: List[Tuple[int, Optional[datetime]]]):
+        """Schedule listener - apply committed changes and wake the heap thread"""
+        with self._cond:
+            for reminder_id, deadline in changes:
+                if self._pending is not None:
+                    self._pending[reminder_id] = deadline
+                if deadline is None:
+                    self._deadlines.pop(reminder_id, None)
+                    continue
+                self._deadlines[reminder_id] = deadline
+                heapq.heappush(self._heap, (deadline, reminder_id))
+
+            # Compact once stale entries dominate the heap
+            if len(self._heap) > 2 * len(self._deadlines) + 1024:
+                self._heap = [(deadline, reminder_id) for reminder_id, deadline in self._deadlines.items()]
+                heapq.heapify(self._heap)
+
+            self._cond.notify()
+
+    # Heap thread
+
+    def start(self):
+        """Start the heap thread"""
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="reminder-timer-heap", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the heap thread"""
+        if self._thread is None:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join(timeout=10)
+        self._thread = None
+
+    def _discard_stale(self):
+        """Drop heap entries that no longer match the reminder's deadline"""
+        while self._heap:
+            deadline, reminder_id = self._heap[0]
+            if self._deadlines.get(reminder_id) == deadline:
+                return
+            heapq.heappop(self._heap)
+
+    def _wait_for_due(self) -> List[int]:
+        """Block until at least one deadline passes; return the due ids"""
+        with self._cond:
+            while not self._stopping:
+                self._discard_stale()
+                now = datetime.now()
+                if self._heap and self._heap[0][0] <= now:
+                    due = []
+                    while self._heap and self._heap[0][0] <= now:
+                        deadline, reminder_id = heapq.heappop(self._heap)
+                        if self._deadlines.get(reminder_id) == deadline:
+                            del self._deadlines[reminder_id]
+                            due.append(reminder_id)
+                    if due:
+                        return due
+                    continue
+
+                timeout = (self._heap[0][0] - now).total_seconds() if self._heap else None
+                self._cond.wait(timeout)
+            return []
+
+    def _run(self):
+        while True:
+            due_ids = self._wait_for_due()
+            if self._stopping:
+                return
+
+            fired_at = datetime.now()
+            try:
+                still_due = set(self.fire_callback(due_ids) or ())
+            except Exception as e:
+                print(f"❌ Error firing reminders: {e}")
+                still_due = set(due_ids)
+            self.fire_count += 1
+
+            # Anything the dispatch didn't move forward gets retried later;
+            # popped ids the database no longer considers due are dropped
+            retry_at = datetime.now() + timedelta(seconds=self.retry_seconds)
+            with self._cond:
+                retries = [
+                    (reminder_id, retry_at) for reminder_id in still_due
+                    if self._deadlines.get(reminder_id, fired_at) <= fired_at
+                ]
+            self.apply_changes(retries)
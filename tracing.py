@@ -0,0 +1,203 @@
+"""
+Tracing - Lightweight per-request span timings for the webhook pipeline
+Spans nest through a context variable; finished traces are written as JSON lines, either all of them or only slow ones
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime
+from typing import List, Optional
+from dotenv import load_dotenv
+from sqlalchemy import event
+
+from metrics import registry
+
+load_dotenv()
+
+# off: spans cost one context-variable lookup; slow: record everything, write
+# traces over TRACE_SLOW_MS; all: write every trace
+TRACE_MODE = os.getenv("TRACE_MODE", "off").lower()
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "500"))
+# JSON lines destination (default: stdout)
+TRACE_LOG_FILE = os.getenv("TRACE_LOG_FILE", "")
+
+TRACE_MODES = ("off", "slow", "all")
+
+STAGE_DURATION = registry.histogram(
+    "hydrabot_stage_seconds",
+    "Duration of traced pipeline stages (only while TRACE_MODE is not off)",
+    ["stage"]
+)
+
+
+class Span:
+    __slots__ = ("name", "depth", "started", "duration_ms", "queries", "attrs")
+
+    def __init__(self, name: str, depth: int, attrs: dict):
+        self.name = name
+        self.depth = depth
+        self.attrs = attrs
+        self.queries = 0
+        self.duration_ms = 0.0
+        self.started = time.perf_counter()
+
+
+class Trace:
+    """One request's spans, in the order they started"""
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.attrs = attrs
+        self.spans: List[Span] = []
+        self.open: List[Span] = []
+        self.queries = 0
+        self.error: Optional[str] = None
+        self.started_at = datetime.utcnow()
+        self.started = time.perf_counter()
+        self.duration_ms = 0.0
+
+    def as_record(self) -> dict:
+        return {
+            "trace": self.name,
+            "trace_id": self.trace_id,
+            "at": self.started_at.isoformat(timespec="milliseconds") + "Z",
+            "duration_ms": round(self.duration_ms, 3),
+            "slow": self.duration_ms >= TRACE_SLOW_MS,
+            "queries": self.queries,
+            "error": self.error,
+            **self.attrs,
+            "spans": [
+                {
+                    "name": s.name,
+                    "depth": s.depth,
+                    "start_ms": round((s.started - self.started) * 1000, 3),
+                    "duration_ms": round(s.duration_ms, 3),
+                    "queries": s.queries,
+                    **s.attrs
+                }
+                for s in self.spans
+            ]
+        }
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("hydrabot_trace", default=None)
+_write_lock = threading.Lock()
+
+
+class _Noop:
+    """Shared stand-in for trace()/span() when nothing is being recorded"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _Noop()
+
+
+class _TraceContext:
+    __slots__ = ("trace", "token")
+
+    def __init__(self, name: str, attrs: dict):
+        self.trace = Trace(name, attrs)
+        self.token = None
+
+    def __enter__(self) -> Trace:
+        self.token = _current.set(self.trace)
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        trace = self.trace
+        trace.duration_ms = (time.perf_counter() - trace.started) * 1000
+        if exc_type is not None:
+            trace.error = exc_type.__name__
+        _current.reset(self.token)
+        if TRACE_MODE == "all" or trace.duration_ms >= TRACE_SLOW_MS:
+            _write(trace.as_record())
+        return False
+
+
+class _SpanContext:
+    __slots__ = ("trace", "span")
+
+    def __init__(self, trace: Trace, name: str, attrs: dict):
+        self.trace = trace
+        self.span = Span(name, len(trace.open), attrs)
+
+    def __enter__(self) -> Span:
+        self.trace.spans.append(self.span)
+        self.trace.open.append(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        span = self.span
+        span.duration_ms = (time.perf_counter() - span.started) * 1000
+        if exc_type is not None:
+            span.attrs["error"] = exc_type.__name__
+        self.trace.open.remove(span)
+        STAGE_DURATION.observe(span.duration_ms / 1000, stage=span.name)
+        return False
+
+
+def trace(name: str, **attrs):
+    """
+    Start a trace for one request (no-op while TRACE_MODE=off)
+
+    Usage:
+        with trace("webhook.twilio", platform="twilio"):
+            with span("user.get_or_create"):
+                ...
+    """
+    if TRACE_MODE == "off":
+        return _NOOP
+    return _TraceContext(name, attrs)
+
+
+def span(name: str, **attrs):
+    """Time a stage of the current trace (no-op outside a trace)"""
+    current = _current.get()
+    if current is None:
+        return _NOOP
+    return _SpanContext(current, name, attrs)
+
+
+def annotate(**attrs):
+    """Attach attributes (e.g. the parsed command) to the current trace"""
+    current = _current.get()
+    if current is not None:
+        current.attrs.update(attrs)
+
+
+def _write(record: dict):
+    line = json.dumps(record, default=str)
+    with _write_lock:
+        if TRACE_LOG_FILE:
+            with open(TRACE_LOG_FILE, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        else:
+            print(line, flush=True)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    current = _current.get()
+    if current is not None:
+        current.queries += 1
+        if current.open:
+            current.open[-1].queries += 1
+
+
+def instrument_engine(engine):
+    """Count SQL statements per trace and span on this (sync) engine, if tracing is on"""
+    if TRACE_MODE not in TRACE_MODES:
+        raise ValueError(f"Unknown TRACE_MODE {TRACE_MODE!r} (choose from {', '.join(TRACE_MODES)})")
+    if TRACE_MODE != "off" and not event.contains(engine, "before_cursor_execute", _count_query):
+        event.listen(engine, "before_cursor_execute", _count_query)
@@ -0,0 +1,134 @@
+"""
+Update Dedup - Drops Telegram webhook retries by update_id
+Keeps a TTL-bounded seen-set in memory, optionally backed by a shared table for multi-worker deployments
+"""
+
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+from dotenv import load_dotenv
+from sqlalchemy import delete, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import AsyncSessionLocal, ProcessedUpdate
+from reminder_service import _UPSERT_INSERTS
+from ttl_cache import TTLCache
+
+load_dotenv()
+
+# Telegram keeps retrying an unacknowledged update for up to a day, but
+# retries caused by a slow response arrive within minutes
+TELEGRAM_DEDUP_TTL_SECONDS = float(os.getenv("TELEGRAM_DEDUP_TTL_SECONDS", "3600"))
+TELEGRAM_DEDUP_MAX_SIZE = int(os.getenv("TELEGRAM_DEDUP_MAX_SIZE", "100000"))
+# 'memory' (per worker) or 'database' (shared by every worker via processed_updates)
+TELEGRAM_DEDUP_BACKEND = os.getenv("TELEGRAM_DEDUP_BACKEND", "memory").lower()
+# Expired processed_updates rows are deleted once every this many new updates
+TELEGRAM_DEDUP_PRUNE_EVERY = int(os.getenv("TELEGRAM_DEDUP_PRUNE_EVERY", "1000"))
+
+DEDUP_BACKENDS = ("memory", "database")
+
+
+def _claim_update_id(db: Session, update_id: int) -> bool:
+    """Insert the update_id into processed_updates; False if it was already there"""
+    insert_fn = _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+    values = {"update_id": update_id, "received_at": datetime.utcnow()}
+    try:
+        if insert_fn is not None:
+            inserted = db.execute(insert_fn(ProcessedUpdate).values(**values).on_conflict_do_nothing()).rowcount
+        else:
+            inserted = db.execute(insert(ProcessedUpdate).values(**values)).rowcount
+        db.commit()
+        return inserted == 1
+    except IntegrityError:
+        db.rollback()
+        return False
+
+
+def prune_processed_updates(db: Session, ttl_seconds: Optional[float] = None) -> int:
+    """Delete processed_updates rows older than the dedup window"""
+    cutoff = datetime.utcnow() - timedelta(seconds=ttl_seconds or TELEGRAM_DEDUP_TTL_SECONDS)
+    deleted = db.execute(delete(ProcessedUpdate).where(ProcessedUpdate.received_at < cutoff)).rowcount
+    db.commit()
+    return deleted
+
+
+class UpdateDeduplicator:
+    """
+    Seen-set of recent Telegram update_ids
+
+    The in-memory set answers repeats within this worker without a query.
+    With the database backend, new ids are also inserted into
+    processed_updates, so a retry that lands on another worker is caught too.
+    Errors fail open: an update that can't be checked is processed.
+    """
+
+    def __init__(self, ttl: Optional[float] = None, maxsize: Optional[int] = None,
+                 backend: Optional[str] = None):
+        self.backend = backend or TELEGRAM_DEDUP_BACKEND
+        if self.backend not in DEDUP_BACKENDS:
+            raise ValueError(f"Unknown TELEGRAM_DEDUP_BACKEND {self.backend!r} "
+                             f"(choose from {', '.join(DEDUP_BACKENDS)})")
+        self.ttl = ttl or TELEGRAM_DEDUP_TTL_SECONDS
+        self.seen = TTLCache(maxsize=maxsize or TELEGRAM_DEDUP_MAX_SIZE, ttl=self.ttl)
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.duplicates_memory = 0
+        self.duplicates_database = 0
+        self.errors = 0
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    async def is_duplicate(self, update_id) -> bool:
+        """Record the update_id and report whether it was seen before"""
+        self._count("checked")
+        if not self.seen.add_if_absent(update_id):
+            self._count("duplicates_memory")
+            return True
+        if self.backend != "database":
+            return False
+
+        try:
+            async with AsyncSessionLocal() as db:
+                claimed = await db.run_sync(_claim_update_id, update_id)
+                if claimed and self.checked % TELEGRAM_DEDUP_PRUNE_EVERY == 0:
+                    await db.run_sync(prune_processed_updates, self.ttl)
+        except Exception as e:
+            self._count("errors")
+            print(f"❌ Error checking Telegram update {update_id}: {e}")
+            return False
+
+        if not claimed:
+            self._count("duplicates_database")
+        return not claimed
+
+    async def forget(self, update_id):
+        """Un-see an update_id that was refused, so Telegram's retry gets processed"""
+        self.seen.pop(update_id)
+        if self.backend != "database":
+            return
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(delete(ProcessedUpdate).where(ProcessedUpdate.update_id == update_id))
+                await db.commit()
+        except Exception as e:
+            self._count("errors")
+            print(f"❌ Error forgetting Telegram update {update_id}: {e}")
+
+    @property
+    def duplicates_dropped(self) -> int:
+        return self.duplicates_memory + self.duplicates_database
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "checked": self.checked,
+            "duplicates_dropped": self.duplicates_dropped,
+            "duplicates_memory": self.duplicates_memory,
+            "duplicates_database": self.duplicates_database,
+            "errors": self.errors,
+            "seen_size": len(self.seen)
+        }